@@ -0,0 +1,69 @@
+# app_state.py
+import os
+import json
+import time
+import logging
+import threading
+
+
+class AppState:
+    """
+    Last-known position and weather, kept in a small JSON file (state.json in
+    the data directory) so the next start can use them right away instead of
+    waiting on the network. Every update rewrites the file atomically.
+    """
+
+    def __init__(self, path):
+        self.logger = logging.getLogger(__name__)
+        self.path = path
+        self._lock = threading.Lock()
+        self._data = self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, 'r') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return {}
+        except ValueError:
+            self.logger.warning(f"Ignoring unreadable {self.path}")
+            return {}
+        return data if isinstance(data, dict) else {}
+
+    def _save(self):
+        tmp_path = self.path + ".tmp"
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(self._data, f, indent=4)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            self.logger.warning(f"Could not save {self.path}: {e}")
+
+    def position(self):
+        """
+        Returns:
+            tuple: (latitude, longitude, time saved) or (None, None, None) if no position was saved.
+        """
+        position = self._data.get("position") or {}
+        latitude, longitude = position.get("latitude"), position.get("longitude")
+        if not isinstance(latitude, (int, float)) or not isinstance(longitude, (int, float)):
+            return None, None, None
+        return latitude, longitude, position.get("time")
+
+    def weather(self):
+        """
+        Returns:
+            tuple: (weather dict, time saved) or (None, None) if no weather was saved.
+        """
+        weather = self._data.get("weather") or {}
+        return weather.get("data"), weather.get("time")
+
+    def save_position(self, latitude, longitude):
+        with self._lock:
+            self._data["position"] = {"latitude": latitude, "longitude": longitude, "time": time.time()}
+            self._save()
+
+    def save_weather(self, weather):
+        with self._lock:
+            self._data["weather"] = {"data": weather, "time": time.time()}
+            self._save()
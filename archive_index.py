@@ -0,0 +1,263 @@
+# archive_index.py
+"""
+Indexes the weather_videos_<timestamp>.json archives written by "Save Data"
+and queries them without loading them into memory.
+
+    python archive_index.py --since 2024-05-01 --min-rain 2 --near 18.52,73.85,5000
+    python archive_index.py --description fog --max-visibility 1000
+    python archive_index.py --reindex
+
+Matching records are printed as JSON lines. The index is a SQLite database
+next to the archives; each run first indexes archives that are new or have
+changed since the last run.
+"""
+import os
+import sys
+import json
+import glob
+import math
+import sqlite3
+import logging
+import argparse
+
+from geo_utils import haversine_distance, EARTH_RADIUS
+
+from config import ARCHIVE_GRID_DEGREES
+
+ARCHIVE_PATTERN = "weather_videos_*.json"
+INSERT_BATCH = 1000
+
+logger = logging.getLogger(__name__)
+
+
+def iter_json_array(path, chunk_size=1 << 16):
+    """
+    Yields the elements of a JSON array file one at a time. Memory use is
+    bounded by chunk_size plus the largest element, not the file size.
+    """
+    decoder = json.JSONDecoder()
+    with open(path, 'r') as f:
+        buffer = f.read(chunk_size).lstrip()
+        if not buffer.startswith("["):
+            raise ValueError(f"{path} is not a JSON array")
+        buffer = buffer[1:]
+        eof = False
+        while True:
+            buffer = buffer.lstrip().lstrip(",").lstrip()
+            if buffer.startswith("]"):
+                return
+            try:
+                element, end = decoder.raw_decode(buffer)
+            except ValueError:
+                if eof:
+                    raise ValueError(f"{path} ends inside an element")
+                more = f.read(chunk_size)
+                eof = not more
+                buffer += more
+                continue
+            yield element
+            buffer = buffer[end:]
+
+
+def _number(value):
+    # Weather fields are "N/A" (or None) when the API left them out
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class ArchiveIndex:
+    """
+    Persistent SQLite index over the metadata archives.
+
+    Each record is stored once with indexed columns for its timestamp, its
+    grid cell (latitude and longitude floored to ARCHIVE_GRID_DEGREES) and
+    the rain, snow, visibility and description weather fields. Archives are
+    tracked by size and modification time, so update() only parses files
+    that are new or changed, and streams them element by element.
+    """
+
+    def __init__(self, data_directory="AutoVision", index_path=None, grid_degrees=ARCHIVE_GRID_DEGREES):
+        self.data_directory = data_directory
+        self.grid_degrees = grid_degrees
+        self.index_path = index_path or os.path.join(data_directory, "archive_index.db")
+        self._conn = sqlite3.connect(self.index_path)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS archives ("
+                "path TEXT PRIMARY KEY, size INTEGER, mtime REAL, records INTEGER)"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS records ("
+                "archive TEXT, timestamp TEXT, video_path TEXT, "
+                "latitude REAL, longitude REAL, lat_cell INTEGER, lon_cell INTEGER, "
+                "rain REAL, snow REAL, visibility REAL, description TEXT, record TEXT)"
+            )
+            for column in ("archive", "timestamp", "rain", "snow", "visibility", "description"):
+                self._conn.execute(f"CREATE INDEX IF NOT EXISTS idx_records_{column} ON records ({column})")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_records_cell ON records (lat_cell, lon_cell)")
+
+    def update(self):
+        """
+        Indexes new and changed archives and forgets deleted ones.
+        Returns:
+            int: Number of archives (re)indexed.
+        """
+        known = {path: (size, mtime) for path, size, mtime in
+                 self._conn.execute("SELECT path, size, mtime FROM archives")}
+        indexed = 0
+        paths = sorted(glob.glob(os.path.join(self.data_directory, ARCHIVE_PATTERN)))
+        for path in paths:
+            stat = os.stat(path)
+            if known.get(path) == (stat.st_size, stat.st_mtime):
+                continue
+            try:
+                self._index_archive(path, stat)
+                indexed += 1
+            except ValueError as e:
+                logger.error(f"Skipping archive {path}: {e}")
+        for path in set(known) - set(paths):
+            with self._conn:
+                self._forget(path)
+        return indexed
+
+    def _forget(self, path):
+        self._conn.execute("DELETE FROM records WHERE archive = ?", (path,))
+        self._conn.execute("DELETE FROM archives WHERE path = ?", (path,))
+
+    def _index_archive(self, path, stat):
+        # One transaction per archive, so an interrupted run leaves it unindexed rather than half indexed
+        count = 0
+        with self._conn:
+            self._forget(path)
+            batch = []
+            for record in iter_json_array(path):
+                batch.append(self._row(path, record))
+                if len(batch) >= INSERT_BATCH:
+                    self._insert(batch)
+                    count += len(batch)
+                    batch = []
+            self._insert(batch)
+            count += len(batch)
+            self._conn.execute("INSERT INTO archives (path, size, mtime, records) VALUES (?, ?, ?, ?)",
+                               (path, stat.st_size, stat.st_mtime, count))
+        logger.info(f"Indexed {count} records from {os.path.basename(path)}")
+
+    def _insert(self, rows):
+        self._conn.executemany("INSERT INTO records VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+
+    def _row(self, path, record):
+        weather = record.get("weather") or {}
+        latitude, longitude = _number(weather.get("latitude")), _number(weather.get("longitude"))
+        lat_cell = math.floor(latitude / self.grid_degrees) if latitude is not None else None
+        lon_cell = math.floor(longitude / self.grid_degrees) if longitude is not None else None
+        description = weather.get("weather_description")
+        return (path, record.get("timestamp"), record.get("video_path"), latitude, longitude, lat_cell, lon_cell,
+                _number(weather.get("rain")), _number(weather.get("snow")), _number(weather.get("visibility")),
+                description.lower() if isinstance(description, str) else None, json.dumps(record))
+
+    def query(self, since=None, until=None, near=None, min_rain=None, min_snow=None, max_visibility=None,
+              description=None):
+        """
+        Streams the records matching every given condition, oldest first.
+        Parameters:
+            since, until (str): Timestamp bounds, "YYYY-MM-DD" or "YYYY-MM-DDTHH:MM:SS".
+            near (tuple): (latitude, longitude, radius in meters).
+            description (str): Substring of the weather description, e.g. "rain" or "fog".
+        Returns:
+            iterator: Matching records as dicts.
+        """
+        conditions, params = [], []
+        if since:
+            conditions.append("timestamp >= ?")
+            params.append(since)
+        if until:
+            # A bare date includes the whole day
+            conditions.append("timestamp <= ?")
+            params.append(until + "T23:59:59" if len(until) == 10 else until)
+        if min_rain is not None:
+            conditions.append("rain >= ?")
+            params.append(min_rain)
+        if min_snow is not None:
+            conditions.append("snow >= ?")
+            params.append(min_snow)
+        if max_visibility is not None:
+            conditions.append("visibility <= ?")
+            params.append(max_visibility)
+        if description:
+            conditions.append("description LIKE ?")
+            params.append(f"%{description.lower()}%")
+        if near is not None:
+            # Narrow to the grid cells of the bounding box, then check the exact distance
+            latitude, longitude, radius = near
+            dlat = math.degrees(radius / EARTH_RADIUS)
+            dlon = dlat / max(math.cos(math.radians(latitude)), 1e-6)
+            conditions.append("lat_cell BETWEEN ? AND ? AND lon_cell BETWEEN ? AND ?")
+            params += [math.floor((latitude - dlat) / self.grid_degrees),
+                       math.floor((latitude + dlat) / self.grid_degrees),
+                       math.floor((longitude - dlon) / self.grid_degrees),
+                       math.floor((longitude + dlon) / self.grid_degrees)]
+
+        sql = "SELECT latitude, longitude, record FROM records"
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += " ORDER BY timestamp"
+
+        # The cursor fetches rows lazily, so only one record is decoded at a time
+        for row_latitude, row_longitude, record in self._conn.execute(sql, params):
+            if near is not None and haversine_distance(latitude, longitude, row_latitude, row_longitude) > radius:
+                continue
+            yield json.loads(record)
+
+    def clear(self):
+        with self._conn:
+            self._conn.execute("DELETE FROM records")
+            self._conn.execute("DELETE FROM archives")
+
+    def stats(self):
+        archives, records = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(records), 0) FROM archives").fetchone()
+        return {"archives": archives, "records": records}
+
+    def close(self):
+        self._conn.close()
+
+
+def parse_near(value):
+    try:
+        latitude, longitude, radius = (float(v) for v in value.split(","))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected LAT,LON,RADIUS_METERS, got '{value}'")
+    return latitude, longitude, radius
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--data-dir", default="AutoVision", help="directory holding the archives")
+    parser.add_argument("--since", help="earliest timestamp, YYYY-MM-DD[THH:MM:SS]")
+    parser.add_argument("--until", help="latest timestamp, YYYY-MM-DD[THH:MM:SS]")
+    parser.add_argument("--near", type=parse_near, metavar="LAT,LON,RADIUS", help="radius in meters")
+    parser.add_argument("--min-rain", type=float, help="mm of rain in the last hour")
+    parser.add_argument("--min-snow", type=float, help="mm of snow in the last hour")
+    parser.add_argument("--max-visibility", type=float, help="visibility in meters")
+    parser.add_argument("--description", help="substring of the weather description")
+    parser.add_argument("--paths", action="store_true", help="print only the video paths")
+    parser.add_argument("--reindex", action="store_true", help="rebuild the index from scratch")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, stream=sys.stderr)
+    index = ArchiveIndex(args.data_dir)
+    if args.reindex:
+        index.clear()
+    index.update()
+    try:
+        for record in index.query(args.since, args.until, args.near, args.min_rain, args.min_snow,
+                                  args.max_visibility, args.description):
+            print(record.get("video_path") if args.paths else json.dumps(record))
+    finally:
+        index.close()
+
+
+if __name__ == '__main__':
+    main()
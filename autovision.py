@@ -0,0 +1,99 @@
+# autovision.py
+"""
+Command-line entry point.
+
+    python autovision.py                          # Kivy GUI (same as camera_app.py)
+    python autovision.py --headless               # record from camera 0 without a GUI
+    python autovision.py --headless --source file --path drive.mp4
+    python autovision.py --headless --source synthetic --duration 60
+    python autovision.py --headless --camera front=0 --camera rear=1 --camera side=synthetic
+
+Kivy is only imported when the GUI is requested, so headless mode starts
+recording without opening a window or waiting on the network: geolocation
+and weather are resolved by the scheduler in the background.
+"""
+import sys
+import time
+import signal
+import logging
+import argparse
+import threading
+
+logger = logging.getLogger("autovision")
+
+
+def parse_camera(value):
+    """
+    Parses NAME=SPEC where SPEC is a device index, "synthetic" or a video file path.
+    Returns:
+        tuple: (name, frame source spec for create_frame_source)
+    """
+    name, sep, spec = value.partition("=")
+    if not sep or not name or not spec:
+        raise argparse.ArgumentTypeError(f"expected NAME=SPEC, got '{value}'")
+    if spec.isdigit():
+        return name, {"kind": "camera", "device": int(spec)}
+    if spec == "synthetic":
+        return name, {"kind": "synthetic"}
+    return name, {"kind": "file", "path": spec}
+
+
+def run_headless(args):
+    from frame_sources import create_frame_source
+    from recorder import Recorder
+
+    started = time.monotonic()
+    source = None
+    try:
+        if args.camera:
+            # One capture + encode process per camera
+            from multi_camera import MultiCameraRecorder
+            recorder = MultiCameraRecorder(dict(args.camera), data_directory=args.data_dir, on_status=logger.info)
+        else:
+            source = create_frame_source(args.source, device=args.device, path=args.path)
+            recorder = Recorder(source, data_directory=args.data_dir, on_status=logger.info)
+    except ValueError as e:
+        logger.error(e)
+        return 1
+
+    stop = threading.Event()
+    signal.signal(signal.SIGINT, lambda *_: stop.set())
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+
+    recorder.start_services()
+    recorder.start_recording()
+    logger.info(f"Recording started in {time.monotonic() - started:.3f} s")
+
+    stop.wait(args.duration)
+    logger.info("Stopping recording")
+    recorder.close()
+    if source is not None:
+        source.close()
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--headless", action="store_true", help="record without the Kivy GUI")
+    parser.add_argument("--source", default="camera", choices=["camera", "file", "synthetic"],
+                        help="frame source in headless mode")
+    parser.add_argument("--device", type=int, default=0, help="camera device index")
+    parser.add_argument("--path", help="video file for --source file")
+    parser.add_argument("--camera", action="append", type=parse_camera, metavar="NAME=SPEC",
+                        help="record several cameras in parallel processes; SPEC is a device index, "
+                             "'synthetic' or a video file (repeatable, headless only)")
+    parser.add_argument("--duration", type=float, default=None, help="stop after this many seconds")
+    parser.add_argument("--data-dir", default="AutoVision", help="directory for videos and metadata")
+    args = parser.parse_args()
+
+    if not args.headless:
+        from camera_gui import CameraApp
+        CameraApp().run()
+        return 0
+
+    logging.basicConfig(level=logging.INFO)
+    return run_headless(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
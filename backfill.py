@@ -0,0 +1,170 @@
+# backfill.py
+"""
+Fills in weather for chunks whose weather lookup failed when they were
+recorded (e.g. while the vehicle was offline).
+
+    python backfill.py                        # backfill AutoVision's metadata store
+    python backfill.py --history-url http://127.0.0.1:8765/data/3.0/onecall/timemachine
+
+Records saved without weather carry "weather_status": "missing". Records
+in the same location cell and time bucket share one historical weather
+request. Requests run concurrently under a rate limit and the results are
+written back in bulk. Every completed batch is persisted, and a run only
+looks at records still marked missing, so an interrupted backfill resumes
+where it stopped.
+"""
+import sys
+import time
+import logging
+import argparse
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from geo_utils import geohash_encode, geohash_decode
+
+from config import (BACKFILL_TIME_BUCKET, BACKFILL_CONCURRENCY, BACKFILL_RATE_LIMIT, WEATHER_CACHE_PRECISION,
+                    METADATA_BACKEND, METADATA_BATCH_SIZE)
+
+logger = logging.getLogger(__name__)
+
+
+class RateLimiter:
+    """
+    Token bucket shared by the fetch threads: at most rate acquisitions per
+    second on average, with bursts of up to burst.
+    """
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+def record_time(record):
+    return time.mktime(time.strptime(record["timestamp"], "%Y-%m-%dT%H:%M:%S"))
+
+
+def missing_weather(records, precision=WEATHER_CACHE_PRECISION, bucket=BACKFILL_TIME_BUCKET):
+    """
+    Groups the records that still need weather by (geohash cell, time bucket).
+    Records without a position or an id can't be backfilled and are left alone.
+    Returns:
+        dict: (cell, bucket number) -> list of records.
+    """
+    groups = defaultdict(list)
+    for record in records:
+        if record.get("weather_status") != "missing" or not record.get("id"):
+            continue
+        weather = record.get("weather") or {}
+        latitude, longitude = weather.get("latitude"), weather.get("longitude")
+        if latitude is None or longitude is None:
+            continue
+        cell = geohash_encode(latitude, longitude, precision)
+        groups[(cell, int(record_time(record) // bucket))].append(record)
+    return groups
+
+
+def apply_weather(record, weather_data):
+    updated = dict(record)
+    updated["weather"] = dict(record["weather"])
+    for field, value in weather_data.items():
+        updated["weather"][field] = value if value is not None else "N/A"
+    updated["weather_status"] = "backfilled"
+    return updated
+
+
+def backfill(metadata_store, weather_service, concurrency=BACKFILL_CONCURRENCY, rate_limit=BACKFILL_RATE_LIMIT,
+             bucket=BACKFILL_TIME_BUCKET, batch_size=METADATA_BATCH_SIZE, should_stop=None):
+    """
+    Runs one backfill pass over metadata_store.
+    Parameters:
+        should_stop (callable): Polled between requests; returning True ends the pass early.
+    Returns:
+        dict: Counts of "groups", "fetched", "failed" and "records" updated.
+    """
+    groups = missing_weather(metadata_store.records(), bucket=bucket)
+    stats = {"groups": len(groups), "fetched": 0, "failed": 0, "records": 0}
+    if not groups:
+        return stats
+    logger.info(f"Backfilling weather for {sum(map(len, groups.values()))} records in {len(groups)} requests")
+
+    limiter = RateLimiter(rate_limit)
+
+    def fetch(key):
+        if should_stop is not None and should_stop():
+            return None
+        limiter.acquire()
+        cell, bucket_number = key
+        latitude, longitude = geohash_decode(cell)
+        # One lookup at the middle of the bucket stands for all of its records; the middle of the
+        # current bucket may still be ahead, and the history endpoint has nothing for the future
+        return weather_service.get_weather_at(latitude, longitude, min((bucket_number + 0.5) * bucket, time.time()))
+
+    pending = {}
+    with ThreadPoolExecutor(concurrency, thread_name_prefix="backfill") as executor:
+        futures = {executor.submit(fetch, key): key for key in groups}
+        for future in as_completed(futures):
+            weather_data = future.result()
+            if weather_data is None:
+                stats["failed"] += 1
+                continue
+            stats["fetched"] += 1
+            # Only the weather fields, so a thumbnail index linked meanwhile isn't reverted
+            for record in groups[futures[future]]:
+                updated = apply_weather(record, weather_data)
+                pending[record["id"]] = {"weather": updated["weather"], "weather_status": updated["weather_status"]}
+            if len(pending) >= batch_size:
+                stats["records"] += len(metadata_store.patch_many(pending))
+                pending = {}
+    if pending:
+        stats["records"] += len(metadata_store.patch_many(pending))
+    logger.info(f"Weather backfill: {stats}")
+    return stats
+
+
+def main():
+    from weather_service import WeatherService
+    from metadata_store import create_metadata_store
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--data-dir", default="AutoVision", help="directory holding the metadata store")
+    parser.add_argument("--backend", default=METADATA_BACKEND, help="metadata store backend")
+    parser.add_argument("--history-url", help="historical weather endpoint, e.g. a local stub server")
+    parser.add_argument("--concurrency", type=int, default=BACKFILL_CONCURRENCY)
+    parser.add_argument("--rate-limit", type=float, default=BACKFILL_RATE_LIMIT, help="requests per second")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    try:
+        weather_service = WeatherService()
+    except ValueError as e:
+        logger.error(e)
+        return 1
+    if args.history_url:
+        weather_service.history_url = args.history_url
+
+    metadata_store = create_metadata_store(args.backend, args.data_dir)
+    try:
+        stats = backfill(metadata_store, weather_service, args.concurrency, args.rate_limit)
+    finally:
+        metadata_store.close()
+    return 0 if not stats["failed"] else 2
+
+
+if __name__ == '__main__':
+    sys.exit(main())
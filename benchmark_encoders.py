@@ -0,0 +1,108 @@
+# benchmark_encoders.py
+"""
+Compares the chunk encoder backends on synthetic frames.
+
+For every backend it reports encode throughput (frames per second of wall
+time), CPU seconds (including the ffmpeg child process) and bytes written
+per frame.
+
+    python benchmark_encoders.py --frames 300 --size 640x480
+    python benchmark_encoders.py --json
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import resource
+import tempfile
+
+import numpy as np
+
+from encoders import ENCODERS, create_encoder
+from config import VIDEO_FPS
+
+
+def synthetic_frames(count, width, height, seed=0):
+    """
+    Yields deterministic BGR frames: a moving gradient with some noise, so
+    the codecs have both motion and texture to work on. Every frame is
+    generated into the same buffer, so each must be used before the next
+    one is requested.
+    """
+    rng = np.random.default_rng(seed)
+    x = np.linspace(0, 255, width, dtype=np.float32)
+    y = np.linspace(0, 255, height, dtype=np.float32)[:, None]
+    frame = np.empty((height, width, 3), np.uint8)
+    for i in range(count):
+        frame[..., 0] = (x + i * 4) % 256
+        frame[..., 1] = (y + i * 2) % 256
+        frame[..., 2] = rng.integers(0, 32, (height, width), dtype=np.uint8)
+        yield frame
+
+
+def cpu_seconds():
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return own.ru_utime + own.ru_stime + children.ru_utime + children.ru_stime
+
+
+def benchmark(name, frame_count, frame_size, directory):
+    try:
+        encoder = create_encoder(name, os.path.join(directory, f"bench_{name}"), VIDEO_FPS, frame_size)
+    except RuntimeError as e:
+        return {"backend": name, "error": str(e)}
+
+    # Frames are generated between the timed writes, so generating them isn't counted
+    elapsed = cpu = 0.0
+    for frame in synthetic_frames(frame_count, *frame_size):
+        cpu_start, start = cpu_seconds(), time.perf_counter()
+        encoder.write(frame)
+        elapsed += time.perf_counter() - start
+        cpu += cpu_seconds() - cpu_start
+    # The ffmpeg child's CPU time is only accounted once it has exited
+    cpu_start, start = cpu_seconds(), time.perf_counter()
+    encoder.release()
+    elapsed += time.perf_counter() - start
+    cpu += cpu_seconds() - cpu_start
+
+    size = os.path.getsize(encoder.path)
+    os.remove(encoder.path)
+    return {
+        "backend": name,
+        "frames": frame_count,
+        "encode_fps": frame_count / elapsed,
+        "cpu_seconds": cpu,
+        "cpu_ms_per_frame": 1000 * cpu / frame_count,
+        "bytes_per_frame": size / frame_count,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--frames", type=int, default=300, help="frames to encode per backend")
+    parser.add_argument("--size", default="640x480", help="frame size as WIDTHxHEIGHT")
+    parser.add_argument("--backends", nargs="+", default=list(ENCODERS), choices=list(ENCODERS))
+    parser.add_argument("--json", action="store_true", help="print machine-readable results")
+    args = parser.parse_args()
+
+    width, height = (int(v) for v in args.size.lower().split("x"))
+    with tempfile.TemporaryDirectory() as directory:
+        results = [benchmark(name, args.frames, (width, height), directory) for name in args.backends]
+
+    if args.json:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+        return
+
+    print(f"{'backend':<8} {'fps':>10} {'cpu ms/frame':>14} {'bytes/frame':>14}")
+    for result in results:
+        if "error" in result:
+            print(f"{result['backend']:<8} skipped: {result['error']}")
+            continue
+        print(f"{result['backend']:<8} {result['encode_fps']:>10.1f} {result['cpu_ms_per_frame']:>14.2f} "
+              f"{result['bytes_per_frame']:>14.0f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+# benchmark_geo.py
+"""
+Compares the scalar haversine_distance with the vectorized geo utilities
+on a synthetic GPS track.
+
+For each operation it reports the time taken and the throughput in points
+per second, and checks that both versions agree.
+
+    python benchmark_geo.py --points 1000000
+    python benchmark_geo.py --json
+"""
+import sys
+import json
+import time
+import argparse
+
+import numpy as np
+
+from geo_utils import haversine_distance, segment_distances, cumulative_distance, downsample_track
+
+
+def synthetic_track(count, seed=0):
+    """
+    Returns:
+        tuple: (latitudes, longitudes) of a random walk with ~10 m steps,
+        roughly what one fix per second at city speeds gives.
+    """
+    rng = np.random.default_rng(seed)
+    steps = rng.normal(0, 1e-4, (count, 2))
+    track = np.cumsum(steps, axis=0) + (18.52, 73.85)
+    return track[:, 0], track[:, 1]
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def scalar_segments(latitudes, longitudes):
+    return [haversine_distance(latitudes[i], longitudes[i], latitudes[i + 1], longitudes[i + 1])
+            for i in range(len(latitudes) - 1)]
+
+
+def benchmark(point_count, scalar_points, spacing):
+    latitudes, longitudes = synthetic_track(point_count)
+    results = []
+
+    # The scalar loop is timed on a prefix and extrapolated, it is too slow for millions of points
+    scalar_count = min(point_count, scalar_points)
+    lat_list, lon_list = latitudes[:scalar_count].tolist(), longitudes[:scalar_count].tolist()
+    scalar, scalar_time = timed(scalar_segments, lat_list, lon_list)
+    results.append({"operation": "scalar haversine", "points": scalar_count, "seconds": scalar_time,
+                    "points_per_second": scalar_count / scalar_time})
+
+    vector, vector_time = timed(segment_distances, latitudes, longitudes)
+    results.append({"operation": "batch haversine", "points": point_count, "seconds": vector_time,
+                    "points_per_second": point_count / vector_time,
+                    "speedup": (point_count / vector_time) / (scalar_count / scalar_time),
+                    "max_error_m": float(np.max(np.abs(vector[:scalar_count - 1] - scalar)))})
+
+    travelled, cumulative_time = timed(cumulative_distance, latitudes, longitudes)
+    results.append({"operation": "cumulative distance", "points": point_count, "seconds": cumulative_time,
+                    "points_per_second": point_count / cumulative_time, "total_m": float(travelled[-1])})
+
+    kept, downsample_time = timed(downsample_track, latitudes, longitudes, spacing)
+    results.append({"operation": f"downsample to {spacing:g} m", "points": point_count, "seconds": downsample_time,
+                    "points_per_second": point_count / downsample_time, "kept": len(kept)})
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--points", type=int, default=1000000, help="points in the synthetic track")
+    parser.add_argument("--scalar-points", type=int, default=100000,
+                        help="points timed with the scalar version")
+    parser.add_argument("--spacing", type=float, default=100, help="downsampling spacing in meters")
+    parser.add_argument("--json", action="store_true", help="print machine-readable results")
+    args = parser.parse_args()
+
+    results = benchmark(args.points, args.scalar_points, args.spacing)
+
+    if args.json:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+        return
+
+    print(f"{'operation':<22} {'points':>10} {'seconds':>10} {'points/s':>14}  notes")
+    for result in results:
+        notes = ", ".join(f"{key}={result[key]:.3g}" if isinstance(result[key], float) else f"{key}={result[key]}"
+                          for key in ("speedup", "max_error_m", "total_m", "kept") if key in result)
+        print(f"{result['operation']:<22} {result['points']:>10} {result['seconds']:>10.4f} "
+              f"{result['points_per_second']:>14.0f}  {notes}")
+
+
+if __name__ == '__main__':
+    main()
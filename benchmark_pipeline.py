@@ -0,0 +1,188 @@
+# benchmark_pipeline.py
+"""
+End-to-end recording benchmark: drives the Recorder with the deterministic
+synthetic frame source against a local stub weather/geolocation server.
+
+For each frame size it reports sustained fps, frame-drop rate, p50/p99
+capture-to-write frame latency, the largest gap between the last frame of
+one chunk and the first frame of the next, metadata writes per second
+(save_data() throughput) and peak RSS. Each configuration runs in a fresh
+process so peak RSS isn't shared between them.
+
+    python benchmark_pipeline.py --sizes 640x480 1280x720 --fps 10 --duration 20
+    python benchmark_pipeline.py --stub-latency 0.3 --stub-failure-rate 0.2 --json > run.json
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import resource
+import tempfile
+import subprocess
+
+from config import VIDEO_ENCODER
+
+
+class TimingWriter:
+    """
+    Wraps a chunk writer and records every frame's capture-to-write latency
+    and the first and last timestamp written to the chunk.
+    """
+
+    def __init__(self, writer, latencies, chunks):
+        self.writer = writer
+        self.latencies = latencies
+        self.first_ns = None
+        self.last_ns = None
+        chunks.append(self)
+
+    def write(self, frame, timestamp_ns):
+        self.writer.write(frame, timestamp_ns)
+        self.latencies.append(time.time_ns() - timestamp_ns)
+        if self.first_ns is None:
+            self.first_ns = timestamp_ns
+        self.last_ns = timestamp_ns
+
+    def skip(self, timestamp_ns, frame=None):
+        self.writer.skip(timestamp_ns, frame)
+
+    def release(self):
+        self.writer.release()
+
+    def discard(self):
+        self.writer.discard()
+
+
+def percentile(values, p):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(p / 100 * len(values)))]
+
+
+def run_one(config):
+    """
+    Runs one configuration in this process.
+    Returns:
+        dict: The measurements.
+    """
+    os.environ.setdefault("OPENWEATHER_API_KEY", "benchmark")
+    from recorder import Recorder
+    from frame_sources import SyntheticSource
+    from weather_service import WeatherService, WeatherCache
+    from stub_server import StubServer
+
+    width, height = config["size"]
+    server = StubServer(latency=config["stub_latency"], failure_rate=config["stub_failure_rate"],
+                        seed=config["seed"]).start()
+    latencies, chunks = [], []
+
+    class BenchmarkRecorder(Recorder):
+        def open_chunk(self, fps, start_time):
+            path, writer = super().open_chunk(fps, start_time)
+            return path, TimingWriter(writer, latencies, chunks)
+
+    with tempfile.TemporaryDirectory() as directory:
+        weather_service = WeatherService(cache=WeatherCache(), base_url=server.url + "/data/2.5/weather",
+                                         history_url=server.url + "/data/3.0/onecall/timemachine")
+        recorder = BenchmarkRecorder(SyntheticSource((width, height)), directory, weather_service,
+                                     fps=config["fps"], frame_size=(width, height),
+                                     chunk_duration=config["chunk_duration"])
+        recorder.geolocation_url = server.url + "/json/"
+
+        recorder.start_recording()
+        time.sleep(config["duration"])
+        recorder.stop_recording()
+        recorder.recording_thread.join()
+        pipeline, pacer = recorder.pipeline.stats(), recorder.pacer.stats()
+
+        # save_data() throughput, with the weather the stub serves
+        weather = weather_service.get_current_weather_by_coords(18.52, 73.85) or {}
+        start = time.perf_counter()
+        for i in range(config["metadata_writes"]):
+            recorder.save_data(f"chunk_{i}.mp4", weather)
+        recorder.metadata_store.flush()
+        metadata_seconds = time.perf_counter() - start
+
+        recorder.close()
+    server.stop()
+
+    # Chunks with frames, in recording order (the pre-opened last one may be empty)
+    written = [chunk for chunk in chunks if chunk.first_ns is not None]
+    gaps = [(b.first_ns - a.last_ns) / 1e6 for a, b in zip(written, written[1:])]
+    # Frames over the span they were captured in, not the nominal duration
+    span_s = (written[-1].last_ns - written[0].first_ns) / 1e9 if written else 0
+    ticks = pacer["ticks"] + pacer["skipped"]
+    return {
+        "size": f"{width}x{height}",
+        "fps_target": config["fps"],
+        "encoder": VIDEO_ENCODER,
+        "duration_s": config["duration"],
+        "frames_encoded": pipeline["encoded"],
+        "sustained_fps": (len(latencies) - 1) / span_s if span_s > 0 else 0.0,
+        "drop_rate": (pipeline["dropped"] + pacer["skipped"]) / ticks if ticks else 0.0,
+        "latency_p50_ms": percentile(latencies, 50) / 1e6 if latencies else None,
+        "latency_p99_ms": percentile(latencies, 99) / 1e6 if latencies else None,
+        "chunks": len(written),
+        "rollover_gap_max_ms": max(gaps) if gaps else None,
+        "frame_period_ms": 1000 / config["fps"],
+        "metadata_writes_per_s": config["metadata_writes"] / metadata_seconds,
+        "stub_requests": dict(server.requests),
+        # ru_maxrss is in kilobytes on Linux
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", nargs="+", default=["640x480"], help="frame sizes as WIDTHxHEIGHT")
+    parser.add_argument("--fps", type=int, default=10)
+    parser.add_argument("--duration", type=float, default=20, help="seconds to record per size")
+    parser.add_argument("--chunk-duration", type=float, default=5, help="seconds per chunk, to measure rollovers")
+    parser.add_argument("--metadata-writes", type=int, default=1000, help="save_data() calls to time")
+    parser.add_argument("--stub-latency", type=float, default=0.0, help="seconds added to every stub response")
+    parser.add_argument("--stub-failure-rate", type=float, default=0.0, help="fraction of stub requests failing")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true", help="print machine-readable results")
+    parser.add_argument("--worker", help=argparse.SUPPRESS)  # one configuration, as JSON
+    args = parser.parse_args()
+
+    if args.worker:
+        json.dump(run_one(json.loads(args.worker)), sys.stdout)
+        return 0
+
+    results = []
+    for size in args.sizes:
+        config = {
+            "size": [int(v) for v in size.lower().split("x")],
+            "fps": args.fps,
+            "duration": args.duration,
+            "chunk_duration": args.chunk_duration,
+            "metadata_writes": args.metadata_writes,
+            "stub_latency": args.stub_latency,
+            "stub_failure_rate": args.stub_failure_rate,
+            "seed": args.seed,
+        }
+        output = subprocess.run([sys.executable, os.path.abspath(__file__), "--worker", json.dumps(config)],
+                                stdout=subprocess.PIPE, check=True).stdout
+        results.append(json.loads(output))
+
+    if args.json:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+        return 0
+
+    print(f"{'size':<10} {'fps':>7} {'drop %':>7} {'p50 ms':>8} {'p99 ms':>8} {'gap ms':>8} "
+          f"{'writes/s':>9} {'rss MB':>8}")
+    for result in results:
+        gap = result["rollover_gap_max_ms"]
+        print(f"{result['size']:<10} {result['sustained_fps']:>7.2f} {100 * result['drop_rate']:>7.2f} "
+              f"{result['latency_p50_ms'] or 0:>8.1f} {result['latency_p99_ms'] or 0:>8.1f} "
+              f"{gap if gap is not None else float('nan'):>8.1f} {result['metadata_writes_per_s']:>9.0f} "
+              f"{result['peak_rss_mb']:>8.1f}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
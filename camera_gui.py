@@ -0,0 +1,205 @@
+from kivy.app import App
+from kivy.uix.boxlayout import BoxLayout
+from kivy.uix.button import Button
+from kivy.uix.label import Label
+from kivy.uix.camera import Camera
+from kivy.core.window import Window
+from kivy.clock import Clock  # for scheduling
+from kivy.clock import mainthread
+
+import time
+import logging
+from frame_sources import FrameSource
+from recorder import Recorder
+from metrics import get_metrics
+from config import METRICS_STATUS_INTERVAL
+
+try:
+    from android.storage import primary_external_storage_path
+except ImportError:
+    primary_external_storage_path = None
+
+try:
+    from plyer import storagepath
+except ImportError:
+    storagepath = None
+
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+
+class KivyCameraSource(FrameSource):
+    """
+    Frames from Kivy's Camera widget. The texture can only be read on the
+    main thread, so each capture is scheduled there and only snapshots the
+    texture bytes; conversion and encoding happen on the pipeline's encoder
+    thread so the UI thread stays responsive.
+    """
+
+    def __init__(self, camera):
+        self.camera = camera
+        self._read_time = get_metrics().histogram("camera.texture_read_seconds")
+
+    @mainthread
+    def capture(self, pipeline, timestamp_ns):
+        texture = self.camera.texture
+        if texture is None:
+            return
+        start = time.perf_counter()
+        pipeline.submit(texture.pixels, texture.width, texture.height, timestamp_ns)
+        # Time the UI thread spent reading back and copying the frame
+        self._read_time.observe(time.perf_counter() - start)
+
+
+class CameraApp(App):
+    latd = ""
+    longd = ""
+    def build(self):
+        Window.size = (800, 600)  # Set window size
+
+        # Determining storage directory
+        if primary_external_storage_path:
+            #For Android-specific storage
+            self.storage_path = primary_external_storage_path()
+        elif storagepath:
+            #For Desktop platforms (Documents folder)
+            self.storage_path = storagepath.get_documents_dir()
+        else:
+            # Fallback to app-specific storage
+            self.storage_path = App.get_running_app().user_data_dir
+        self.camera = Camera(play=True)  # Use Kivy's Camera widget
+
+        self.status_label = Label(text="Press Start to begin recording", size_hint=(1, 0.1))
+        self.start_button = Button(text="Start Recording", size_hint=(1, 0.1), on_press=self.start_stop_recording)
+        self.save_button = Button(text="Save Data", size_hint=(1, 0.1),
+                                 on_press=self.save_json_file)
+        self.protect_button = Button(text="Protect Chunk", size_hint=(1, 0.1),
+                                     on_press=self.protect_chunk)
+
+
+        layout = BoxLayout(orientation='vertical', padding=10, spacing=10)
+        layout.add_widget(self.camera)
+        layout.add_widget(self.status_label)
+        layout.add_widget(self.start_button)
+        layout.add_widget(self.save_button)
+        layout.add_widget(self.protect_button)
+
+        
+    
+
+        # Recording, chunking, weather and metadata live in the Recorder,
+        # which the headless entry point shares
+        try:
+            self.recorder = Recorder(KivyCameraSource(self.camera), on_status=self.update_status)
+        except ValueError as ve:
+            self.status_label.text = str(ve)
+            self.start_button.disabled = True
+            self.save_button.disabled = True  # Disable Save and Start buttons if the Recorder can't be set up
+            self.protect_button.disabled = True
+            logger.error(ve)
+            return layout
+
+        # Location and weather are resolved in the background so the window
+        # shows up at once; until then the last-known position is used
+        self.recorder.start_services()
+        weather, saved_at = self.recorder.state.weather()
+        if weather:
+            saved_at = time.strftime("%H:%M", time.localtime(saved_at or 0))
+            self.status_label.text = (f"Press Start to begin recording\n"
+                                      f"Last known weather ({saved_at}): "
+                                      f"{weather.get('weather_description', 'N/A')}, {weather.get('temperature', 'N/A')}°C")
+
+        # Live recording stats under the last status message
+        self.status_message = self.status_label.text
+        if self.recorder.metrics.enabled:
+            Clock.schedule_interval(self.show_metrics, METRICS_STATUS_INTERVAL)
+
+        return layout
+
+    def on_stop(self):
+        if hasattr(self, "recorder"):
+            self.recorder.close()
+
+    def start_stop_recording(self, instance):
+        if not self.recorder.recording:
+            self.start_button.text = "Stop Recording"
+            self.status_message = self.status_label.text = "Recording..."
+            self.recorder.start_recording()
+        else:
+            self.start_button.text = "Start Recording"
+            self.status_message = self.status_label.text = "Recording stopped"
+            self.recorder.stop_recording()
+
+    @mainthread
+    def update_status(self, message):
+        self.status_message = message
+        self.status_label.text = message
+
+    def show_metrics(self, dt):
+        summary = self.recorder.metrics.summary() if self.recorder.recording else ""
+        self.status_label.text = f"{self.status_message}\n{summary}" if summary else self.status_message
+
+    def save_json_file(self, instance):
+        """
+        Archives the current metadata as a timestamped weather_videos_<timestamp>.json file and starts a new store.
+        """
+        self.recorder.archive_metadata()
+
+    def protect_chunk(self, instance):
+        """
+        Keeps the chunk being recorded from being evicted when storage runs low.
+        """
+        self.recorder.protect_chunk()
+
+    def fetch_weather_data(self):
+        # to manually fetch weather data based on geolocation
+        recorder = self.recorder
+        if recorder.latitude is not None and recorder.longitude is not None:
+            weather_data = recorder.fetch_weather()
+            if weather_data:
+                recorder.save_data(recorder.current_video_path, weather_data)  # "N/A" if not linked to a video yet
+                self.update_weather_labels(weather_data)
+            else:
+                logger.error("Failed to fetch weather data.")
+                self.update_status("Failed to fetch weather data.")
+        else:
+            self.update_status("Geolocation not available.")
+
+"""    @mainthread
+    def update_weather_labels(self, data):
+        # Update UI elements with weather data
+        city = data.get('city', 'N/A')
+        temperature = data.get('temperature', 'N/A')
+        temperature_min = data.get('temperature_min', 'N/A')
+        temperature_max = data.get('temperature_max', 'N/A')
+        feels_like = data.get('feels_like', 'N/A')
+        pressure = data.get('pressure', 'N/A')
+        humidity = data.get('humidity', 'N/A')
+        visibility = data.get('visibility', 'N/A')
+        clouds = data.get('clouds', 'N/A')
+        wind_speed = data.get('wind_speed', 'N/A')
+        wind_deg = data.get('wind_deg', 'N/A')
+        description = data.get('weather_description', 'N/A').capitalize()
+        weather_icon = data.get('weather_icon', 'N/A')
+        sunrise = data.get('sunrise', 'N/A')
+        sunset = data.get('sunset', 'N/A')
+        rain = data.get('rain', 0)
+        snow = data.get('snow', 0) 
+
+        # Update status label with current weather
+        self.status_label.text = (
+            f"City: {city} | "
+            f"Temperature: {temperature}°C | "
+            f"Min: {temperature_min}°C | "
+            f"Max: {temperature_max}°C | "
+            f"Feels Like: {feels_like}°C | "
+            f"Pressure: {pressure} hPa | "
+            f"Humidity: {humidity}% | "
+            f"Visibility: {visibility} m | "
+            f"Clouds: {clouds}% | "
+            f"Wind: {wind_speed} m/s ({wind_deg}°) | "
+            f"Rain: {rain} mm | "
+            f"Snow: {snow} mm | "
+            f"Weather: {description} | "
+            f"Sunrise: {sunrise} | Sunset: {sunset}"
+        )"""
@@ -10,4 +10,176 @@ DISTANCE_THRESHOLD = 100  # 100 meters
 
 # Video Chunk Duration
 # Duration in seconds for each video recording chunk.
-VIDEO_CHUNK_DURATION =60* 30  # 30 minutes
\ No newline at end of file
+VIDEO_CHUNK_DURATION =60* 30  # 30 minutes
+
+# Frame Buffer Size
+# Number of captured frames that can wait for the encoder thread before the
+# oldest one is dropped.
+FRAME_BUFFER_SIZE = 30  # 3 seconds at 10 fps
+
+# Metadata Backend
+# Where chunk/weather records are stored: "jsonl" (append-only log),
+# "sqlite" (indexed database) or "json" (the original single JSON array).
+METADATA_BACKEND = "jsonl"
+
+# Metadata Batching
+# Records are written once this many are pending or this many seconds have
+# passed since the last write, whichever comes first.
+METADATA_BATCH_SIZE = 10
+METADATA_FLUSH_INTERVAL = 5  # seconds
+
+# Metadata Compaction
+# Number of superseded records after which the JSON Lines log is rewritten.
+METADATA_COMPACT_THRESHOLD = 1000
+
+# Weather Cache
+# Responses are reused for requests in the same geohash cell until they are
+# older than the TTL. Precision 6 cells are roughly 1.2 km x 0.6 km.
+WEATHER_CACHE_TTL = 60 * 10  # 10 minutes
+WEATHER_CACHE_PRECISION = 6
+WEATHER_CACHE_SIZE = 256  # entries
+
+# HTTP Client
+# Timeouts in seconds for establishing a connection and for waiting on a
+# response, and how many times a failed request is retried with jittered
+# exponential backoff (base delay doubled per attempt, capped at the max).
+HTTP_CONNECT_TIMEOUT = 3.05
+HTTP_READ_TIMEOUT = 10
+HTTP_MAX_RETRIES = 2
+HTTP_BACKOFF_BASE = 0.5  # seconds
+HTTP_BACKOFF_MAX = 8  # seconds
+HTTP_POOL_SIZE = 4  # keep-alive connections per host
+
+# Circuit Breaker
+# After this many consecutive failures requests to a host fail immediately
+# (e.g. while the vehicle is out of coverage) until the reset timeout passes.
+CIRCUIT_FAILURE_THRESHOLD = 3
+CIRCUIT_RESET_TIMEOUT = 30  # seconds
+
+# Geolocation Polling Interval
+# Time in seconds between each geolocation lookup.
+GEOLOCATION_POLL_INTERVAL = 60  # 1 minute
+
+# Geolocation Endpoint
+# ip-api.com lookup, or a local stub server (stub_server.py) for testing.
+GEOLOCATION_URL = "http://ip-api.com/json/"
+
+# Scheduler I/O Workers
+# Threads available to the telemetry scheduler for blocking network calls.
+SCHEDULER_IO_WORKERS = 4
+
+# Frame Pacing
+# How many frames the recorder may fall behind and still catch up by
+# capturing back-to-back; beyond this the missed frames are skipped.
+FRAME_PACING_MAX_CATCH_UP = 2
+
+# Video Encoding
+# Encoder backend for chunks: "mp4v" (OpenCV MPEG-4), "mjpg" (OpenCV Motion
+# JPEG), "x264" (H.264 through a local ffmpeg process) or "raw" (lossless
+# .npy frames for datasets).
+VIDEO_ENCODER = "mp4v"
+VIDEO_FPS = 10  # Target frames per second
+VIDEO_FRAME_SIZE = (640, 480)  # (width, height)
+
+# ffmpeg x264 Settings
+# Preset trades CPU time for file size (ultrafast ... veryslow); CRF sets the
+# quality (lower is better, 23 is the x264 default).
+FFMPEG_PRESET = "veryfast"
+FFMPEG_CRF = 23
+
+# Storage Budget
+# Disk budget for the video directory. Once it is used up the oldest
+# unprotected chunks are evicted along with their metadata records. Set
+# STORAGE_QUOTA_BYTES to a byte count, or leave it None to allow
+# STORAGE_QUOTA_PERCENT of the filesystem. STORAGE_MIN_FREE_BYTES is kept
+# free on the filesystem regardless of the quota.
+STORAGE_QUOTA_BYTES = None
+STORAGE_QUOTA_PERCENT = 80
+STORAGE_MIN_FREE_BYTES = 1024 ** 3  # 1 GB
+
+# Storage Sync
+# Finished chunks are fsync'ed in batches: after STORAGE_FSYNC_BATCH files
+# or every STORAGE_FSYNC_INTERVAL seconds, whichever comes first.
+STORAGE_FSYNC_BATCH = 8
+STORAGE_FSYNC_INTERVAL = 30  # seconds
+
+# Adaptive Frame Rate
+# When enabled, the recorder drops to every MOTION_STATIC_STRIDE-th frame
+# once the scene has been static for MOTION_STATIC_AFTER seconds and
+# returns to VIDEO_FPS as soon as motion appears. A frame counts as motion
+# when the mean absolute difference (0-255) of a subsample taking every
+# MOTION_DOWNSAMPLE-th pixel exceeds MOTION_THRESHOLD. Skipped ticks are
+# filled by encoding the last frame again, so video chunks still play back in
+# real time; raw (.npy) chunks don't repeat frames, their timing is only in
+# the .idx sidecar.
+ADAPTIVE_FRAME_RATE = False
+MOTION_THRESHOLD = 4.0
+MOTION_STATIC_AFTER = 3  # seconds
+MOTION_STATIC_STRIDE = 5
+MOTION_DOWNSAMPLE = 8
+
+# Position Smoothing
+# Geolocation fixes are median-filtered over this many lookups before the
+# DISTANCE_THRESHOLD comparison, so a single jumpy IP geolocation result
+# doesn't count as movement. The median lags a moving vehicle by about half
+# the window, so it only decides whether the position changed; records get
+# the raw fix.
+GEOLOCATION_SMOOTHING_WINDOW = 5
+
+# Archive Index
+# Cell size in degrees of the location grid archive_index.py indexes
+# records by (0.01 degrees is roughly 1 km).
+ARCHIVE_GRID_DEGREES = 0.01
+
+# Weather API Endpoints
+# Current weather, and the One Call "timemachine" endpoint used to backfill
+# weather for chunks recorded while offline. Point these at a local stub
+# server (stub_server.py) for testing.
+WEATHER_API_URL = "https://api.openweathermap.org/data/2.5/weather"
+WEATHER_HISTORY_URL = "https://api.openweathermap.org/data/3.0/onecall/timemachine"
+
+# Weather Backfill
+# Chunks saved without weather are looked up again every BACKFILL_INTERVAL
+# seconds. Chunks in the same weather cache cell and BACKFILL_TIME_BUCKET
+# share one request; requests run BACKFILL_CONCURRENCY at a time and at most
+# BACKFILL_RATE_LIMIT per second.
+BACKFILL_INTERVAL = 60 * 10  # 10 minutes
+BACKFILL_TIME_BUCKET = 60 * 60  # 1 hour
+BACKFILL_CONCURRENCY = 4
+BACKFILL_RATE_LIMIT = 1  # requests per second
+
+# Metrics
+# Counters, gauges and latency histograms for the recording pipeline, HTTP
+# and metadata writes. With METRICS_ENABLED False every metric is a no-op.
+# A snapshot is written to metrics.json in the data directory every
+# METRICS_DUMP_INTERVAL seconds and, if METRICS_HTTP_PORT is set, served as
+# text on that localhost port. The GUI shows a summary every
+# METRICS_STATUS_INTERVAL seconds.
+METRICS_ENABLED = True
+METRICS_DUMP_INTERVAL = 10  # seconds
+METRICS_HTTP_PORT = None
+METRICS_STATUS_INTERVAL = 2  # seconds
+
+# Thumbnails
+# Each finished chunk gets a sprite sheet with one THUMBNAIL_SIZE thumbnail
+# every THUMBNAIL_INTERVAL seconds (THUMBNAIL_COLUMNS per row) and a
+# brightness/motion signature, built by THUMBNAIL_WORKERS background
+# processes.
+THUMBNAILS_ENABLED = True
+THUMBNAIL_INTERVAL = 10  # seconds
+THUMBNAIL_SIZE = (160, 120)  # (width, height)
+THUMBNAIL_COLUMNS = 10
+THUMBNAIL_WORKERS = 1
+
+# Dataset Export
+# dataset_export.py writes every EXPORT_FRAME_STRIDE-th frame, resized to
+# EXPORT_FRAME_SIZE, into shards of EXPORT_SHARD_FRAMES frames. Frames are
+# decoded in batches of EXPORT_BATCH_FRAMES by EXPORT_WORKERS processes (all
+# CPUs if None). Positions and weather further than EXPORT_LABEL_MAX_GAP
+# seconds from any metadata record are left unknown.
+EXPORT_FRAME_SIZE = (224, 224)  # (width, height)
+EXPORT_FRAME_STRIDE = 1
+EXPORT_SHARD_FRAMES = 1024
+EXPORT_BATCH_FRAMES = 64
+EXPORT_WORKERS = None
+EXPORT_LABEL_MAX_GAP = 60 * 10  # 10 minutes
@@ -0,0 +1,584 @@
+# dataset_export.py
+"""
+Exports the recorded chunks as training data: fixed-size shards of frames
+that np.load(path, mmap_mode='r') maps directly, each with a per-frame
+label table aligned to it.
+
+    python dataset_export.py --out dataset --size 224x224 --stride 5
+    python dataset_export.py --out dataset --workers 8 --shard-frames 4096
+
+The output directory holds:
+    shard_<n>.frames.npy    uint8 (frames, height, width, 3), RGB
+    shard_<n>.labels.npy    one LABEL_DTYPE row per frame of the shard
+    manifest.json           settings, the exported chunks, per-shard throughput and the resume position
+
+Chunks are decoded in parallel worker processes, in batches of
+EXPORT_BATCH_FRAMES, with a bounded number of batches in flight, so memory
+use doesn't depend on the length of the recording. Each frame is labelled
+by its capture timestamp from the chunk's .idx sidecar: the weather comes
+from the chunk's metadata record, and the position is interpolated between
+the positions of the records saved around that time. Only finished chunks
+are exported, i.e. those with the record the Recorder saves once a chunk is
+released ("chunk_complete"); a chunk that can't be opened yet is left for the
+next run, and one that fails to decode is recorded as skipped in the
+manifest while the export carries on.
+
+Shards are written under a temporary name and the manifest is updated
+after each one, so an interrupted export resumes from the last complete
+shard. Re-running an export later appends the chunks recorded since.
+"""
+import os
+import sys
+import json
+import time
+import struct
+import bisect
+import logging
+import argparse
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import cv2
+import numpy as np
+
+from backfill import record_time
+from frame_timing import (INDEX_HEADER, INDEX_MAGIC, INDEX_SKIPPED, INDEX_REPEATED, index_path_for,
+                          read_frame_index)
+
+from config import (EXPORT_FRAME_SIZE, EXPORT_FRAME_STRIDE, EXPORT_SHARD_FRAMES, EXPORT_BATCH_FRAMES,
+                    EXPORT_WORKERS, EXPORT_LABEL_MAX_GAP, METADATA_BACKEND)
+
+MANIFEST_VERSION = 1
+VIDEO_EXTENSIONS = (".mp4", ".avi", ".mkv", ".npy")
+WEATHER_FIELDS = ("temperature", "humidity", "pressure", "visibility", "clouds", "wind_speed", "rain", "snow")
+
+# Unknown values are NaN; chunk indexes manifest["chunks"], frame is the frame number within that chunk
+LABEL_DTYPE = np.dtype([("timestamp_ns", "<i8"), ("chunk", "<i4"), ("frame", "<i4"),
+                        ("latitude", "<f8"), ("longitude", "<f8")] +
+                       [(field, "<f4") for field in WEATHER_FIELDS])
+
+logger = logging.getLogger(__name__)
+
+
+def _number(value):
+    # Weather fields are "N/A" (or None) when the API left them out
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return float("nan")
+
+
+def _chunk_start_ns(video_path):
+    # Only the index header is read; chunks without an index can't be labelled
+    try:
+        with open(index_path_for(video_path), 'rb') as f:
+            magic, _, _, start_ns = INDEX_HEADER.unpack(f.read(INDEX_HEADER.size))
+    except (OSError, ValueError, struct.error):  # struct.error: header not written yet
+        return None
+    return start_ns if magic == INDEX_MAGIC else None
+
+
+def list_chunks(video_directory):
+    """
+    Returns:
+        list: The video paths of the indexed chunks in video_directory, in recording order.
+    """
+    chunks = []
+    with os.scandir(video_directory) as it:
+        for entry in it:
+            name = entry.name
+            if not name.startswith("video_chunk_") or os.path.splitext(name)[1] not in VIDEO_EXTENSIONS:
+                continue
+            start_ns = _chunk_start_ns(entry.path)
+            if start_ns is None:
+                logger.warning(f"Skipping {entry.path}: no frame index")
+                continue
+            chunks.append((start_ns, entry.path))
+    return [path for _, path in sorted(chunks)]
+
+
+def can_open(video_path):
+    """
+    Returns:
+        bool: Whether the chunk's video can be opened for decoding, e.g. not
+        an mp4 still being written, which has no moov atom yet.
+    """
+    if video_path.endswith(".npy"):
+        try:
+            np.load(video_path, mmap_mode='r')
+        except (OSError, ValueError):
+            return False
+        return True
+    capture = cv2.VideoCapture(video_path)
+    try:
+        return capture.isOpened()
+    finally:
+        capture.release()
+
+
+def _read_frames(video_path, frame_numbers):
+    # Yields the BGR frames with the given (ascending) numbers; frames in between are only grab()bed
+    if video_path.endswith(".npy"):
+        frames = np.load(video_path, mmap_mode='r')
+        for number in frame_numbers:
+            if number >= len(frames):
+                return
+            yield frames[number]
+        return
+
+    capture = cv2.VideoCapture(video_path)
+    if not capture.isOpened():
+        raise ValueError(f"Could not open {video_path}")
+    try:
+        position = frame_numbers[0]
+        if position:
+            capture.set(cv2.CAP_PROP_POS_FRAMES, position)
+        for number in frame_numbers:
+            while position < number:
+                if not capture.grab():
+                    return
+                position += 1
+            ok, frame = capture.read()
+            if not ok:
+                return
+            position += 1
+            yield frame
+    finally:
+        capture.release()
+
+
+def decode_frames(video_path, frame_numbers, frame_size):
+    """
+    Decodes, resizes and converts to RGB one batch of frames. Runs in a worker process.
+    Returns:
+        np.ndarray: uint8 (n, height, width, 3); shorter than frame_numbers if the video ends early.
+    """
+    width, height = frame_size
+    frames = np.empty((len(frame_numbers), height, width, 3), np.uint8)
+    count = 0
+    for frame in _read_frames(video_path, frame_numbers):
+        if frame.shape[1::-1] != (width, height):
+            frame = cv2.resize(frame, frame_size, interpolation=cv2.INTER_AREA)
+        cv2.cvtColor(frame, cv2.COLOR_BGR2RGB, dst=frames[count])
+        count += 1
+    return frames[:count]
+
+
+def _init_worker():
+    # Parallelism comes from the processes; OpenCV's own threads would only oversubscribe the CPUs
+    cv2.setNumThreads(1)
+
+
+class LabelJoiner:
+    """
+    Joins frame timestamps with the metadata records. Weather comes from the
+    chunk's own record, or else from the first record saved within max_gap
+    after the frame (records are saved as their chunk finishes). Positions
+    are interpolated between the records saved around the frame, and are
+    unknown further than max_gap from any record.
+    """
+
+    def __init__(self, records, max_gap=EXPORT_LABEL_MAX_GAP):
+        self.max_gap = max_gap
+        # By file name, so the data directory may be given differently than when recording
+        self.by_name = {}
+        self.complete = set()
+        timed = []
+        for record in records:
+            if record.get("video_path"):
+                name = os.path.basename(record["video_path"])
+                self.by_name[name] = record
+                if record.get("chunk_complete"):
+                    self.complete.add(name)
+            try:
+                timed.append((record_time(record), record))
+            except (KeyError, ValueError):
+                continue
+        timed.sort(key=lambda item: item[0])
+        self.times = [t for t, _ in timed]
+        self.records = [record for _, record in timed]
+
+        fixes = [(t, record["weather"]) for t, record in timed
+                 if isinstance((record.get("weather") or {}).get("latitude"), (int, float))
+                 and isinstance(record["weather"].get("longitude"), (int, float))]
+        self.fix_times = np.array([t for t, _ in fixes], np.float64)
+        self.latitudes = np.array([weather["latitude"] for _, weather in fixes], np.float64)
+        self.longitudes = np.array([weather["longitude"] for _, weather in fixes], np.float64)
+
+    def record_of(self, video_path):
+        """
+        Returns:
+            dict or None: The chunk's latest metadata record.
+        """
+        return self.by_name.get(os.path.basename(video_path))
+
+    def is_complete(self, video_path):
+        """
+        Returns:
+            bool: Whether the chunk was released; periodic records also name the chunk being written.
+        """
+        return os.path.basename(video_path) in self.complete
+
+    def record_for(self, video_path, timestamp_ns):
+        record = self.record_of(video_path)
+        if record is not None:
+            return record
+        seconds = timestamp_ns / 1e9
+        i = bisect.bisect_left(self.times, seconds)
+        if i < len(self.times) and self.times[i] - seconds <= self.max_gap:
+            return self.records[i]
+        return None
+
+    def positions(self, timestamps_ns):
+        """
+        Returns:
+            tuple: (latitudes, longitudes) arrays for the timestamps, NaN where unknown.
+        """
+        seconds = np.asarray(timestamps_ns, np.float64) / 1e9
+        if not len(self.fix_times):
+            unknown = np.full(len(seconds), np.nan)
+            return unknown, unknown.copy()
+        latitudes = np.interp(seconds, self.fix_times, self.latitudes)
+        longitudes = np.interp(seconds, self.fix_times, self.longitudes)
+        i = np.searchsorted(self.fix_times, seconds)
+        gap = np.minimum(np.abs(seconds - self.fix_times[np.clip(i - 1, 0, None)]),
+                         np.abs(self.fix_times[np.clip(i, None, len(self.fix_times) - 1)] - seconds))
+        latitudes[gap > self.max_gap] = np.nan
+        longitudes[gap > self.max_gap] = np.nan
+        return latitudes, longitudes
+
+    def labels(self, chunk, video_path, frame_numbers, timestamps_ns):
+        """
+        Returns:
+            np.ndarray: The LABEL_DTYPE rows of one batch of frames.
+        """
+        labels = np.zeros(len(frame_numbers), LABEL_DTYPE)
+        labels["timestamp_ns"] = timestamps_ns
+        labels["chunk"] = chunk
+        labels["frame"] = frame_numbers
+        labels["latitude"], labels["longitude"] = self.positions(timestamps_ns)
+        record = self.record_for(video_path, timestamps_ns[0]) if len(timestamps_ns) else None
+        weather = (record or {}).get("weather") or {}
+        for field in WEATHER_FIELDS:
+            labels[field] = _number(weather.get(field))
+        return labels
+
+
+class ShardWriter:
+    """
+    One shard being filled. Frames go straight into a memory-mapped .npy
+    under a temporary name; labels are kept in memory (a few dozen bytes a
+    frame) and written when the shard is closed.
+    """
+
+    def __init__(self, directory, number, capacity, frame_size):
+        width, height = frame_size
+        self.name = f"shard_{number:05d}"
+        self.directory = directory
+        self.frames_path = os.path.join(directory, self.name + ".frames.npy")
+        self.labels_path = os.path.join(directory, self.name + ".labels.npy")
+        self._tmp_path = self.frames_path + ".tmp"
+        self.frames = np.lib.format.open_memmap(self._tmp_path, mode='w+', dtype=np.uint8,
+                                                shape=(capacity, height, width, 3))
+        self.labels = np.zeros(capacity, LABEL_DTYPE)
+        self.capacity = capacity
+        self.count = 0
+        self.started = time.perf_counter()
+
+    @property
+    def full(self):
+        return self.count == self.capacity
+
+    def add(self, frames, labels):
+        """
+        Returns:
+            int: How many of the frames fitted.
+        """
+        taken = min(len(frames), self.capacity - self.count)
+        self.frames[self.count:self.count + taken] = frames[:taken]
+        self.labels[self.count:self.count + taken] = labels[:taken]
+        self.count += taken
+        return taken
+
+    def close(self):
+        """
+        Makes the shard durable under its final name; the last shard of an
+        export is trimmed to the frames it holds.
+        Returns:
+            dict: The shard's manifest entry.
+        """
+        if self.full:
+            self.frames.flush()
+            del self.frames
+            os.replace(self._tmp_path, self.frames_path)
+        else:
+            trimmed = np.lib.format.open_memmap(self.frames_path, mode='w+', dtype=np.uint8,
+                                                shape=(self.count,) + self.frames.shape[1:])
+            trimmed[:] = self.frames[:self.count]
+            trimmed.flush()
+            del trimmed
+            self.discard()
+        with open(self.labels_path + ".tmp", 'wb') as f:
+            np.save(f, self.labels[:self.count])
+        os.replace(self.labels_path + ".tmp", self.labels_path)
+
+        seconds = time.perf_counter() - self.started
+        size = os.path.getsize(self.frames_path)
+        logger.info(f"Wrote {self.name}: {self.count} frames in {seconds:.1f} s "
+                    f"({self.count / seconds:.0f} frames/s, {size / 1e6 / seconds:.1f} MB/s)")
+        return {"name": self.name, "frames": self.count, "bytes": size, "seconds": round(seconds, 3)}
+
+    def discard(self):
+        if hasattr(self, "frames"):
+            del self.frames
+        if os.path.exists(self._tmp_path):
+            os.remove(self._tmp_path)
+
+
+class DatasetExporter:
+    """
+    Streams the chunks of a data directory into shards. See the module docstring.
+    """
+
+    def __init__(self, data_directory="AutoVision", output_directory="dataset", frame_size=EXPORT_FRAME_SIZE,
+                 stride=EXPORT_FRAME_STRIDE, shard_frames=EXPORT_SHARD_FRAMES, batch_frames=EXPORT_BATCH_FRAMES,
+                 workers=EXPORT_WORKERS, max_label_gap=EXPORT_LABEL_MAX_GAP):
+        """
+        Parameters:
+            frame_size (tuple): (width, height) of the exported frames.
+            stride (int): Export every stride-th frame of each chunk.
+            workers (int): Decoding processes; all CPUs if None.
+        """
+        self.data_directory = data_directory
+        self.video_directory = os.path.join(data_directory, "videos")
+        self.output_directory = output_directory
+        self.frame_size = tuple(frame_size)
+        self.stride = stride
+        self.shard_frames = shard_frames
+        self.batch_frames = batch_frames
+        self.workers = workers or os.cpu_count()
+        self.max_label_gap = max_label_gap
+        self.manifest_path = os.path.join(output_directory, "manifest.json")
+
+    def _load_manifest(self):
+        settings = {"frame_size": list(self.frame_size), "stride": self.stride, "shard_frames": self.shard_frames}
+        try:
+            with open(self.manifest_path, 'r') as f:
+                manifest = json.load(f)
+        except FileNotFoundError:
+            return dict(settings, version=MANIFEST_VERSION, channels="RGB", label_fields=list(LABEL_DTYPE.names),
+                        chunks=[], shards=[], position=[0, 0])
+        if any(manifest.get(key) != value for key, value in settings.items()):
+            raise ValueError(f"{self.output_directory} was exported with different settings "
+                             f"({', '.join(f'{key}={manifest.get(key)}' for key in settings)}); "
+                             f"use another output directory or --restart")
+        return manifest
+
+    def _save_manifest(self, manifest):
+        tmp_path = self.manifest_path + ".tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(tmp_path, self.manifest_path)
+
+    def restart(self):
+        """
+        Deletes a previous export in the output directory.
+        """
+        if not os.path.isdir(self.output_directory):
+            return
+        for name in os.listdir(self.output_directory):
+            if name.startswith("shard_") or name.startswith("manifest.json"):
+                os.remove(os.path.join(self.output_directory, name))
+
+    def _batches(self, chunks, position):
+        # (chunk number, first sample number, frame numbers, timestamps) from the resume position on
+        first_chunk, first_sample = position
+        for chunk in range(first_chunk, len(chunks)):
+            if chunks[chunk].get("skipped"):
+                continue
+            video_path = chunks[chunk]["video_path"]
+            try:
+                _, records = read_frame_index(index_path_for(video_path))
+            except (OSError, ValueError) as e:
+                logger.warning(f"Skipping {video_path}: {e}")
+                chunks[chunk]["skipped"] = str(e)
+                continue
+            # Video frame n is the n-th encoded record; skipped ticks have no frame, and repeated
+            # ones (filling skipped ticks) are frames but not exported again
+            encoded = [(timestamp, offset) for _, timestamp, offset in records if offset != INDEX_SKIPPED]
+            timestamps = np.array([timestamp for timestamp, _ in encoded], np.int64)
+            captured = np.array([n for n, (_, offset) in enumerate(encoded) if offset != INDEX_REPEATED], np.int64)
+            samples = captured[::self.stride]
+            start = first_sample if chunk == first_chunk else 0
+            for i in range(start, len(samples), self.batch_frames):
+                if chunks[chunk].get("skipped"):
+                    break  # failed to decode; see run()
+                frame_numbers = samples[i:i + self.batch_frames]
+                yield chunk, i, frame_numbers, timestamps[frame_numbers]
+
+    def run(self, records, should_stop=None):
+        """
+        Exports the chunks not exported yet.
+        Parameters:
+            records (iterable): Metadata records to label the frames with.
+            should_stop (callable): Checked between batches; the export stops
+                at the last complete shard, to be resumed later.
+        Returns:
+            dict: Frames and shards written, and the throughput.
+        """
+        os.makedirs(self.output_directory, exist_ok=True)
+        manifest = self._load_manifest()
+        joiner = LabelJoiner(records, self.max_label_gap)
+        exported = {chunk["video_path"] for chunk in manifest["chunks"]}
+        for video_path in list_chunks(self.video_directory):
+            if video_path in exported:
+                continue
+            # Left out of the manifest, so the next run considers them again
+            if not joiner.is_complete(video_path):
+                logger.info(f"Not exporting {video_path} yet: not finished")
+                continue
+            if not can_open(video_path):
+                logger.warning(f"Not exporting {video_path} yet: could not open it")
+                continue
+            manifest["chunks"].append({"video_path": video_path})
+        for chunk in manifest["chunks"]:
+            record = joiner.record_of(chunk["video_path"])
+            if record is not None:
+                chunk["record_id"] = record.get("id")
+                chunk["weather_description"] = (record.get("weather") or {}).get("weather_description")
+        self._save_manifest(manifest)
+
+        chunks, position = manifest["chunks"], manifest["position"]
+        stats = {"frames": 0, "bytes": 0, "shards": 0}
+        started = time.perf_counter()
+        shard = None
+        executor = self._create_executor()
+        # At most two batches per worker are decoded ahead of the writer
+        in_flight = deque()
+        batches = self._batches(chunks, position)
+        try:
+            while True:
+                while len(in_flight) < 2 * self.workers and not (should_stop and should_stop()):
+                    batch = next(batches, None)
+                    if batch is None:
+                        break
+                    in_flight.append((batch, self._submit(executor, chunks, batch)))
+                if not in_flight:
+                    break
+                batch, future = in_flight.popleft()
+                chunk, first_sample, frame_numbers, timestamps = batch
+                if chunks[chunk].get("skipped"):
+                    continue
+                try:
+                    frames = future.result()
+                except Exception as e:
+                    # One bad chunk doesn't abort the export; its frames already in the shard stay
+                    logger.error(f"Skipping {chunks[chunk]['video_path']}: could not decode it: {e}")
+                    chunks[chunk]["skipped"] = f"decode failed: {e}"
+                    self._save_manifest(manifest)
+                    if isinstance(e, BrokenProcessPool):
+                        # A worker died on it; the batches queued with it are decoded again by a new pool
+                        executor.shutdown(wait=False)
+                        executor = self._create_executor()
+                        in_flight = deque((queued, self._submit(executor, chunks, queued))
+                                          for queued, _ in in_flight if not chunks[queued[0]].get("skipped"))
+                    continue
+                if len(frames) < len(frame_numbers):
+                    logger.warning(f"{chunks[chunk]['video_path']} ends before its index; "
+                                   f"{len(frame_numbers) - len(frames)} frames missing")
+                labels = joiner.labels(chunk, chunks[chunk]["video_path"], frame_numbers[:len(frames)],
+                                       timestamps[:len(frames)])
+                done = 0
+                while done < len(frames):
+                    if shard is None:
+                        shard = ShardWriter(self.output_directory, len(manifest["shards"]), self.shard_frames,
+                                            self.frame_size)
+                    done += shard.add(frames[done:], labels[done:])
+                    if shard.full:
+                        position = [chunk, first_sample + done]
+                        self._finish_shard(manifest, shard, position, stats)
+                        shard = None
+                if should_stop and should_stop():
+                    logger.info("Export stopped; it resumes from the last complete shard")
+                    return self._report(stats, started)
+            if shard is not None and shard.count:
+                self._finish_shard(manifest, shard, [len(chunks), 0], stats)
+                shard = None
+            else:
+                manifest["position"] = [len(chunks), 0]
+                self._save_manifest(manifest)
+        finally:
+            if shard is not None:
+                shard.discard()
+            executor.shutdown(wait=True, cancel_futures=True)
+        return self._report(stats, started)
+
+    def _create_executor(self):
+        return ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"),
+                                   initializer=_init_worker)
+
+    def _submit(self, executor, chunks, batch):
+        chunk, _, frame_numbers, _ = batch
+        return executor.submit(decode_frames, chunks[chunk]["video_path"], frame_numbers.tolist(), self.frame_size)
+
+    def _finish_shard(self, manifest, shard, position, stats):
+        entry = shard.close()
+        manifest["shards"].append(entry)
+        manifest["position"] = position
+        self._save_manifest(manifest)
+        stats["frames"] += entry["frames"]
+        stats["bytes"] += entry["bytes"]
+        stats["shards"] += 1
+
+    def _report(self, stats, started):
+        seconds = time.perf_counter() - started
+        stats["seconds"] = round(seconds, 3)
+        stats["frames_per_s"] = stats["frames"] / seconds if seconds else 0.0
+        stats["mb_per_s"] = stats["bytes"] / 1e6 / seconds if seconds else 0.0
+        logger.info(f"Exported {stats['frames']} frames in {stats['shards']} shards in {seconds:.1f} s "
+                    f"({stats['frames_per_s']:.0f} frames/s, {stats['mb_per_s']:.1f} MB/s)")
+        return stats
+
+
+def parse_size(value):
+    try:
+        width, height = (int(v) for v in value.lower().split("x"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected WIDTHxHEIGHT, got '{value}'")
+    return width, height
+
+
+def main():
+    from metadata_store import create_metadata_store
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--data-dir", default="AutoVision", help="directory holding videos/ and the metadata store")
+    parser.add_argument("--out", default="dataset", help="output directory")
+    parser.add_argument("--size", type=parse_size, default=EXPORT_FRAME_SIZE, metavar="WIDTHxHEIGHT")
+    parser.add_argument("--stride", type=int, default=EXPORT_FRAME_STRIDE, help="export every n-th frame")
+    parser.add_argument("--shard-frames", type=int, default=EXPORT_SHARD_FRAMES, help="frames per shard")
+    parser.add_argument("--batch-frames", type=int, default=EXPORT_BATCH_FRAMES, help="frames per decode job")
+    parser.add_argument("--workers", type=int, default=EXPORT_WORKERS, help="decoding processes")
+    parser.add_argument("--restart", action="store_true", help="delete a previous export and start over")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    exporter = DatasetExporter(args.data_dir, args.out, args.size, args.stride, args.shard_frames,
+                               args.batch_frames, args.workers)
+    if args.restart:
+        exporter.restart()
+    metadata_store = create_metadata_store(METADATA_BACKEND, args.data_dir)
+    try:
+        exporter.run(metadata_store.records())
+    except ValueError as e:
+        logger.error(str(e))
+        return 1
+    finally:
+        metadata_store.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,210 @@
+# encoders.py
+import os
+import shutil
+import logging
+import subprocess
+
+import cv2
+import numpy as np
+
+from config import FFMPEG_PRESET, FFMPEG_CRF
+
+
+class VideoEncoder:
+    """
+    Base class for the chunk encoders. Every backend takes BGR frames of
+    frame_size and exposes the VideoWriter-style write()/release() pair the
+    frame pipeline uses. duration, when known, is the expected chunk length
+    in seconds. Backends that allocate disk space up front never allocate
+    more than max_preallocate bytes, and report what they did allocate in
+    preallocated. constant_frame_rate backends play every frame for 1/fps
+    seconds, so ticks the adaptive frame rate skips are filled by repeating
+    the last frame (see frame_timing.IndexedWriter.skip).
+    """
+
+    extension = ".mp4"
+    constant_frame_rate = True
+
+    def __init__(self, path, fps, frame_size, duration=None, max_preallocate=None):
+        self.logger = logging.getLogger(__name__)
+        self.path = path
+        self.fps = fps
+        self.frame_size = frame_size  # (width, height)
+        self.duration = duration
+        self.max_preallocate = max_preallocate
+        self.preallocated = 0
+
+    @classmethod
+    def expected_size(cls, fps, frame_size, duration):
+        """
+        Returns:
+            int or None: The size of a chunk of this duration, if the backend knows it in advance.
+        """
+        return None
+
+    def write(self, frame):
+        raise NotImplementedError
+
+    def release(self):
+        raise NotImplementedError
+
+
+class OpenCVEncoder(VideoEncoder):
+    """
+    cv2.VideoWriter with a FOURCC codec, e.g. 'mp4v' or 'MJPG'.
+    """
+
+    def __init__(self, path, fps, frame_size, fourcc="mp4v", duration=None, max_preallocate=None):
+        super().__init__(path, fps, frame_size, duration, max_preallocate)
+        self._writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*fourcc), fps, frame_size)
+        if not self._writer.isOpened():
+            self.logger.error(f"Could not open VideoWriter for {path} with codec {fourcc}")
+
+    def write(self, frame):
+        self._writer.write(frame)
+
+    def release(self):
+        self._writer.release()
+
+
+class MJPGEncoder(OpenCVEncoder):
+    extension = ".avi"
+
+    def __init__(self, path, fps, frame_size, duration=None, max_preallocate=None):
+        super().__init__(path, fps, frame_size, fourcc="MJPG", duration=duration, max_preallocate=max_preallocate)
+
+
+class FFmpegEncoder(VideoEncoder):
+    """
+    Pipes raw BGR frames into a local ffmpeg process encoding H.264 with
+    libx264. The preset trades CPU time for file size ("ultrafast" is
+    cheapest, "slow" gives the smallest files); CRF sets the quality.
+    """
+
+    def __init__(self, path, fps, frame_size, preset=FFMPEG_PRESET, crf=FFMPEG_CRF, duration=None,
+                 max_preallocate=None):
+        super().__init__(path, fps, frame_size, duration, max_preallocate)
+        ffmpeg = shutil.which("ffmpeg")
+        if ffmpeg is None:
+            raise RuntimeError("ffmpeg not found on PATH; choose another VIDEO_ENCODER")
+        width, height = frame_size
+        command = [
+            ffmpeg, "-y", "-loglevel", "error",
+            "-f", "rawvideo", "-pix_fmt", "bgr24", "-s", f"{width}x{height}", "-r", str(fps), "-i", "-",
+            "-c:v", "libx264", "-preset", preset, "-crf", str(crf), "-pix_fmt", "yuv420p",
+            path,
+        ]
+        self._process = subprocess.Popen(command, stdin=subprocess.PIPE)
+
+    def write(self, frame):
+        # Frames from the pipeline are contiguous, so this writes without a copy
+        self._process.stdin.write(np.ascontiguousarray(frame).data)
+
+    def release(self):
+        self._process.stdin.close()
+        if self._process.wait() != 0:
+            self.logger.error(f"ffmpeg exited with code {self._process.returncode} for {self.path}")
+
+
+class RawEncoder(VideoEncoder):
+    """
+    Lossless frames for datasets: a .npy file of shape (frames, height,
+    width, 3) that np.load(path, mmap_mode='r') can map directly. The header
+    is reserved up front and rewritten with the final frame count on
+    release, so frames are streamed to disk instead of held in memory.
+
+    The size of a raw chunk is known in advance, so when the duration is
+    given the whole file is allocated up front (one contiguous extent on
+    most filesystems, capped to max_preallocate) and truncated to what was
+    written on release. The frames carry no timing besides the sidecar
+    index, so skipped ticks aren't filled.
+    """
+
+    extension = ".npy"
+    constant_frame_rate = False
+    HEADER_SIZE = 128
+
+    def __init__(self, path, fps, frame_size, duration=None, max_preallocate=None):
+        super().__init__(path, fps, frame_size, duration, max_preallocate)
+        self.frames = 0
+        self._file = open(path, 'wb')
+        self._write_header()
+        size = self.expected_size(fps, frame_size, duration)
+        if size and max_preallocate is not None:
+            size = min(size, max_preallocate)
+        if size and size > self.HEADER_SIZE:
+            self._preallocate(size)
+
+    @classmethod
+    def expected_size(cls, fps, frame_size, duration):
+        if not duration:
+            return None
+        width, height = frame_size
+        return cls.HEADER_SIZE + int(duration * fps) * width * height * 3
+
+    def _preallocate(self, size):
+        try:
+            os.posix_fallocate(self._file.fileno(), 0, size)
+            self.preallocated = size
+        except (AttributeError, OSError) as e:
+            # Not available on this platform or filesystem; frames are simply appended
+            self.logger.debug(f"Could not preallocate {self.path}: {e}")
+
+    def _write_header(self):
+        width, height = self.frame_size
+        header = f"{{'descr': '|u1', 'fortran_order': False, 'shape': ({self.frames}, {height}, {width}, 3), }}"
+        # magic (6) + version (2) + header length (2) + header, padded with spaces and ending in a newline
+        header = header.ljust(self.HEADER_SIZE - 10 - 1) + "\n"
+        self._file.seek(0)
+        self._file.write(b"\x93NUMPY\x01\x00" + len(header).to_bytes(2, "little") + header.encode("latin1"))
+
+    def tell(self):
+        return self._file.tell()
+
+    def write(self, frame):
+        self._file.write(np.ascontiguousarray(frame).data)
+        self.frames += 1
+
+    def release(self):
+        end = self._file.tell()
+        self._write_header()
+        self._file.seek(end)
+        # Drop the unused part of the preallocation
+        self._file.truncate(end)
+        self._file.close()
+
+
+ENCODERS = {
+    "mp4v": OpenCVEncoder,
+    "mjpg": MJPGEncoder,
+    "x264": FFmpegEncoder,
+    "raw": RawEncoder,
+}
+
+
+def expected_chunk_size(name, fps, frame_size, duration):
+    """
+    Returns:
+        int or None: The size of a chunk from the named backend, if known in advance (raw chunks).
+    """
+    encoder_class = ENCODERS.get(name)
+    return encoder_class.expected_size(fps, frame_size, duration) if encoder_class else None
+
+
+def create_encoder(name, base_path, fps, frame_size, duration=None, max_preallocate=None):
+    """
+    Opens an encoder for a chunk.
+    Parameters:
+        name (str): One of "mp4v", "mjpg", "x264" or "raw".
+        base_path (str): Chunk path without extension; the backend adds its own.
+        duration (float): Expected chunk length in seconds, if known.
+        max_preallocate (int): Most bytes the backend may allocate up front.
+    Returns:
+        VideoEncoder: The opened encoder; its path attribute is the full file path.
+    """
+    try:
+        encoder_class = ENCODERS[name]
+    except KeyError:
+        raise ValueError(f"Unknown video encoder '{name}'. Choose one of: {', '.join(ENCODERS)}")
+    return encoder_class(base_path + encoder_class.extension, fps, frame_size, duration=duration,
+                         max_preallocate=max_preallocate)
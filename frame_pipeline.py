@@ -0,0 +1,367 @@
+# frame_pipeline.py
+import time
+import threading
+import logging
+from collections import deque
+
+import cv2
+import numpy as np
+
+from metrics import get_metrics
+
+from config import FRAME_BUFFER_SIZE
+
+# Color conversions from a source pixel format to the BGR frames OpenCV writes
+COLOR_CONVERSIONS = {
+    "rgba": cv2.COLOR_RGBA2BGR,
+    "bgra": cv2.COLOR_BGRA2BGR,
+    "rgb": cv2.COLOR_RGB2BGR,
+    "bgr": None,
+}
+
+
+class FrameBufferPool:
+    """
+    Fixed set of preallocated frame buffers of one shape.
+
+    Buffers are handed out with acquire() and returned with release(). A new
+    buffer is only allocated when every buffer is in use, and each one is
+    counted in allocations, so a steady-state pipeline shows a constant
+    allocation count.
+    """
+
+    def __init__(self, shape, count):
+        self.shape = shape
+        self.allocations = count
+        self._free = [np.empty(shape, np.uint8) for _ in range(count)]
+
+    def acquire(self):
+        if self._free:
+            return self._free.pop()
+        self.allocations += 1
+        return np.empty(self.shape, np.uint8)
+
+    def release(self, buffer):
+        if buffer.shape == self.shape:
+            self._free.append(buffer)
+
+
+class FramePipeline:
+    """
+    Bounded capture -> encode pipeline.
+
+    The producer (the Kivy main thread) only hands over the raw RGBA bytes of a
+    frame with submit(). A dedicated encoder thread converts them to BGR and
+    writes them to the current writer, so the UI thread never waits on
+    OpenCV. Writers are called as write(frame, timestamp_ns) with the frame's
+    capture time (see frame_timing.IndexedWriter). Ticks the adaptive
+    frame rate skipped are queued with mark_skipped() and passed on in order
+    as writer.skip(timestamp_ns, frame) with the last frame written, which
+    the writer may encode again.
+
+    When the encoder falls behind and the ring buffer is full, the oldest
+    pending frame is dropped to make room for the newest one.
+
+    Frames live in a FrameBufferPool sized from the first frame's dimensions,
+    and conversion and resizing write into preallocated destinations, so no
+    frame-sized buffer is allocated per frame once the pipeline is warm.
+    buffer_allocations in stats() counts every frame-sized allocation.
+    """
+
+    def __init__(self, frame_size, capacity=FRAME_BUFFER_SIZE, motion_gate=None):
+        """
+        Parameters:
+            motion_gate (MotionGate): Scores every frame before it is encoded,
+                for the adaptive frame rate (see motion.py).
+        """
+        self.logger = logging.getLogger(__name__)
+        self.frame_size = frame_size  # (width, height) expected by the writer
+        self.capacity = capacity
+        self.motion_gate = motion_gate
+
+        # (buffer, pixel_format, timestamp_ns) frames, (None, switch, None)
+        # writer switches and (None, None, timestamp_ns) skipped ticks
+        self._buffer = deque()
+        self._pending_frames = 0
+        self._pool = None
+        self._converted = None  # preallocated BGR destination at source size
+        self._resized = None  # preallocated BGR destination at writer size
+        self._conversion_allocations = 0
+        self._cond = threading.Condition()
+        self._writer = None
+        self._last_frame = None  # last frame written, repeated on skipped ticks (adaptive frame rate only)
+        self._held = None  # pool buffer kept out of the pool while it is _last_frame
+        self._busy = False
+        self._running = False
+        self._thread = None
+
+        # Counters exposed through stats()
+        self.frames_submitted = 0
+        self.frames_encoded = 0
+        self.frames_dropped = 0
+        self.backpressure_events = 0  # submits that found frames still waiting
+        self.max_depth = 0
+
+        # Per-frame timings, skipped entirely when metrics are disabled
+        self.metrics = get_metrics()
+        self._convert_time = self.metrics.histogram("pipeline.convert_seconds")
+        self._encode_time = self.metrics.histogram("pipeline.encode_seconds")
+        self._frame_latency = self.metrics.histogram("pipeline.frame_latency_seconds")
+
+    def start(self):
+        with self._cond:
+            if self._running:
+                return
+            self._running = True
+        self._thread = threading.Thread(target=self._run, name="frame-encoder", daemon=True)
+        self._thread.start()
+
+    def stop(self, drain=True):
+        """
+        Stops the encoder thread.
+        Parameters:
+            drain (bool): Encode the frames still waiting in the buffer before stopping.
+        """
+        with self._cond:
+            if not drain:
+                # Writer switches still have to happen so their callbacks run
+                markers = deque(item for item in self._buffer if item[0] is None)
+                for buffer, _, _ in self._buffer:
+                    if buffer is not None:
+                        self._release(buffer)
+                self.frames_dropped += self._pending_frames
+                self._pending_frames = 0
+                self._buffer = markers
+            self._running = False
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def set_writer(self, writer):
+        with self._cond:
+            self._writer = writer
+
+    def switch_writer(self, writer, on_switch=None):
+        """
+        Switches to a new writer on an exact frame boundary: every frame
+        submitted before this call goes to the current writer, every frame
+        submitted after it to the new one, and none are lost in between.
+        Parameters:
+            writer: The already opened writer for the next chunk.
+            on_switch (callable): Called with the previous writer once its last
+                frame has been written. It runs on the encoder thread, so it
+                should only hand the writer off to background work.
+        """
+        with self._cond:
+            self._buffer.append((None, (writer, on_switch), None))
+            self._cond.notify()
+
+    def mark_skipped(self, timestamp_ns):
+        """
+        Records a frame tick that was deliberately not captured. It reaches
+        the writer in order with the frames, so it lands in the right chunk.
+        """
+        with self._cond:
+            self._buffer.append((None, None, timestamp_ns))
+            self._cond.notify()
+
+    def acquire_buffer(self, width, height, channels=4):
+        """
+        Takes a free frame buffer of the given size from the pool, for sources
+        that can decode straight into it. Hand it back with submit_buffer().
+        """
+        shape = (height, width, channels)
+        with self._cond:
+            if self._pool is None or self._pool.shape != shape:
+                # Camera resolution changed (or first frame): size a new pool
+                if self._pool is not None:
+                    self.logger.info(f"Frame size changed to {width}x{height}, reallocating buffers")
+                # One more when the last frame is held back for repeating
+                self._pool = FrameBufferPool(shape, self.capacity + 2 + (self.motion_gate is not None))
+            return self._pool.acquire()
+
+    def release_buffer(self, buffer):
+        """
+        Returns a buffer from acquire_buffer() that won't be submitted, e.g. after a failed read.
+        """
+        with self._cond:
+            self._release(buffer)
+
+    def submit(self, pixels, width, height, timestamp_ns=None):
+        """
+        Queues one RGBA frame given as raw bytes (e.g. a Kivy texture) for encoding. Never blocks.
+        Parameters:
+            timestamp_ns (int): Capture time in ns since the epoch; defaults to now.
+        Returns:
+            bool: False if an older frame had to be dropped to make room.
+        """
+        buffer = self.acquire_buffer(width, height, 4)
+        np.copyto(buffer, np.frombuffer(pixels, np.uint8).reshape(buffer.shape))
+        return self.submit_buffer(buffer, "rgba", timestamp_ns)
+
+    def submit_buffer(self, buffer, pixel_format="bgr", timestamp_ns=None):
+        """
+        Queues a buffer obtained from acquire_buffer(). Never blocks.
+        Returns:
+            bool: False if an older frame had to be dropped to make room.
+        """
+        if timestamp_ns is None:
+            timestamp_ns = time.time_ns()
+        with self._cond:
+            self.frames_submitted += 1
+            if self._pending_frames:
+                self.backpressure_events += 1
+            accepted = True
+            if self._pending_frames >= self.capacity:
+                self._drop_oldest_frame()
+                accepted = False
+            self._buffer.append((buffer, pixel_format, timestamp_ns))
+            self._pending_frames += 1
+            self.max_depth = max(self.max_depth, self._pending_frames)
+            self._cond.notify()
+        return accepted
+
+    def _drop_oldest_frame(self):
+        # Caller holds self._cond. Writer switch markers are never dropped.
+        for i, (buffer, _, _) in enumerate(self._buffer):
+            if buffer is not None:
+                del self._buffer[i]
+                self._release(buffer)
+                self._pending_frames -= 1
+                self.frames_dropped += 1
+                return
+
+    def _release(self, buffer):
+        # Caller holds self._cond
+        if self._pool is not None:
+            self._pool.release(buffer)
+
+    def flush(self, timeout=None):
+        """
+        Waits until every queued frame has been written to the current writer.
+        Returns:
+            bool: True if the buffer drained before the timeout.
+        """
+        with self._cond:
+            return self._cond.wait_for(lambda: not self._buffer and not self._busy, timeout)
+
+    def stats(self):
+        with self._cond:
+            return {
+                "submitted": self.frames_submitted,
+                "encoded": self.frames_encoded,
+                "dropped": self.frames_dropped,
+                "backpressure": self.backpressure_events,
+                "depth": self._pending_frames,
+                "max_depth": self.max_depth,
+                "buffer_allocations": (self._pool.allocations if self._pool else 0) + self._conversion_allocations,
+            }
+
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._buffer or not self._running)
+                if not self._buffer:
+                    break
+                buffer, pixel_format, timestamp_ns = self._buffer.popleft()
+                if buffer is None and pixel_format is not None:
+                    self._switch(pixel_format)
+                    continue
+                if buffer is not None:
+                    self._pending_frames -= 1
+                writer = self._writer
+                self._busy = True
+            if buffer is None:
+                # Outside the lock: the writer may encode the last frame again
+                self._skip(writer, timestamp_ns)
+                continue
+            frame = None
+            try:
+                if self.motion_gate is not None:
+                    self.motion_gate.observe(buffer, timestamp_ns)
+                if writer is not None and self.metrics.enabled:
+                    start = time.perf_counter()
+                    frame = self._convert(buffer, pixel_format)
+                    converted = time.perf_counter()
+                    writer.write(frame, timestamp_ns)
+                    self._convert_time.observe(converted - start)
+                    self._encode_time.observe(time.perf_counter() - converted)
+                    # Capture to written, including the time spent queued
+                    self._frame_latency.observe((time.time_ns() - timestamp_ns) / 1e9)
+                    self.frames_encoded += 1
+                elif writer is not None:
+                    frame = self._convert(buffer, pixel_format)
+                    writer.write(frame, timestamp_ns)
+                    self.frames_encoded += 1
+                else:
+                    # Frame arrived between chunks with no writer to take it
+                    self.frames_dropped += 1
+            except Exception as e:
+                self.logger.error(f"Error encoding frame: {e}")
+            finally:
+                with self._cond:
+                    self._keep_last_frame(frame, buffer)
+                    self._busy = False
+                    self._cond.notify_all()
+
+    def _keep_last_frame(self, frame, buffer):
+        # Caller holds self._cond. Only the adaptive frame rate repeats frames. The frame is
+        # either the pool buffer itself, held back until the next frame replaces it, or one of
+        # the conversion destinations, which only the next frame overwrites; no copy either way
+        if self._held is not None:
+            self._release(self._held)
+            self._held = None
+        if self.motion_gate is None or frame is None:
+            self._release(buffer)
+            return
+        self._last_frame = frame
+        if frame is buffer:
+            self._held = buffer
+        else:
+            self._release(buffer)
+
+    def _switch(self, marker):
+        # Caller holds self._cond
+        writer, on_switch = marker
+        previous, self._writer = self._writer, writer
+        if on_switch is not None:
+            try:
+                on_switch(previous)
+            except Exception as e:
+                self.logger.error(f"Error handing off previous writer: {e}")
+        self._cond.notify_all()
+
+    def _skip(self, writer, timestamp_ns):
+        skip = getattr(writer, "skip", None)
+        try:
+            if skip is not None:
+                skip(timestamp_ns, self._last_frame)
+        except Exception as e:
+            self.logger.error(f"Error recording skipped frame: {e}")
+        finally:
+            with self._cond:
+                self._busy = False
+                self._cond.notify_all()
+
+    def _convert(self, frame, pixel_format):
+        height, width = frame.shape[:2]
+
+        # Converting to BGR (Since OpenCV uses BGR format)
+        conversion = COLOR_CONVERSIONS[pixel_format]
+        if conversion is not None:
+            self._converted = self._destination(self._converted, (height, width, 3))
+            frame = cv2.cvtColor(frame, conversion, dst=self._converted)
+
+        # The writer silently drops frames that don't match its frame size
+        if (width, height) != self.frame_size:
+            self._resized = self._destination(self._resized, (self.frame_size[1], self.frame_size[0], 3))
+            frame = cv2.resize(frame, self.frame_size, dst=self._resized, interpolation=cv2.INTER_AREA)
+        return frame
+
+    def _destination(self, buffer, shape):
+        # Reuse the destination buffer unless the frame size changed
+        if buffer is None or buffer.shape != shape:
+            buffer = np.empty(shape, np.uint8)
+            self._conversion_allocations += 1
+        return buffer
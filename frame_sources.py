@@ -0,0 +1,103 @@
+# frame_sources.py
+import logging
+
+import cv2
+import numpy as np
+
+from config import VIDEO_FRAME_SIZE
+
+
+class FrameSource:
+    """
+    Base class for the frame sources the Recorder captures from. capture()
+    is called once per paced frame and hands the frame to the pipeline.
+    """
+
+    def capture(self, pipeline, timestamp_ns):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class OpenCVCaptureSource(FrameSource):
+    """
+    Frames from cv2.VideoCapture: a camera device index or a video file.
+    Frames are decoded straight into the pipeline's pooled buffers.
+    """
+
+    def __init__(self, source=0, frame_size=VIDEO_FRAME_SIZE, loop=False):
+        self.logger = logging.getLogger(__name__)
+        self.source = source
+        self.loop = loop  # restart a video file when it ends
+        self.capture_device = cv2.VideoCapture(source)
+        if not self.capture_device.isOpened():
+            raise ValueError(f"Could not open video source {source!r}")
+        if isinstance(source, int):
+            self.capture_device.set(cv2.CAP_PROP_FRAME_WIDTH, frame_size[0])
+            self.capture_device.set(cv2.CAP_PROP_FRAME_HEIGHT, frame_size[1])
+        self.width = int(self.capture_device.get(cv2.CAP_PROP_FRAME_WIDTH))
+        self.height = int(self.capture_device.get(cv2.CAP_PROP_FRAME_HEIGHT))
+
+    def capture(self, pipeline, timestamp_ns):
+        buffer = pipeline.acquire_buffer(self.width, self.height, 3)
+        ok, frame = self.capture_device.read(buffer)
+        if not ok and self.loop:
+            self.capture_device.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            ok, frame = self.capture_device.read(buffer)
+        if not ok:
+            pipeline.release_buffer(buffer)
+            self.logger.warning(f"No frame from video source {self.source!r}")
+            return False
+        if frame is not buffer:
+            # The device changed resolution; fall back to copying
+            pipeline.release_buffer(buffer)
+            self.height, self.width = frame.shape[:2]
+            buffer = pipeline.acquire_buffer(self.width, self.height, 3)
+            np.copyto(buffer, frame)
+        pipeline.submit_buffer(buffer, "bgr", timestamp_ns)
+        return True
+
+    def close(self):
+        self.capture_device.release()
+
+
+class SyntheticSource(FrameSource):
+    """
+    Deterministic moving test pattern, for running without a camera and for
+    benchmarks.
+    """
+
+    def __init__(self, frame_size=VIDEO_FRAME_SIZE):
+        self.width, self.height = frame_size
+        self.frame_number = 0
+        self._x = np.arange(self.width, dtype=np.uint16)
+        self._y = np.arange(self.height, dtype=np.uint16)[:, None]
+
+    def capture(self, pipeline, timestamp_ns):
+        buffer = pipeline.acquire_buffer(self.width, self.height, 3)
+        n = self.frame_number
+        buffer[..., 0] = (self._x + n * 4) % 256
+        buffer[..., 1] = (self._y + n * 2) % 256
+        buffer[..., 2] = (n * 8) % 256
+        self.frame_number += 1
+        pipeline.submit_buffer(buffer, "bgr", timestamp_ns)
+        return True
+
+
+def create_frame_source(kind, device=0, path=None, frame_size=VIDEO_FRAME_SIZE):
+    """
+    Parameters:
+        kind (str): "camera", "file" or "synthetic".
+    Returns:
+        FrameSource: The opened source.
+    """
+    if kind == "camera":
+        return OpenCVCaptureSource(device, frame_size)
+    if kind == "file":
+        if not path:
+            raise ValueError("A file source needs a path")
+        return OpenCVCaptureSource(path, frame_size, loop=True)
+    if kind == "synthetic":
+        return SyntheticSource(frame_size)
+    raise ValueError(f"Unknown frame source '{kind}'. Choose one of: camera, file, synthetic")
@@ -0,0 +1,180 @@
+# frame_timing.py
+import os
+import time
+import struct
+
+from config import FRAME_PACING_MAX_CATCH_UP
+
+# Sidecar index layout: a fixed header followed by one fixed-size record per
+# frame, all little-endian, so a reader can seek straight to frame n.
+# Version 2 adds records for frame ticks skipped by the adaptive frame rate:
+# their byte offset is INDEX_SKIPPED and their frame number is that of the
+# last encoded frame, which stands in for them. Version 3 adds INDEX_REPEATED
+# for a skipped tick that constant frame rate writers fill by encoding the
+# last frame again; that one is a frame of the video, with its own number.
+INDEX_MAGIC = b"AVFIDX"
+INDEX_VERSION = 3
+INDEX_HEADER = struct.Struct("<6sHdq")  # magic, version, fps, chunk start (ns since epoch)
+INDEX_RECORD = struct.Struct("<Iqq")  # frame number, capture time (ns since epoch), byte offset (-1 if unknown)
+INDEX_SKIPPED = -2
+INDEX_REPEATED = -3
+
+
+class FramePacer:
+    """
+    Frame pacing on the monotonic clock.
+
+    Deadlines are start + n * period, so sleeping late or a slow capture
+    never accumulates drift. When the loop falls behind it catches up by
+    returning immediately for up to max_catch_up frames; beyond that the
+    missed deadlines are skipped and counted in frames_skipped.
+
+    Capture timestamps are wall-clock nanoseconds derived from a single
+    wall/monotonic anchor taken at start, so clock adjustments during a
+    recording don't make timestamps jump.
+    """
+
+    def __init__(self, fps, max_catch_up=FRAME_PACING_MAX_CATCH_UP):
+        self.period_ns = int(1e9 / fps)
+        self.max_catch_up = max_catch_up
+        self.start_ns = time.monotonic_ns()
+        self._wall_anchor_ns = time.time_ns() - self.start_ns
+        self.tick = 0
+        self.frames_skipped = 0
+        self.frames_late = 0
+
+    def wait(self):
+        """
+        Sleeps until the next frame deadline.
+        Returns:
+            int: The tick number of the frame to capture.
+        """
+        deadline = self.start_ns + self.tick * self.period_ns
+        now = time.monotonic_ns()
+        if now < deadline:
+            time.sleep((deadline - now) / 1e9)
+        else:
+            behind = (now - deadline) // self.period_ns
+            if behind > self.max_catch_up:
+                self.tick += behind
+                self.frames_skipped += behind
+            elif behind:
+                self.frames_late += 1
+        tick = self.tick
+        self.tick += 1
+        return tick
+
+    def timestamp_ns(self):
+        """
+        Returns:
+            int: The current time as nanoseconds since the epoch, on the monotonic clock.
+        """
+        return self._wall_anchor_ns + time.monotonic_ns()
+
+    def stats(self):
+        return {"ticks": self.tick, "skipped": self.frames_skipped, "late": self.frames_late}
+
+
+class FrameIndexWriter:
+    """
+    Writes the binary sidecar index of one chunk: frame number -> capture
+    timestamp -> byte offset in the video file (-1 where the encoder can't
+    tell).
+    """
+
+    def __init__(self, path, fps, start_ns):
+        self.path = path
+        self._file = open(path, 'wb')
+        self._file.write(INDEX_HEADER.pack(INDEX_MAGIC, INDEX_VERSION, fps, start_ns))
+
+    def append(self, frame_number, timestamp_ns, byte_offset=-1):
+        self._file.write(INDEX_RECORD.pack(frame_number, timestamp_ns, byte_offset))
+
+    def close(self):
+        self._file.close()
+
+
+def index_path_for(video_path):
+    return os.path.splitext(video_path)[0] + ".idx"
+
+
+def read_frame_index(path):
+    """
+    Reads a chunk's sidecar index.
+    Returns:
+        tuple: (header, records) where header is a dict with "version", "fps"
+        and "start_ns" and records is a list of (frame_number, timestamp_ns, byte_offset).
+    """
+    with open(path, 'rb') as f:
+        magic, version, fps, start_ns = INDEX_HEADER.unpack(f.read(INDEX_HEADER.size))
+        if magic != INDEX_MAGIC:
+            raise ValueError(f"{path} is not a frame index")
+        data = f.read()
+    # Ignore a trailing partial record left by a crash
+    data = data[:len(data) - len(data) % INDEX_RECORD.size]
+    header = {"version": version, "fps": fps, "start_ns": start_ns}
+    return header, list(INDEX_RECORD.iter_unpack(data))
+
+
+def find_frame(records, timestamp_ns):
+    """
+    Returns:
+        tuple or None: The last index record captured at or before timestamp_ns.
+    """
+    lo, hi = 0, len(records)
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if records[mid][1] <= timestamp_ns:
+            lo = mid + 1
+        else:
+            hi = mid
+    return records[lo - 1] if lo else None
+
+
+class IndexedWriter:
+    """
+    Wraps a video writer so every written frame is also recorded in the
+    chunk's sidecar index.
+    """
+
+    def __init__(self, writer, video_path, fps, start_ns):
+        self.writer = writer
+        self.video_path = video_path
+        self.index = FrameIndexWriter(index_path_for(video_path), fps, start_ns)
+        self.frames_written = 0
+
+    def write(self, frame, timestamp_ns):
+        # OpenCV doesn't expose the container offset; other writers may
+        tell = getattr(self.writer, "tell", None)
+        byte_offset = tell() if tell else -1
+        self.writer.write(frame)
+        self.index.append(self.frames_written, timestamp_ns, byte_offset)
+        self.frames_written += 1
+
+    def skip(self, timestamp_ns, frame=None):
+        """
+        Records a frame tick that was not captured, so the index still has
+        an entry for every tick of the chunk. A writer whose container has a
+        constant frame rate gets frame, the last one written, again so the
+        video still plays back in real time.
+        """
+        if frame is not None and getattr(self.writer, "constant_frame_rate", False):
+            self.writer.write(frame)
+            self.index.append(self.frames_written, timestamp_ns, INDEX_REPEATED)
+            self.frames_written += 1
+        else:
+            self.index.append(max(self.frames_written - 1, 0), timestamp_ns, INDEX_SKIPPED)
+
+    def release(self):
+        self.writer.release()
+        self.index.close()
+
+    def discard(self):
+        """
+        Releases the writer and deletes the chunk and its index; used for a
+        pre-opened chunk that never received a frame.
+        """
+        self.release()
+        for path in (self.video_path, self.index.path):
+            if os.path.exists(path):
+                os.remove(path)
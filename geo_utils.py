@@ -0,0 +1,178 @@
+# geo_utils.py
+from collections import deque
+from math import radians, cos, sin, asin, sqrt
+
+import numpy as np
+
+from config import GEOLOCATION_SMOOTHING_WINDOW
+
+EARTH_RADIUS = 6371000  # meters
+
+_GEOHASH_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+
+def geohash_encode(latitude, longitude, precision=6):
+    """
+    Encodes a position as a geohash string.
+    Parameters:
+        latitude (float): Latitude in decimal degrees.
+        longitude (float): Longitude in decimal degrees.
+        precision (int): Number of characters; 5 is roughly a 5 km cell, 6 roughly 1 km, 7 roughly 150 m.
+    Returns:
+        str: The geohash of the cell containing the position.
+    """
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    geohash = []
+    bits = 0
+    bit_count = 0
+    even = True  # Geohash interleaves bits starting with longitude
+
+    while len(geohash) < precision:
+        if even:
+            mid = (lon_range[0] + lon_range[1]) / 2
+            if longitude >= mid:
+                bits = (bits << 1) | 1
+                lon_range[0] = mid
+            else:
+                bits <<= 1
+                lon_range[1] = mid
+        else:
+            mid = (lat_range[0] + lat_range[1]) / 2
+            if latitude >= mid:
+                bits = (bits << 1) | 1
+                lat_range[0] = mid
+            else:
+                bits <<= 1
+                lat_range[1] = mid
+        even = not even
+        bit_count += 1
+
+        if bit_count == 5:
+            geohash.append(_GEOHASH_BASE32[bits])
+            bits = 0
+            bit_count = 0
+
+    return "".join(geohash)
+
+
+def geohash_decode(geohash):
+    """
+    Decodes a geohash to the center of its cell.
+    Returns:
+        tuple: (latitude, longitude) of the cell center.
+    """
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    even = True
+
+    for char in geohash:
+        value = _GEOHASH_BASE32.index(char)
+        for shift in range(4, -1, -1):
+            bit = (value >> shift) & 1
+            target = lon_range if even else lat_range
+            mid = (target[0] + target[1]) / 2
+            if bit:
+                target[0] = mid
+            else:
+                target[1] = mid
+            even = not even
+
+    return (lat_range[0] + lat_range[1]) / 2, (lon_range[0] + lon_range[1]) / 2
+
+
+def haversine_distance(lat1, lon1, lat2, lon2):
+    """
+    Calculates the Haversine distance between two points in meters.
+    """
+    # Convert decimal degrees to radians
+    lon1, lat1, lon2, lat2 = map(radians, [lon1, lat1, lon2, lat2])
+
+    # Haversine formula
+    dlon = lon2 - lon1
+    dlat = lat2 - lat1
+    a = sin(dlat/2)**2 + cos(lat1) * cos(lat2) * sin(dlon/2)**2
+    c = 2 * asin(sqrt(a))
+
+    return c * EARTH_RADIUS
+
+
+def haversine_batch(lat1, lon1, lat2, lon2):
+    """
+    Vectorized haversine_distance over arrays (or scalars) that broadcast
+    against each other, e.g. one point against a whole track.
+    Returns:
+        numpy.ndarray: Distances in meters.
+    """
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(v, dtype=np.float64)) for v in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    # Rounding can push a just past 1 for antipodal points
+    return 2 * EARTH_RADIUS * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def segment_distances(latitudes, longitudes):
+    """
+    Returns:
+        numpy.ndarray: The length in meters of each of the len - 1 segments of a track.
+    """
+    latitudes = np.asarray(latitudes, dtype=np.float64)
+    longitudes = np.asarray(longitudes, dtype=np.float64)
+    return haversine_batch(latitudes[:-1], longitudes[:-1], latitudes[1:], longitudes[1:])
+
+
+def cumulative_distance(latitudes, longitudes):
+    """
+    Returns:
+        numpy.ndarray: Distance travelled in meters up to each point of the track, starting at 0.
+    """
+    distances = np.zeros(len(latitudes), dtype=np.float64)
+    if len(distances) > 1:
+        np.cumsum(segment_distances(latitudes, longitudes), out=distances[1:])
+    return distances
+
+
+def downsample_track(latitudes, longitudes, spacing):
+    """
+    Thins a track to roughly one point every spacing meters travelled,
+    always keeping the first and last points. Stationary stretches collapse
+    to a single point.
+    Returns:
+        numpy.ndarray: Indices of the points to keep, ascending.
+    """
+    if len(latitudes) < 2:
+        return np.arange(len(latitudes))
+    travelled = cumulative_distance(latitudes, longitudes)
+    # First point of each spacing-sized bucket of distance travelled
+    _, indices = np.unique(np.floor(travelled / spacing), return_index=True)
+    if indices[-1] != len(travelled) - 1:
+        indices = np.append(indices, len(travelled) - 1)
+    return indices
+
+
+class PositionSmoother:
+    """
+    Median filter over the last few position fixes.
+
+    IP geolocation jumps between nearby exit points from one lookup to the
+    next. A single outlying fix doesn't move the median, so it can't register
+    as movement, while a real move shows up once it is in the majority of
+    the window.
+    """
+
+    def __init__(self, window=GEOLOCATION_SMOOTHING_WINDOW):
+        self._latitudes = deque(maxlen=window)
+        self._longitudes = deque(maxlen=window)
+
+    def update(self, latitude, longitude):
+        """
+        Adds a fix.
+        Returns:
+            tuple: The smoothed (latitude, longitude).
+        """
+        self._latitudes.append(latitude)
+        self._longitudes.append(longitude)
+        return float(np.median(self._latitudes)), float(np.median(self._longitudes))
+
+    def reset(self):
+        self._latitudes.clear()
+        self._longitudes.clear()
@@ -0,0 +1,247 @@
+# http_client.py
+import time
+import random
+import logging
+import threading
+from collections import deque
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from config import (HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT, HTTP_MAX_RETRIES, HTTP_BACKOFF_BASE,
+                    HTTP_BACKOFF_MAX, HTTP_POOL_SIZE, CIRCUIT_FAILURE_THRESHOLD, CIRCUIT_RESET_TIMEOUT)
+
+# Responses worth retrying; anything else is returned to the caller as-is
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+# Failures worth retrying, e.g. a mobile link dropping mid-response; other
+# RequestExceptions (an invalid URL, ...) are raised straight away
+RETRY_EXCEPTIONS = (requests.exceptions.ConnectionError, requests.exceptions.Timeout,
+                    requests.exceptions.ChunkedEncodingError)
+
+
+class CircuitOpenError(requests.exceptions.ConnectionError):
+    """
+    Raised without touching the network while a host's circuit is open.
+    Subclasses ConnectionError so existing RequestException handlers catch it.
+    """
+
+
+class CircuitBreaker:
+    """
+    Fails fast after CIRCUIT_FAILURE_THRESHOLD consecutive failures. After
+    CIRCUIT_RESET_TIMEOUT seconds a single trial request is let through; its
+    outcome closes the circuit again or keeps it open for another period.
+    """
+
+    def __init__(self, failure_threshold=CIRCUIT_FAILURE_THRESHOLD, reset_timeout=CIRCUIT_RESET_TIMEOUT):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._state()
+
+    def _state(self):
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half-open"
+        return "open"
+
+    def allow(self):
+        with self._lock:
+            state = self._state()
+            if state == "closed":
+                return True
+            if state == "half-open" and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial_in_flight = False
+            if self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+
+
+class EndpointStats:
+    """
+    Request counters and latency samples for one endpoint.
+    """
+
+    def __init__(self, window=256):
+        self.requests = 0
+        self.errors = 0
+        self.retries = 0
+        self.rejected = 0  # short-circuited by an open breaker
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+        self._samples = deque(maxlen=window)
+
+    def observe(self, latency):
+        self.requests += 1
+        self.total_latency += latency
+        self.max_latency = max(self.max_latency, latency)
+        self._samples.append(latency)
+
+    def snapshot(self):
+        samples = sorted(self._samples)
+
+        def percentile(p):
+            if not samples:
+                return None
+            return samples[min(len(samples) - 1, int(p * len(samples)))]
+
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "retries": self.retries,
+            "rejected": self.rejected,
+            "mean_latency": self.total_latency / self.requests if self.requests else None,
+            "p50_latency": percentile(0.50),
+            "p95_latency": percentile(0.95),
+            "max_latency": self.max_latency,
+        }
+
+
+class HttpClient:
+    """
+    Shared HTTP client with keep-alive connection pooling, connect/read
+    timeouts, retries with jittered exponential backoff, a circuit breaker
+    per host and latency statistics per endpoint.
+    """
+
+    def __init__(self, connect_timeout=HTTP_CONNECT_TIMEOUT, read_timeout=HTTP_READ_TIMEOUT,
+                 max_retries=HTTP_MAX_RETRIES, backoff_base=HTTP_BACKOFF_BASE, backoff_max=HTTP_BACKOFF_MAX,
+                 pool_size=HTTP_POOL_SIZE, failure_threshold=CIRCUIT_FAILURE_THRESHOLD,
+                 reset_timeout=CIRCUIT_RESET_TIMEOUT):
+        self.logger = logging.getLogger(__name__)
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self._breakers = {}
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def breaker(self, host):
+        with self._lock:
+            if host not in self._breakers:
+                self._breakers[host] = CircuitBreaker(self.failure_threshold, self.reset_timeout)
+            return self._breakers[host]
+
+    def _endpoint_stats(self, endpoint):
+        with self._lock:
+            if endpoint not in self._stats:
+                self._stats[endpoint] = EndpointStats()
+            return self._stats[endpoint]
+
+    def get(self, url, params=None, timeout=None):
+        """
+        Sends a GET request.
+        Parameters:
+            url (str): Request URL.
+            params (dict): Query parameters.
+            timeout (tuple): (connect, read) timeout overriding the client default.
+        Returns:
+            requests.Response: The final response; HTTP errors are not raised here.
+        Raises:
+            CircuitOpenError: If the host's circuit is open.
+            requests.exceptions.RequestException: If every attempt failed.
+        """
+        parts = urlsplit(url)
+        endpoint = f"{parts.netloc}{parts.path}"
+        breaker = self.breaker(parts.netloc)
+        stats = self._endpoint_stats(endpoint)
+
+        for attempt in range(self.max_retries + 1):
+            if not breaker.allow():
+                stats.rejected += 1
+                raise CircuitOpenError(f"Circuit open for {parts.netloc}, not sending request")
+
+            if attempt:
+                stats.retries += 1
+            start = time.monotonic()
+            try:
+                response = self.session.get(url, params=params, timeout=timeout or self.timeout)
+            except requests.exceptions.RequestException as e:
+                # Every failure is recorded, or a failed half-open trial would keep the circuit open forever
+                stats.observe(time.monotonic() - start)
+                stats.errors += 1
+                breaker.record_failure()
+                if attempt == self.max_retries or not isinstance(e, RETRY_EXCEPTIONS):
+                    raise
+                self.logger.warning(f"Request to {endpoint} failed ({e}), retrying")
+                self._backoff(attempt)
+                continue
+
+            stats.observe(time.monotonic() - start)
+            if response.status_code in RETRY_STATUSES:
+                stats.errors += 1
+                breaker.record_failure()
+                if attempt < self.max_retries:
+                    self.logger.warning(f"Request to {endpoint} returned {response.status_code}, retrying")
+                    response.close()
+                    self._backoff(attempt)
+                    continue
+            else:
+                breaker.record_success()
+            return response
+
+    def _backoff(self, attempt):
+        # Full jitter: sleep a random time up to the exponential backoff cap
+        time.sleep(random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt))))
+
+    def stats(self):
+        """
+        Returns:
+            dict: Latency and error statistics per endpoint, plus breaker states per host.
+        """
+        with self._lock:
+            endpoints = dict(self._stats)
+            breakers = dict(self._breakers)
+        return {
+            "endpoints": {endpoint: s.snapshot() for endpoint, s in endpoints.items()},
+            "circuits": {host: b.state for host, b in breakers.items()},
+        }
+
+    def close(self):
+        self.session.close()
+
+
+_shared_client = None
+_shared_lock = threading.Lock()
+
+
+def get_http_client():
+    """
+    Returns:
+        HttpClient: The process-wide client, created on first use.
+    """
+    global _shared_client
+    with _shared_lock:
+        if _shared_client is None:
+            _shared_client = HttpClient()
+        return _shared_client
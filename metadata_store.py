@@ -0,0 +1,425 @@
+# metadata_store.py
+import os
+import json
+import time
+import uuid
+import sqlite3
+import logging
+import threading
+
+from metrics import get_metrics
+
+from config import METADATA_BATCH_SIZE, METADATA_FLUSH_INTERVAL, METADATA_COMPACT_THRESHOLD
+
+# The single JSON array that held the records before the other backends existed
+LEGACY_FILENAME = "weather_videos.json"
+
+
+class MetadataStore:
+    """
+    Base class for the weather/video metadata backends.
+
+    Records are buffered in memory and written in batches, either when
+    METADATA_BATCH_SIZE records are pending or when METADATA_FLUSH_INTERVAL
+    seconds have passed since the last write. Subclasses only implement
+    _write_batch(), _read_all(), _delete() and _reset().
+    """
+
+    filename = None
+
+    def __init__(self, directory, batch_size=METADATA_BATCH_SIZE, flush_interval=METADATA_FLUSH_INTERVAL):
+        self.logger = logging.getLogger(__name__)
+        self.directory = directory
+        self.path = os.path.join(directory, self.filename)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+
+        self._lock = threading.RLock()
+        self._pending = []
+        self._last_flush = time.monotonic()
+
+        self._write_time = get_metrics().histogram("metadata.write_seconds")
+        self._records_written = get_metrics().counter("metadata.records_written")
+
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+
+    def append(self, record):
+        """
+        Queues a record for writing. The record must carry a unique "id".
+        """
+        with self._lock:
+            self._pending.append(record)
+            if (len(self._pending) >= self.batch_size or
+                    time.monotonic() - self._last_flush >= self.flush_interval):
+                self.flush()
+
+    def update(self, record):
+        """
+        Replaces the stored record that has the same "id".
+        """
+        self.append(record)
+
+    def update_many(self, records):
+        """
+        Replaces several stored records, written as one batch.
+        """
+        with self._lock:
+            self._pending.extend(records)
+            self.flush()
+
+    def patch(self, record_id, **fields):
+        """
+        Sets fields on the stored record with this "id".
+        Returns:
+            dict or None: The updated record, or None if there is no such record.
+        """
+        updated = self.patch_many({record_id: fields})
+        return updated[0] if updated else None
+
+    def patch_many(self, patches):
+        """
+        Sets fields on several stored records, written as one batch. Fields
+        are set on the records as stored now rather than on copies read
+        earlier, so writers of different fields (weather backfill, thumbnail
+        links) don't revert each other's changes.
+        Parameters:
+            patches (dict): Record id -> dict of fields to set.
+        Returns:
+            list: The updated records; ids with no stored record are skipped.
+        """
+        with self._lock:
+            self.flush()
+            updated = [dict(record, **patches[record["id"]]) for record in self._find(patches)]
+            if updated:
+                self.update_many(updated)
+            return updated
+
+    def flush(self):
+        with self._lock:
+            if self._pending:
+                batch, self._pending = self._pending, []
+                start = time.perf_counter()
+                try:
+                    self._write_batch(batch)
+                except Exception as e:
+                    # Kept for the next flush; records carry an "id", so rewriting part of a batch is harmless
+                    self._pending[:0] = batch
+                    self.logger.error(f"Could not write {len(batch)} metadata records to {self.path}: {e}")
+                    raise
+                self._write_time.observe(time.perf_counter() - start)
+                self._records_written.inc(len(batch))
+                self.logger.debug(f"Wrote {len(batch)} metadata records to {self.path}")
+            self._last_flush = time.monotonic()
+
+    def delete_video_records(self, video_paths):
+        """
+        Deletes every record whose video_path is one of video_paths, e.g. when
+        the storage manager evicts a chunk.
+        """
+        with self._lock:
+            self.flush()
+            self._delete(set(video_paths))
+
+    def records(self):
+        """
+        Returns:
+            iterator: Every stored record, oldest first.
+        """
+        with self._lock:
+            self.flush()
+            return iter(list(self._read_all()))
+
+    def archive(self, archive_path):
+        """
+        Writes every stored record to archive_path as a JSON array (the format
+        of the weather_videos_<timestamp>.json archives) and empties the store.
+        """
+        with self._lock:
+            self.flush()
+            tmp_path = archive_path + ".tmp"
+            with open(tmp_path, 'w') as f:
+                f.write("[")
+                for i, record in enumerate(self._read_all()):
+                    f.write(",\n" if i else "\n")
+                    f.write(json.dumps(record, indent=4))
+                f.write("\n]")
+            os.replace(tmp_path, archive_path)
+            self._reset()
+
+    def close(self):
+        self.flush()
+
+    def import_legacy(self):
+        """
+        Imports the records of a weather_videos.json left by a version that
+        stored them as one JSON array, then renames that file to
+        weather_videos.json.imported so it is imported only once. Records
+        without an "id" get one derived from their content, so an import
+        interrupted before the rename doesn't duplicate them when repeated.
+        Returns:
+            int: The number of records imported.
+        """
+        legacy_path = os.path.join(self.directory, LEGACY_FILENAME)
+        if legacy_path == self.path or not os.path.exists(legacy_path):
+            return 0
+        try:
+            with open(legacy_path, 'r') as f:
+                data = json.load(f)
+        except ValueError:
+            self.logger.warning(f"Not importing unreadable {legacy_path}")
+            return 0
+        records = [record if record.get("id") else
+                   dict(record, id=uuid.uuid5(uuid.NAMESPACE_URL, json.dumps(record, sort_keys=True)).hex)
+                   for record in data if isinstance(record, dict)]
+        with self._lock:
+            self._pending.extend(records)
+            self.flush()
+        os.replace(legacy_path, legacy_path + ".imported")
+        self.logger.info(f"Imported {len(records)} records from {legacy_path} into {self.path}")
+        return len(records)
+
+    def _write_batch(self, batch):
+        raise NotImplementedError
+
+    def _read_all(self):
+        raise NotImplementedError
+
+    def _find(self, ids):
+        # Stored records whose "id" is in ids; backends with an index on id override this
+        return [record for record in self._read_all() if record.get("id") in ids]
+
+    def _delete(self, video_paths):
+        raise NotImplementedError
+
+    def _reset(self):
+        raise NotImplementedError
+
+
+class JsonLinesStore(MetadataStore):
+    """
+    Append-only JSON Lines log. Each batch is appended and fsync'ed, so the
+    cost of a write does not depend on how many records are already stored
+    and a crash can at most lose the last, partially written line.
+
+    Updated records are appended again with the same "id" and deletions
+    are appended as tombstone lines; once METADATA_COMPACT_THRESHOLD
+    superseded lines have accumulated the log is rewritten keeping only the
+    latest version of each live record.
+    """
+
+    filename = "weather_videos.jsonl"
+
+    def __init__(self, directory, compact_threshold=METADATA_COMPACT_THRESHOLD, **kwargs):
+        super().__init__(directory, **kwargs)
+        self.compact_threshold = compact_threshold
+        self._superseded = 0
+        self._file = open(self.path, 'a')
+
+    def update(self, record):
+        with self._lock:
+            self._superseded += 1
+            super().update(record)
+
+    def update_many(self, records):
+        with self._lock:
+            self._superseded += len(records)
+            super().update_many(records)
+
+    def _write_batch(self, batch):
+        self._file.write("".join(json.dumps(record) + "\n" for record in batch))
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        if self._superseded >= self.compact_threshold:
+            self.compact()
+
+    def _read_all(self):
+        latest = {}
+        with open(self.path, 'r') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # Torn write from a crash, skip it
+                    self.logger.warning(f"Skipping corrupt line in {self.path}")
+                    continue
+                deleted = record.get("deleted_video_paths")
+                if deleted is not None:
+                    deleted = set(deleted)
+                    latest = {key: r for key, r in latest.items() if r.get("video_path") not in deleted}
+                    continue
+                latest[record.get("id", len(latest))] = record
+        return latest.values()
+
+    def _delete(self, video_paths):
+        self._superseded += len(video_paths)
+        self._write_batch([{"deleted_video_paths": sorted(video_paths)}])
+
+    def compact(self):
+        """
+        Rewrites the log with only the latest version of each record.
+        """
+        with self._lock:
+            records = list(self._read_all())
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, 'w') as f:
+                f.write("".join(json.dumps(record) + "\n" for record in records))
+                f.flush()
+                os.fsync(f.fileno())
+            self._file.close()
+            os.replace(tmp_path, self.path)
+            self._file = open(self.path, 'a')
+            self._superseded = 0
+            self.logger.info(f"Compacted {self.path} to {len(records)} records")
+
+    def _reset(self):
+        self._file.close()
+        self._file = open(self.path, 'w')
+        self._superseded = 0
+
+    def close(self):
+        with self._lock:
+            super().close()
+            self._file.close()
+
+
+class SqliteStore(MetadataStore):
+    """
+    SQLite backend with indexes on timestamp and video_path. Each batch is
+    written in a single transaction.
+    """
+
+    filename = "weather_videos.db"
+
+    def __init__(self, directory, **kwargs):
+        super().__init__(directory, **kwargs)
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS records ("
+                "seq INTEGER PRIMARY KEY AUTOINCREMENT, "
+                "id TEXT UNIQUE, "
+                "timestamp TEXT, "
+                "video_path TEXT, "
+                "record TEXT)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_records_timestamp ON records (timestamp)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_records_video_path ON records (video_path)")
+
+    def _write_batch(self, batch):
+        rows = [(record.get("id"), record.get("timestamp"), record.get("video_path"), json.dumps(record))
+                for record in batch]
+        with self._conn:
+            self._conn.executemany(
+                "INSERT INTO records (id, timestamp, video_path, record) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(id) DO UPDATE SET timestamp=excluded.timestamp, "
+                "video_path=excluded.video_path, record=excluded.record",
+                rows,
+            )
+
+    def _read_all(self):
+        for (record,) in self._conn.execute("SELECT record FROM records ORDER BY seq"):
+            yield json.loads(record)
+
+    def _find(self, ids):
+        ids = list(ids)
+        records = []
+        # Stays under SQLite's limit on the number of query parameters
+        for start in range(0, len(ids), 500):
+            chunk = ids[start:start + 500]
+            rows = self._conn.execute(f"SELECT record FROM records WHERE id IN ({', '.join('?' * len(chunk))}) "
+                                      "ORDER BY seq", chunk).fetchall()
+            records += [json.loads(record) for (record,) in rows]
+        return records
+
+    def find_by_video_path(self, video_path):
+        with self._lock:
+            self.flush()
+            rows = self._conn.execute("SELECT record FROM records WHERE video_path = ? ORDER BY seq",
+                                      (video_path,)).fetchall()
+        return [json.loads(record) for (record,) in rows]
+
+    def _delete(self, video_paths):
+        with self._conn:
+            self._conn.executemany("DELETE FROM records WHERE video_path = ?", [(path,) for path in video_paths])
+
+    def _reset(self):
+        with self._conn:
+            self._conn.execute("DELETE FROM records")
+
+    def close(self):
+        with self._lock:
+            super().close()
+            self._conn.close()
+
+
+class JsonArrayStore(MetadataStore):
+    """
+    The original weather_videos.json format: one JSON array rewritten on every
+    flush. Kept for tools that still read the file directly; batching at least
+    amortises the rewrite over several records.
+    """
+
+    filename = LEGACY_FILENAME
+
+    def __init__(self, directory, **kwargs):
+        super().__init__(directory, **kwargs)
+        if not os.path.exists(self.path):
+            self._reset()
+
+    def _write_batch(self, batch):
+        data = self._load()
+        ids = {record.get("id"): i for i, record in enumerate(data) if record.get("id")}
+        for record in batch:
+            if record.get("id") in ids:
+                data[ids[record["id"]]] = record
+            else:
+                data.append(record)
+        self._dump(data)
+
+    def _read_all(self):
+        return self._load()
+
+    def _delete(self, video_paths):
+        self._dump([record for record in self._load() if record.get("video_path") not in video_paths])
+
+    def _load(self):
+        with open(self.path, 'r') as f:
+            return json.load(f)
+
+    def _dump(self, data):
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(data, f, indent=4)
+        os.replace(tmp_path, self.path)
+
+    def _reset(self):
+        self._dump([])
+
+
+METADATA_BACKENDS = {
+    "jsonl": JsonLinesStore,
+    "sqlite": SqliteStore,
+    "json": JsonArrayStore,
+}
+
+
+def create_metadata_store(backend, directory, **kwargs):
+    """
+    Creates the metadata store selected by METADATA_BACKEND. Records left in
+    a weather_videos.json by earlier versions are imported into it.
+    Parameters:
+        backend (str): One of "jsonl", "sqlite" or "json".
+        directory (str): Directory holding the store file.
+    Returns:
+        MetadataStore: The opened store.
+    """
+    try:
+        store_class = METADATA_BACKENDS[backend]
+    except KeyError:
+        raise ValueError(f"Unknown metadata backend '{backend}'. Choose one of: {', '.join(METADATA_BACKENDS)}")
+    store = store_class(directory, **kwargs)
+    store.import_legacy()
+    return store
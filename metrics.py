@@ -0,0 +1,293 @@
+# metrics.py
+import os
+import json
+import bisect
+import logging
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from config import METRICS_ENABLED
+
+# Histogram bucket upper bounds in seconds: 10 us doubling up to ~168 s
+HISTOGRAM_BOUNDS = [10e-6 * 2 ** i for i in range(25)]
+
+
+class Counter:
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def snapshot(self):
+        return self.value
+
+
+class Gauge:
+    def __init__(self):
+        self.value = None
+
+    def set(self, value):
+        self.value = value
+
+    def snapshot(self):
+        return self.value
+
+
+class Histogram:
+    """
+    Latency histogram over fixed, exponentially growing buckets. Recording a
+    value is a binary search and an increment; percentiles are estimated
+    by interpolating within a bucket, so they are accurate to within that
+    bucket (a factor of two).
+    """
+
+    def __init__(self, bounds=HISTOGRAM_BOUNDS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        bucket = bisect.bisect_left(self.bounds, value)
+        with self._lock:
+            self.counts[bucket] += 1
+            self.count += 1
+            self.total += value
+            if value > self.max:
+                self.max = value
+
+    def percentile(self, p):
+        with self._lock:
+            if not self.count:
+                return None
+            rank = p / 100 * self.count
+            seen = 0
+            for bucket, count in enumerate(self.counts):
+                if count and seen + count >= rank:
+                    lower = self.bounds[bucket - 1] if bucket else 0.0
+                    upper = min(self.bounds[bucket], self.max) if bucket < len(self.bounds) else self.max
+                    return lower + (upper - lower) * max(rank - seen, 0) / count
+                seen += count
+            return self.max
+
+    def snapshot(self):
+        if not self.count:
+            return {"count": 0}
+        return {
+            "count": self.count,
+            "mean_ms": 1000 * self.total / self.count,
+            "p50_ms": 1000 * self.percentile(50),
+            "p99_ms": 1000 * self.percentile(99),
+            "max_ms": 1000 * self.max,
+        }
+
+
+class NullMetric:
+    """
+    Stands in for every metric when metrics are disabled; recording is a no-op call.
+    """
+
+    value = None
+
+    def inc(self, amount=1):
+        pass
+
+    def set(self, value):
+        pass
+
+    def observe(self, value):
+        pass
+
+    def snapshot(self):
+        return None
+
+
+NULL_METRIC = NullMetric()
+
+
+class MetricsRegistry:
+    """
+    Named counters, gauges and histograms, created on first use. Components
+    that already keep their own counters (the frame pipeline, the HTTP
+    client, ...) register a collector instead, a function returning a dict
+    that is only called when a snapshot is taken.
+    """
+
+    enabled = True
+
+    def __init__(self):
+        self.logger = logging.getLogger(__name__)
+        self._metrics = {}
+        self._collectors = {}
+        self._lock = threading.Lock()
+
+    def _get(self, name, metric_class):
+        metric = self._metrics.get(name)
+        if metric is None:
+            with self._lock:
+                metric = self._metrics.setdefault(name, metric_class())
+        return metric
+
+    def counter(self, name):
+        return self._get(name, Counter)
+
+    def gauge(self, name):
+        return self._get(name, Gauge)
+
+    def histogram(self, name):
+        return self._get(name, Histogram)
+
+    def register_collector(self, name, collect):
+        """
+        Adds (or replaces) a collector whose dict appears under name in snapshots.
+        """
+        with self._lock:
+            self._collectors[name] = collect
+
+    def unregister_collector(self, name):
+        with self._lock:
+            self._collectors.pop(name, None)
+
+    def snapshot(self):
+        """
+        Returns:
+            dict: Every metric and collector, by name.
+        """
+        with self._lock:
+            metrics, collectors = dict(self._metrics), dict(self._collectors)
+        snapshot = {name: metric.snapshot() for name, metric in sorted(metrics.items())}
+        for name, collect in sorted(collectors.items()):
+            try:
+                snapshot[name] = collect()
+            except Exception as e:
+                self.logger.debug(f"Metrics collector {name} failed: {e}")
+        return snapshot
+
+    def summary(self):
+        """
+        Returns:
+            str: One line with the headline recording numbers, for the status label.
+        """
+        snapshot = self.snapshot()
+        pipeline = snapshot.get("pipeline") or {}
+        encode = snapshot.get("pipeline.encode_seconds") or {}
+        latency = snapshot.get("pipeline.frame_latency_seconds") or {}
+        fps = snapshot.get("recorder.fps")
+        parts = []
+        if fps is not None:
+            parts.append(f"{fps:.1f} fps")
+        if pipeline:
+            parts.append(f"dropped {pipeline.get('dropped', 0)}")
+        if encode.get("count"):
+            parts.append(f"encode {encode['mean_ms']:.1f} ms")
+        if latency.get("count"):
+            parts.append(f"latency p99 {latency['p99_ms']:.0f} ms")
+        return ", ".join(parts)
+
+
+class NullRegistry(MetricsRegistry):
+    """
+    Registry used when METRICS_ENABLED is False: every metric is NULL_METRIC,
+    collectors are never called and snapshots are empty.
+    """
+
+    enabled = False
+
+    def _get(self, name, metric_class):
+        return NULL_METRIC
+
+    def register_collector(self, name, collect):
+        pass
+
+    def snapshot(self):
+        return {}
+
+    def summary(self):
+        return ""
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_metrics():
+    """
+    Returns:
+        MetricsRegistry: The process-wide registry (a NullRegistry if metrics are disabled).
+    """
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = MetricsRegistry() if METRICS_ENABLED else NullRegistry()
+    return _registry
+
+
+def format_text(snapshot, prefix=""):
+    """
+    Flattens a snapshot to "name value" lines, e.g. "pipeline.dropped 3".
+    """
+    lines = []
+    for name, value in snapshot.items():
+        key = f"{prefix}{name}"
+        if isinstance(value, dict):
+            lines.extend(format_text(value, key + "."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            lines.append(f"{key} {value:g}" if isinstance(value, float) else f"{key} {value}")
+    return lines
+
+
+class MetricsExporter:
+    """
+    Makes snapshots available outside the process: dump() writes one to a
+    JSON file, and serve() exposes them as plain text on a localhost port.
+    """
+
+    def __init__(self, registry=None, dump_path=None):
+        self.logger = logging.getLogger(__name__)
+        self.registry = registry or get_metrics()
+        self.dump_path = dump_path
+        self._server = None
+
+    def dump(self):
+        if self.dump_path is None or not self.registry.enabled:
+            return
+        tmp_path = self.dump_path + ".tmp"
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(self.registry.snapshot(), f, indent=2, default=str)
+            os.replace(tmp_path, self.dump_path)
+        except OSError as e:
+            self.logger.warning(f"Could not write metrics to {self.dump_path}: {e}")
+
+    def serve(self, port, host="127.0.0.1"):
+        registry = self.registry
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                payload = ("\n".join(format_text(registry.snapshot())) + "\n").encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; charset=utf-8")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, name="metrics-http", daemon=True).start()
+        self.logger.info(f"Serving metrics on http://{host}:{self._server.server_address[1]}/")
+
+    def close(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+        self.dump()
@@ -0,0 +1,112 @@
+# motion.py
+import time
+import threading
+
+import numpy as np
+
+from config import MOTION_THRESHOLD, MOTION_STATIC_AFTER, MOTION_STATIC_STRIDE, MOTION_DOWNSAMPLE
+
+
+class MotionGate:
+    """
+    Adaptive frame rate: captures every frame while the scene changes and
+    only every static_stride-th frame once it has been still for
+    static_after seconds (parked, stopped at a red light).
+
+    Each encoded frame is scored on the encoder thread by the mean absolute
+    difference of a strided subsample of one channel against the previous
+    frame. The subsample is a view, so scoring a 640x480 frame touches about
+    5k pixels and costs microseconds. The first frame scoring above the
+    threshold returns the recorder to the full rate.
+
+    The capture loop asks should_capture() on every tick and records the
+    ticks it skips with FramePipeline.mark_skipped(), so the chunk index
+    still carries a timestamp for them.
+    """
+
+    def __init__(self, threshold=MOTION_THRESHOLD, static_after=MOTION_STATIC_AFTER,
+                 static_stride=MOTION_STATIC_STRIDE, downsample=MOTION_DOWNSAMPLE):
+        self.threshold = threshold
+        self.static_after_ns = int(static_after * 1e9)
+        self.static_stride = static_stride
+        self.downsample = downsample
+
+        self._lock = threading.Lock()
+        self._reference = None
+        self._last_motion_ns = None
+        self._last_observed_ns = None
+        self._static_since_ns = None
+        self.static = False
+
+        # Counters exposed through stats()
+        self.ticks = 0
+        self.frames_captured = 0
+        self.frames_skipped = 0
+        self.motion_events = 0  # static -> full rate transitions
+        self.static_ns = 0
+        self.response_latencies_ns = []  # per motion event, see observe()
+
+    def score(self, frame):
+        """
+        Returns:
+            float: Mean absolute difference (0-255) between frame and the
+            previous scored frame, or None for the first frame.
+        """
+        # Channel 1 is green in RGB(A) and BGR(A) alike
+        sample = frame[::self.downsample, ::self.downsample, 1].astype(np.int16)
+        reference, self._reference = self._reference, sample
+        if reference is None or reference.shape != sample.shape:
+            return None
+        return float(np.abs(sample - reference).mean())
+
+    def observe(self, frame, timestamp_ns):
+        """
+        Scores a captured frame and updates the rate. Runs on the encoder thread.
+        """
+        score = self.score(frame)
+        with self._lock:
+            previous_ns, self._last_observed_ns = self._last_observed_ns, timestamp_ns
+            if self._last_motion_ns is None or (score is not None and score >= self.threshold):
+                if self.static:
+                    # Motion could have started right after the previous
+                    # captured frame; full rate resumes from now
+                    self.static = False
+                    self.motion_events += 1
+                    self.static_ns += timestamp_ns - self._static_since_ns
+                    self.response_latencies_ns.append(time.time_ns() - previous_ns)
+                self._last_motion_ns = timestamp_ns
+            elif not self.static and timestamp_ns - self._last_motion_ns >= self.static_after_ns:
+                self.static = True
+                self._static_since_ns = timestamp_ns
+
+    def should_capture(self):
+        """
+        Called by the capture loop once per frame tick.
+        Returns:
+            bool: False if this tick should be skipped.
+        """
+        with self._lock:
+            self.ticks += 1
+            capture = not self.static or self.ticks % self.static_stride == 0
+            if capture:
+                self.frames_captured += 1
+            else:
+                self.frames_skipped += 1
+            return capture
+
+    def stats(self):
+        with self._lock:
+            static_ns = self.static_ns
+            if self.static and self._last_observed_ns is not None:
+                static_ns += self._last_observed_ns - self._static_since_ns
+            latencies = self.response_latencies_ns
+            return {
+                "ticks": self.ticks,
+                "captured": self.frames_captured,
+                "skipped": self.frames_skipped,
+                "skipped_ratio": self.frames_skipped / self.ticks if self.ticks else 0.0,
+                "static_seconds": static_ns / 1e9,
+                "motion_events": self.motion_events,
+                "response_latency_ms_mean": sum(latencies) / len(latencies) / 1e6 if latencies else None,
+                "response_latency_ms_max": max(latencies) / 1e6 if latencies else None,
+            }
@@ -0,0 +1,307 @@
+# multi_camera.py
+import os
+import time
+import queue
+import logging
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from frame_pipeline import FramePipeline
+from frame_sources import create_frame_source
+from frame_timing import FramePacer, index_path_for
+from motion import MotionGate
+from encoders import expected_chunk_size
+from recorder import Recorder, open_chunk_writer
+
+from config import ADAPTIVE_FRAME_RATE, VIDEO_ENCODER
+
+logger = logging.getLogger(__name__)
+
+
+class SharedFrameSlot:
+    """
+    The latest frame of one camera in shared memory, so the coordinating
+    process can read it (for a preview or post-processing) without frames
+    being pickled through a queue.
+
+    The header holds a sequence number and the frame's timestamp. The writer
+    makes the sequence number odd while copying and even when done; a reader
+    retries if the number was odd or changed during its copy.
+    """
+
+    HEADER_SIZE = 16  # sequence (int64) + timestamp in ns (int64)
+
+    def __init__(self, shm, frame_size, owner):
+        self.shm = shm
+        self.owner = owner
+        width, height = frame_size
+        self._header = np.ndarray((2,), np.int64, buffer=shm.buf[:self.HEADER_SIZE])
+        self.frame = np.ndarray((height, width, 3), np.uint8, buffer=shm.buf[self.HEADER_SIZE:])
+
+    @classmethod
+    def create(cls, frame_size):
+        width, height = frame_size
+        shm = shared_memory.SharedMemory(create=True, size=cls.HEADER_SIZE + width * height * 3)
+        slot = cls(shm, frame_size, owner=True)
+        slot._header[:] = 0
+        return slot
+
+    @classmethod
+    def attach(cls, name, frame_size):
+        return cls(shared_memory.SharedMemory(name=name), frame_size, owner=False)
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    def publish(self, frame, timestamp_ns):
+        if frame.shape != self.frame.shape:
+            return
+        sequence = self._header[0]
+        self._header[0] = sequence + 1
+        np.copyto(self.frame, frame)
+        self._header[1] = timestamp_ns
+        self._header[0] = sequence + 2
+
+    def read(self, out=None, attempts=5):
+        """
+        Returns:
+            tuple or None: (frame, timestamp_ns) copied out of shared memory, or
+            None if no consistent frame could be read (or none published yet).
+        """
+        if out is None:
+            out = np.empty_like(self.frame)
+        for _ in range(attempts):
+            sequence = self._header[0]
+            if sequence == 0 or sequence % 2:
+                time.sleep(0.001)
+                continue
+            np.copyto(out, self.frame)
+            timestamp_ns = int(self._header[1])
+            if self._header[0] == sequence:
+                return out, timestamp_ns
+        return None
+
+    def close(self):
+        # The numpy views must go before the mapping can be closed
+        del self._header
+        del self.frame
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+class PublishingWriter:
+    """
+    Passes frames to a chunk writer and publishes each one to the camera's
+    shared frame slot.
+    """
+
+    def __init__(self, writer, slot):
+        self.writer = writer
+        self.slot = slot
+
+    def write(self, frame, timestamp_ns):
+        self.writer.write(frame, timestamp_ns)
+        self.slot.publish(frame, timestamp_ns)
+
+    def skip(self, timestamp_ns, frame=None):
+        self.writer.skip(timestamp_ns, frame)
+
+    def release(self):
+        self.writer.release()
+
+    def discard(self):
+        self.writer.discard()
+
+
+def chunk_base_path(video_directory, name, k, wall_start, chunk_duration):
+    """
+    Returns:
+        str: The path, without extension, of chunk k of a camera; the
+        coordinating process uses it to reserve space before the worker opens the chunk.
+    """
+    timestamp = time.strftime("%Y%m%d_%H%M%S", time.localtime(wall_start + k * chunk_duration))
+    return os.path.join(video_directory, f"video_chunk_{k}_{timestamp}_{name}")
+
+
+def camera_worker(name, source_spec, video_directory, fps, frame_size, chunk_duration,
+                  start_ns, wall_start, slot_name, stop_event, results, preallocate_limit):
+    """
+    Capture + encode loop for one camera, run in its own process.
+
+    Chunk boundaries are start_ns + k * chunk_duration on the monotonic
+    clock, which every process on the machine shares, so all cameras roll
+    over at the same instants and chunk k of every camera covers the same
+    period. Opened chunks are reported on the results queue as ("opened",
+    name, path, k, bytes preallocated), the chunk being recorded as
+    ("started", name, path, k) and finished chunks as ("chunk", name, path, k).
+    preallocate_limit is a shared value the coordinating process sets to the
+    budget left for this camera's next chunk when it reserves space for it;
+    a chunk never allocates more than that up front.
+    """
+    logging.basicConfig(level=logging.INFO)
+    slot = SharedFrameSlot.attach(slot_name, frame_size)
+    finalizer = ThreadPoolExecutor(1, thread_name_prefix=f"finalize-{name}")
+    try:
+        source = create_frame_source(**source_spec, frame_size=frame_size)
+    except ValueError as e:
+        results.put(("error", name, str(e)))
+        slot.close()
+        return
+
+    def open_chunk(k):
+        base_path = chunk_base_path(video_directory, name, k, wall_start, chunk_duration)
+        limit = preallocate_limit.value
+        path, writer = open_chunk_writer(base_path, fps, frame_size, wall_start + k * chunk_duration, chunk_duration,
+                                         max_preallocate=limit if limit >= 0 else None)
+        results.put(("opened", name, path, k, writer.writer.preallocated))
+        return k, path, PublishingWriter(writer, slot)
+
+    def finalize(k, path, writer):
+        writer.release()
+        results.put(("chunk", name, path, k))
+
+    motion_gate = MotionGate() if ADAPTIVE_FRAME_RATE else None
+    pipeline = FramePipeline(frame_size, motion_gate=motion_gate)
+    pipeline.start()
+    pacer = FramePacer(fps)
+    chunk_ns = int(chunk_duration * 1e9)
+
+    current = open_chunk(0)
+    pipeline.set_writer(current[2])
+    upcoming = open_chunk(1)
+    next_boundary = start_ns + chunk_ns
+    results.put(("started", name, current[1], 0))
+
+    while not stop_event.is_set():
+        pacer.wait()
+        if time.monotonic_ns() >= next_boundary:
+            previous = current
+            current = upcoming
+            pipeline.switch_writer(current[2], lambda _, chunk=previous: finalizer.submit(finalize, *chunk))
+            results.put(("started", name, current[1], current[0]))
+            upcoming = open_chunk(current[0] + 1)
+            next_boundary += chunk_ns
+        if motion_gate is not None and not motion_gate.should_capture():
+            pipeline.mark_skipped(pacer.timestamp_ns())
+            continue
+        source.capture(pipeline, pacer.timestamp_ns())
+
+    pipeline.stop()
+    if motion_gate is not None:
+        logger.info(f"Adaptive frame rate ({name}): {motion_gate.stats()}")
+    upcoming[2].discard()
+    finalizer.submit(finalize, *current)
+    finalizer.shutdown(wait=True)
+    source.close()
+    slot.close()
+    results.put(("stopped", name))
+
+
+class MultiCameraRecorder(Recorder):
+    """
+    Records several cameras at once with one capture + encode worker
+    process per camera, so throughput scales with cores instead of sharing
+    one interpreter's GIL.
+
+    Geolocation and weather come from a single feed in this process (the
+    Recorder's scheduler jobs) and annotate every camera's chunks. Each
+    worker publishes its latest frame to a SharedFrameSlot readable with
+    latest_frame().
+    """
+
+    def __init__(self, cameras, data_directory="AutoVision", weather_service=None, on_status=None, **kwargs):
+        """
+        Parameters:
+            cameras (dict): Camera name -> frame source spec, i.e. keyword
+                arguments for create_frame_source(), e.g. {"kind": "camera", "device": 0}.
+            kwargs: fps, frame_size and chunk_duration, as for Recorder.
+        """
+        super().__init__(None, data_directory, weather_service, on_status, **kwargs)
+        self.cameras = cameras
+        self.slots = {}
+
+    def latest_frame(self, name):
+        slot = self.slots.get(name)
+        return slot.read() if slot is not None else None
+
+    def record_video(self):
+        # Spawned rather than forked: this process already runs several threads
+        context = multiprocessing.get_context("spawn")
+        stop_event = context.Event()
+        results = context.Queue()
+        chunk_size = expected_chunk_size(VIDEO_ENCODER, self.fps, self.frame_size, self.chunk_duration)
+
+        start_ns = time.monotonic_ns()
+        wall_start = time.time()
+        reserved = {}  # (camera, k) -> base path of a chunk reserved but not registered yet
+        limits = {name: context.Value("q", -1) for name in self.cameras}
+
+        def reserve(name, k):
+            # Space is reserved before the worker opens the chunk, like Recorder.open_chunk does
+            base_path = chunk_base_path(self.video_directory, name, k, wall_start, self.chunk_duration)
+            reserved[name, k] = base_path
+            return self.storage.reserve(base_path, chunk_size)
+
+        workers = {}
+        for name, source_spec in self.cameras.items():
+            # Workers open chunks 0 and 1 right away; chunk k + 2 is reserved when chunk k starts
+            limits[name].value = min(reserve(name, 0), reserve(name, 1))
+            self.slots[name] = SharedFrameSlot.create(self.frame_size)
+            worker = context.Process(
+                target=camera_worker, name=f"camera-{name}", daemon=True,
+                args=(name, source_spec, self.video_directory, self.fps, self.frame_size, self.chunk_duration,
+                      start_ns, wall_start, self.slots[name].name, stop_event, results, limits[name]))
+            worker.start()
+            workers[name] = worker
+
+        finished = set()  # cameras whose worker stopped, failed or died
+        while len(finished) < len(workers):
+            if not self.recording:
+                stop_event.set()
+            try:
+                message = results.get(timeout=0.1)
+            except queue.Empty:
+                for name, worker in workers.items():
+                    if name not in finished and worker.exitcode is not None:
+                        logger.error(f"Camera {name} worker exited unexpectedly (exit code {worker.exitcode})")
+                        finished.add(name)
+                continue
+
+            kind, name = message[0], message[1]
+            if kind == "opened":
+                self.storage.allocated(message[2], message[4])
+            elif kind == "started":
+                path, k = message[2], message[3]
+                limits[name].value = reserve(name, k + 2)
+                self.current_video_path = path
+                logger.info(f"Started recording: {os.path.basename(path)}")
+                self.update_status(f"Recording: {os.path.basename(path)}")
+            elif kind == "chunk":
+                path, k = message[2], message[3]
+                reserved.pop((name, k), None)
+                self.storage.register(path, index_path_for(path))
+                logger.info(f"Saved chunk: {path}")
+                # One shared weather lookup annotates every camera's chunk
+                future = self.scheduler.submit(("annotate", path), self.complete_chunk, path)
+                self._finalizing.add(future)
+                future.add_done_callback(self._finalizing.discard)
+            elif kind == "error" and name not in finished:
+                logger.error(f"Camera {name} failed: {message[2]}")
+                finished.add(name)
+            elif kind == "stopped":
+                finished.add(name)
+
+        # The pre-opened chunks were discarded and the ones reserved ahead never opened
+        for base_path in reserved.values():
+            self.storage.cancel(base_path)
+        for worker in workers.values():
+            worker.join()
+        for slot in self.slots.values():
+            slot.close()
+        self.slots = {}
+        self.current_video_path = "N/A"
@@ -0,0 +1,565 @@
+# recorder.py
+import os
+import time
+import uuid
+import logging
+import threading
+from concurrent.futures import wait
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+
+import requests
+
+from weather_service import WeatherService, WeatherCache
+from frame_pipeline import FramePipeline
+from motion import MotionGate
+from frame_timing import FramePacer, IndexedWriter, index_path_for
+from encoders import create_encoder, expected_chunk_size
+from metadata_store import create_metadata_store
+from http_client import get_http_client
+from scheduler import TelemetryScheduler
+from storage_manager import StorageManager
+from geo_utils import haversine_distance, PositionSmoother
+from backfill import backfill
+from metrics import get_metrics, MetricsExporter
+from thumbnails import Thumbnailer, thumbnail_paths
+from app_state import AppState
+
+# Import configuration parameters
+from config import (WEATHER_FETCH_INTERVAL, GEOLOCATION_POLL_INTERVAL, DISTANCE_THRESHOLD, VIDEO_CHUNK_DURATION,
+                    METADATA_BACKEND, VIDEO_ENCODER, VIDEO_FPS, VIDEO_FRAME_SIZE, STORAGE_FSYNC_INTERVAL,
+                    ADAPTIVE_FRAME_RATE, BACKFILL_INTERVAL, METRICS_DUMP_INTERVAL, METRICS_HTTP_PORT, GEOLOCATION_URL,
+                    THUMBNAILS_ENABLED)
+
+logger = logging.getLogger(__name__)
+
+
+def open_chunk_writer(base_path, fps, frame_size, start_time, duration=VIDEO_CHUNK_DURATION, max_preallocate=None):
+    """
+    Opens the encoder and frame index for a chunk starting at start_time.
+    Parameters:
+        base_path (str): Chunk path without extension.
+        duration (float): Expected chunk length in seconds.
+        max_preallocate (int): Most bytes the encoder may allocate up front.
+    Returns:
+        tuple: (filepath, IndexedWriter)
+    """
+    encoder = create_encoder(VIDEO_ENCODER, base_path, fps, frame_size, duration, max_preallocate)
+    return encoder.path, IndexedWriter(encoder, encoder.path, fps, int(start_time * 1e9))
+
+
+class Recorder:
+    """
+    Recording, chunking, weather and metadata logic shared by the Kivy app
+    and the headless entry point. Frames come from a frame source (see
+    frame_sources.py) and status messages go to the on_status callback.
+    Nothing in here imports Kivy.
+    """
+
+    def __init__(self, frame_source, data_directory="AutoVision", weather_service=None, on_status=None,
+                 fps=VIDEO_FPS, frame_size=VIDEO_FRAME_SIZE, chunk_duration=VIDEO_CHUNK_DURATION):
+        self.frame_source = frame_source
+        self.data_directory = data_directory
+        self.on_status = on_status
+        self.fps = fps
+        self.frame_size = frame_size
+        self.chunk_duration = chunk_duration
+        self.geolocation_url = GEOLOCATION_URL
+
+        # Created on first use (see the weather_service property), off the UI thread
+        self._weather_service = weather_service
+        self._weather_service_error = None
+        self._weather_service_lock = threading.Lock()
+
+        # Path for video chunks
+        self.video_directory = os.path.join(data_directory, "videos")
+        if not os.path.exists(self.video_directory):
+            os.makedirs(self.video_directory)
+
+        # Store for weather and video data
+        self.metadata_store = create_metadata_store(METADATA_BACKEND, data_directory)
+        self.data_file = self.metadata_store.path
+
+        # Keeps the video directory within its disk budget
+        self.storage = StorageManager(self.video_directory, self.metadata_store,
+                                      protected_path=os.path.join(data_directory, "protected_chunks.json"))
+
+        # Start from the last-known position until a fresh fix arrives; records
+        # saved meanwhile are marked "location_status": "cached"
+        self.state = AppState(os.path.join(data_directory, "state.json"))
+        self.latitude, self.longitude, saved_at = self.state.position()
+        self.location_fresh = False
+        if self.latitude is not None:
+            logger.info(f"Last-known position ({self.latitude}, {self.longitude}) from "
+                        f"{datetime.fromtimestamp(saved_at or 0):%Y-%m-%d %H:%M:%S}")
+        self.position_smoother = PositionSmoother()
+        self._smoothed_position = None  # median of the fixes when the position was last updated
+        self.current_video_path = "N/A"  # chunk that periodic weather records are linked to
+
+        # One event loop owns geolocation polling, weather fetching and chunk rollover
+        self.scheduler = TelemetryScheduler()
+        self.scheduler.start()
+        self.scheduler.schedule_periodic("storage-sync", STORAGE_FSYNC_INTERVAL, self.storage.sync)
+        # Records from a previous run may still be waiting for weather
+        self._backfill_needed = True
+        self.scheduler.schedule_periodic("backfill", BACKFILL_INTERVAL, self.backfill_weather)
+
+        self.recording = False
+        self.recording_thread = None
+        self.chunk_lock = threading.Lock()
+        self._finalizing = set()  # futures of chunks still being released/annotated
+
+        # Thumbnail indexes are built in separate processes after each chunk is released
+        self.thumbnailer = Thumbnailer() if THUMBNAILS_ENABLED else None
+
+        # Metrics snapshots go to metrics.json (and a localhost port if configured)
+        self.metrics = get_metrics()
+        self.metrics_exporter = MetricsExporter(self.metrics, os.path.join(data_directory, "metrics.json"))
+        if self.metrics.enabled:
+            self.metrics.register_collector("http", get_http_client().stats)
+            self.metrics.register_collector("storage", self.storage.stats)
+            self.scheduler.schedule_periodic("metrics-dump", METRICS_DUMP_INTERVAL, self.metrics_exporter.dump)
+            if METRICS_HTTP_PORT:
+                self.metrics_exporter.serve(METRICS_HTTP_PORT)
+        self._capture_time = self.metrics.histogram("recorder.capture_seconds")
+
+    def update_status(self, message):
+        if self.on_status is not None:
+            self.on_status(message)
+
+    def close(self):
+        self.stop_recording()
+        if self.recording_thread is not None:
+            self.recording_thread.join()
+        # An unreleased writer leaves an unreadable chunk, so wait for them
+        wait(list(self._finalizing))
+        if self.thumbnailer is not None:
+            self.thumbnailer.close()
+        self.scheduler.stop()
+        self.storage.sync()
+        self.metrics_exporter.close()
+        # Write out any batched metadata records before exiting
+        self.metadata_store.close()
+
+    @property
+    def weather_service(self):
+        """
+        The WeatherService, created on first use so that constructing the
+        Recorder never waits on it. None if it can't be created (no API key);
+        recording then goes on and records are saved without weather.
+        """
+        if self._weather_service is None and self._weather_service_error is None:
+            with self._weather_service_lock:
+                if self._weather_service is None and self._weather_service_error is None:
+                    try:
+                        self._weather_service = WeatherService(
+                            cache=WeatherCache(persist_path=os.path.join(self.data_directory, "weather_cache.json")))
+                    except ValueError as e:
+                        self._weather_service_error = e
+                        self.update_status(f"Weather unavailable: {e}")
+        return self._weather_service
+
+    def start_services(self):
+        """
+        Looks up the position and sets up the weather service in the
+        background, then warms the weather cache. Returns immediately.
+        """
+        self.scheduler.submit("geolocation", self._warm_up)
+
+    def _warm_up(self):
+        self.poll_geolocation()
+        self.fetch_weather()
+
+    def location_status(self):
+        """
+        Returns:
+            str: "live" once a fix was obtained in this run, "cached" while the
+            last-known position is used, "missing" without any position.
+        """
+        if self.latitude is None or self.longitude is None:
+            return "missing"
+        return "live" if self.location_fresh else "cached"
+
+    def get_geolocation(self):
+        """
+        Fetches the current device's latitude and longitude using ip-api.com.
+        Returns:
+            tuple: (latitude, longitude) or (None, None) if failed.
+        """
+        try:
+            response = get_http_client().get(self.geolocation_url)
+            response.raise_for_status()
+            data = response.json()
+            logger.debug(f"Geolocation API response: {data}")
+            if data['status'] == 'success':
+                latitude = data['lat']
+                longitude = data['lon']
+                logger.info(f"Geolocation determined: Latitude={latitude}, Longitude={longitude}")
+                return latitude, longitude
+            else:
+                logger.error(f"Geolocation API failed: {data.get('message', 'No error message')}")
+                return None, None
+        except requests.exceptions.RequestException as e:
+            logger.error(f"Error fetching geolocation: {e}")
+            return None, None
+
+    def start_recording(self):
+        # A previous recording thread only needs to release its last chunk
+        if self.recording_thread is not None and self.recording_thread.is_alive():
+            self.recording_thread.join()
+        self.recording = True
+
+        self.recording_thread = threading.Thread(target=self.record_video, daemon=True)
+        self.recording_thread.start()
+
+        # Without a position yet, look it up right away instead of after a full interval
+        self.scheduler.schedule_periodic("geolocation", GEOLOCATION_POLL_INTERVAL, self.poll_geolocation,
+                                         initial_delay=0 if not self.location_fresh else None)
+        self.scheduler.schedule_periodic("weather", WEATHER_FETCH_INTERVAL, self.fetch_periodic_weather)
+
+    def stop_recording(self):
+        self.recording = False
+
+        # Stopping is immediate: the jobs are cancelled on the loop and the
+        # recording thread exits within one frame period
+        self.scheduler.cancel("geolocation", "weather", "rollover")
+
+    def save_data(self, video_path, weather_data, chunk_complete=False):
+        # Without weather the record is still saved, marked for the backfill job. chunk_complete
+        # marks the record saved once the chunk was released, as opposed to the periodic ones
+        weather_status = "ok" if weather_data else "missing"
+        weather_data = weather_data or {}
+        record = {
+            "id": uuid.uuid4().hex,
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime()),
+            "video_path": video_path,
+            "chunk_complete": chunk_complete,
+            "weather_status": weather_status,
+            "location_status": self.location_status(),
+            "weather": {
+                "latitude": self.latitude,
+                "longitude": self.longitude,
+                "city": weather_data.get("city", "N/A"),
+                "temperature": weather_data.get("temperature", "N/A"),
+                "temperature_min": weather_data.get("temperature_min", "N/A"),
+                "temperature_max": weather_data.get("temperature_max", "N/A"),
+                "feels_like": weather_data.get("feels_like", "N/A"),
+                "pressure": weather_data.get("pressure", "N/A"),
+                "humidity": weather_data.get("humidity", "N/A"),
+                "visibility": weather_data.get("visibility", "N/A"),
+                "clouds": weather_data.get("clouds", "N/A"),
+                "wind_speed": weather_data.get("wind_speed", "N/A"),
+                "wind_deg": weather_data.get("wind_deg", "N/A"),
+                "weather_description": weather_data.get("weather_description", "N/A"),
+                "weather_icon": weather_data.get("weather_icon", "N/A"),
+                "sunrise": weather_data.get("sunrise", "N/A"),
+                "sunset": weather_data.get("sunset", "N/A"),
+                "rain": weather_data.get("rain", 0),
+                "snow": weather_data.get("snow", 0)
+            }
+        }
+        try:
+            self.metadata_store.append(record)
+            if weather_status == "missing":
+                self._backfill_needed = True
+            logger.info(f"Saved weather data for {video_path}")
+            return record
+        except Exception as e:
+            logger.error(f"Error saving data: {e}")
+            self.update_status("Error saving data.")
+            return None
+
+    def record_video(self):
+        fps = self.fps
+        self.chunk_count = 0
+
+        # Optionally lower the capture rate while the scene is static
+        self.motion_gate = MotionGate() if ADAPTIVE_FRAME_RATE else None
+        self.pipeline = FramePipeline(self.frame_size, motion_gate=self.motion_gate)
+        self.pipeline.start()
+        self.pacer = FramePacer(fps)
+        self.metrics.register_collector("pipeline", self.pipeline.stats)
+        self.metrics.register_collector("pacer", self.pacer.stats)
+        self.metrics.register_collector("recorder.fps", self.achieved_fps)
+        if self.motion_gate is not None:
+            self.metrics.register_collector("motion", self.motion_gate.stats)
+
+        with self.chunk_lock:
+            self.filepath, self.out = None, None
+            start_time = time.time()
+            self.start_chunk(self.open_chunk(fps, start_time))
+            # The next chunk's writer is always opened ahead of the rollover
+            self.next_chunk = self.open_chunk(fps, start_time + self.chunk_duration)
+        self.scheduler.schedule_periodic("rollover", self.chunk_duration, self.rollover_chunk, fps)
+
+        # Frame deadlines are fixed on the monotonic clock, so overruns and
+        # wall-clock jumps can't make the chunk drift from the target rate
+        while self.recording:
+            self.pacer.wait()
+            if self.motion_gate is not None and not self.motion_gate.should_capture():
+                self.pipeline.mark_skipped(self.pacer.timestamp_ns())
+                continue
+            if self.metrics.enabled:
+                start = time.perf_counter()
+                self.frame_source.capture(self.pipeline, self.pacer.timestamp_ns())
+                self._capture_time.observe(time.perf_counter() - start)
+            else:
+                self.frame_source.capture(self.pipeline, self.pacer.timestamp_ns())
+
+        self.scheduler.cancel("rollover")
+        with self.chunk_lock:
+            # Draining the pipeline also runs any writer switch still queued
+            self.pipeline.stop()
+            logger.debug(f"Frame pipeline stats: {self.pipeline.stats()}, pacing: {self.pacer.stats()}")
+            if self.motion_gate is not None:
+                logger.info(f"Adaptive frame rate: {self.motion_gate.stats()}")
+            filepath, out = self.filepath, self.out
+
+            # The pre-opened next chunk never received a frame
+            self.next_chunk[1].discard()
+            self.storage.cancel(self.next_chunk[0])
+            self.next_chunk = None
+
+        # Finalize the last chunk in the background so a restart isn't held up
+        self.finalize_in_background(filepath, out)
+
+        # To reset the current video path when recording stops
+        self.current_video_path = "N/A"
+        self.metrics.unregister_collector("recorder.fps")
+
+    def achieved_fps(self):
+        """
+        Returns:
+            float: Frames encoded per second since recording started.
+        """
+        elapsed = (time.monotonic_ns() - self.pacer.start_ns) / 1e9
+        return self.pipeline.frames_encoded / elapsed if elapsed > 0 else 0.0
+
+    def open_chunk(self, fps, start_time):
+        """
+        Opens the encoder and frame index for a chunk starting at start_time.
+        Returns:
+            tuple: (filepath, IndexedWriter)
+        """
+        # Generate a unique file path for the chunk
+        timestamp = time.strftime("%Y%m%d_%H%M%S", time.localtime(start_time))
+        base_path = os.path.join(self.video_directory, f"video_chunk_{self.chunk_count}_{timestamp}")
+        self.chunk_count += 1  # Increment chunk count for the next chunk
+
+        # Evict old chunks before the disk fills up rather than after. A raw
+        # chunk's size is known, and it preallocates at most what the budget leaves
+        size = expected_chunk_size(VIDEO_ENCODER, fps, self.frame_size, self.chunk_duration)
+        headroom = self.storage.reserve(base_path, size)
+        filepath, writer = open_chunk_writer(base_path, fps, self.frame_size, start_time, self.chunk_duration,
+                                             max_preallocate=headroom)
+        self.storage.allocated(filepath, writer.writer.preallocated)
+        return filepath, writer
+
+    def start_chunk(self, chunk):
+        # Caller holds self.chunk_lock
+        previous_path, previous_out = self.filepath, self.out
+        self.filepath, self.out = chunk
+        self.output_file = os.path.basename(self.filepath)
+
+        if previous_out is None:
+            self.pipeline.set_writer(self.out)
+        else:
+            # Frames queued before this point still go to the previous chunk,
+            # which is released and annotated in the background afterwards
+            def hand_off(old_out):
+                self.finalize_in_background(previous_path, old_out)
+            self.pipeline.switch_writer(self.out, hand_off)
+
+        # Update the current video path to reflect the new chunk
+        self.current_video_path = self.filepath
+
+        logger.info(f"Started recording: {self.output_file}")
+        self.update_status(f"Recording: {self.output_file}")
+
+    def rollover_chunk(self, fps):
+        """
+        Runs on the telemetry scheduler every chunk_duration seconds.
+        """
+        with self.chunk_lock:
+            if not self.recording or self.next_chunk is None:
+                return
+            self.start_chunk(self.next_chunk)
+            # Open the writer for the chunk after this one off the switch path
+            self.next_chunk = self.open_chunk(fps, time.time() + self.chunk_duration)
+
+    def finalize_in_background(self, filepath, out):
+        future = self.scheduler.submit(("finalize", filepath), self.finalize_chunk, filepath, out)
+        self._finalizing.add(future)
+        future.add_done_callback(self._finalizing.discard)
+
+    def finalize_chunk(self, filepath, out):
+        out.release()
+        self.storage.register(filepath, index_path_for(filepath))
+        logger.info(f"Saved chunk: {filepath}")
+        self.update_status(f"Saved chunk: {os.path.basename(filepath)}")
+        self.complete_chunk(filepath)
+
+    def complete_chunk(self, filepath):
+        """
+        Post-processing of a released chunk: weather annotation, then the thumbnail index.
+        """
+        record = self.annotate_chunk(filepath)
+        self.index_chunk(filepath, record)
+
+    def annotate_chunk(self, filepath):
+        # Fetch and save weather data with the correct video_path
+        weather_data = self.fetch_weather()
+        if not weather_data:
+            logger.error("Failed to fetch weather data for this chunk.")
+            self.update_status("Failed to fetch weather data.")
+        record = self.save_data(filepath, weather_data, chunk_complete=True)
+        self.metadata_store.flush()
+        return record
+
+    def index_chunk(self, filepath, record, retry=True):
+        """
+        Builds the chunk's thumbnail index in the background and links it
+        from the chunk's metadata record once done. A chunk lost to a broken
+        worker pool is submitted once more to its replacement.
+        """
+        if self.thumbnailer is None:
+            return
+        future = self.thumbnailer.submit(filepath)
+        if future is None:
+            return  # shutting down; the index can be built later with thumbnails.py --build
+
+        def link(future):
+            if future.cancelled():
+                return
+            try:
+                index_path = future.result()
+            except BrokenProcessPool as e:
+                logger.error(f"Thumbnail worker died while indexing {filepath}: {e}")
+                if retry:
+                    self.index_chunk(filepath, record, retry=False)
+                return
+            except Exception as e:
+                logger.error(f"Error building thumbnails for {filepath}: {e}")
+                return
+            self.storage.register(*(path for path in thumbnail_paths(filepath) if os.path.exists(path)))
+            if record is not None:
+                # Only this field: the stored record may have changed since, e.g. backfilled weather
+                self.metadata_store.patch(record["id"], thumbnails=index_path)
+            logger.debug(f"Thumbnail index ready: {index_path}")
+
+        future.add_done_callback(link)
+
+    def protect_chunk(self, video_path=None, protected=True):
+        """
+        Flags a chunk (by default the one being recorded) so it is never
+        evicted to free space, e.g. to keep an event.
+        """
+        video_path = video_path or self.current_video_path
+        if video_path == "N/A":
+            self.update_status("No chunk to protect.")
+            return
+        self.storage.protect(video_path, protected)
+        logger.info(f"{'Protected' if protected else 'Unprotected'} chunk: {video_path}")
+        self.update_status(f"{'Protected' if protected else 'Unprotected'}: {os.path.basename(video_path)}")
+
+    def fetch_weather(self):
+        """
+        Fetches weather for the current coordinates through the scheduler, so
+        concurrent callers for the same position share one request.
+        """
+        weather_service = self.weather_service
+        if self.latitude is None or self.longitude is None or weather_service is None:
+            return None
+        key = ("weather", self.latitude, self.longitude)
+        weather = self.scheduler.call(key, weather_service.get_current_weather_by_coords,
+                                      self.latitude, self.longitude)
+        if weather:
+            self.state.save_weather(weather)
+        return weather
+
+    def backfill_weather(self):
+        """
+        Looks up the weather of chunks saved without it. Runs every BACKFILL_INTERVAL seconds.
+        """
+        if not self._backfill_needed or self.weather_service is None:
+            return
+        self._backfill_needed = False
+        stats = backfill(self.metadata_store, self.weather_service, should_stop=lambda: not self.scheduler.running)
+        if stats["failed"]:
+            # Still offline, or the lookups failed; try again next interval
+            self._backfill_needed = True
+        elif stats["records"]:
+            self.update_status(f"Backfilled weather for {stats['records']} records.")
+
+    def poll_geolocation(self):
+        """
+        Updates coordinates if the vehicle has moved significantly. Runs every GEOLOCATION_POLL_INTERVAL seconds.
+        """
+        current_latitude, current_longitude = self.get_geolocation()
+
+        if current_latitude is None or current_longitude is None:
+            logger.error("Failed to fetch current geolocation.")
+            return
+
+        # Compare the median of recent fixes, not the raw fix, so one jumpy
+        # lookup doesn't count as movement and trigger extra weather fetches.
+        # The median lags, so it only decides whether to move; the raw fix is stored
+        smoothed = self.position_smoother.update(current_latitude, current_longitude)
+
+        # The first fix of a run replaces the last-known position, however close
+        if not self.location_fresh or self._smoothed_position is None:
+            self.latitude, self.longitude = current_latitude, current_longitude
+            self._smoothed_position = smoothed
+            self.location_fresh = True
+            self.state.save_position(self.latitude, self.longitude)
+            return
+
+        distance_moved = self.haversine_distance(*self._smoothed_position, *smoothed)
+
+        logger.debug(f"Distance moved: {distance_moved:.2f} meters")
+
+        if distance_moved >= DISTANCE_THRESHOLD:
+            logger.info(f"Significant movement detected: {distance_moved:.2f} meters")
+            self.latitude, self.longitude = current_latitude, current_longitude
+            self._smoothed_position = smoothed
+            self.state.save_position(self.latitude, self.longitude)
+        else:
+            logger.debug(f"Movement below threshold: {distance_moved:.2f} meters")
+
+    def fetch_periodic_weather(self):
+        """
+        Fetches and saves weather data every WEATHER_FETCH_INTERVAL seconds.
+        """
+        weather_data = self.fetch_weather()
+
+        # Save weather data using the current video path
+        if weather_data:
+            self.save_data(self.current_video_path, weather_data)
+        else:
+            logger.error("Failed to fetch weather data during periodic update.")
+            self.update_status("Failed to fetch periodic weather data.")
+
+    def haversine_distance(self, lat1, lon1, lat2, lon2):
+        """
+        Calculates the Haversine distance between two points in meters.
+        """
+        return haversine_distance(lat1, lon1, lat2, lon2)
+
+    def archive_metadata(self):
+        """
+        Archives the current metadata as a timestamped weather_videos_<timestamp>.json file and starts a new store.
+        """
+        try:
+            # Create a timestamped backup filename
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            backup_filename = f"weather_videos_{timestamp}.json"
+            backup_path = os.path.join(self.data_directory, backup_filename)
+
+            self.metadata_store.archive(backup_path)
+            logger.info(f"Archived current metadata as {backup_filename}")
+
+            # Update status label
+            self.update_status(f"Archived data as {backup_filename} and started a new data file.")
+        except Exception as e:
+            logger.error(f"Error archiving JSON file: {e}")
+            self.update_status("Error archiving JSON file.")
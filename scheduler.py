@@ -0,0 +1,179 @@
+# scheduler.py
+import asyncio
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from config import SCHEDULER_IO_WORKERS
+
+
+class TelemetryScheduler:
+    """
+    Runs every periodic telemetry job (geolocation polling, weather fetching,
+    chunk rollover) on a single asyncio event loop in a background thread.
+
+    Jobs are plain blocking callables; they run on a small I/O thread pool so
+    the loop itself never blocks. Calls sharing a key are deduplicated: while
+    one is in flight, later callers get the same result instead of issuing a
+    second request. Cancelling a job or stopping the scheduler takes effect
+    immediately instead of after the next sleep.
+    """
+
+    def __init__(self, io_workers=SCHEDULER_IO_WORKERS):
+        self.logger = logging.getLogger(__name__)
+        self.io_workers = io_workers
+        self._loop = None
+        self._thread = None
+        self._executor = None
+        self._jobs = {}  # name -> asyncio.Task
+        self._inflight = {}  # key -> concurrent.futures.Future
+        self._inflight_lock = threading.Lock()
+        self._started = threading.Event()
+
+    @property
+    def running(self):
+        return self._loop is not None and self._loop.is_running()
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._executor = ThreadPoolExecutor(self.io_workers, thread_name_prefix="telemetry-io")
+        self._loop = asyncio.new_event_loop()
+        self._started.clear()
+        self._thread = threading.Thread(target=self._run_loop, name="telemetry-scheduler", daemon=True)
+        self._thread.start()
+        self._started.wait()
+
+    def stop(self, timeout=5):
+        """
+        Cancels every job and stops the loop. Blocking calls already running
+        on the I/O pool are abandoned rather than waited for.
+        """
+        if self._thread is None:
+            return
+        self._loop.call_soon_threadsafe(self._shutdown)
+        self._thread.join(timeout)
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        # Calls that never got a worker won't run; release anyone waiting on them
+        with self._inflight_lock:
+            for future in self._inflight.values():
+                future.cancel()
+            self._inflight.clear()
+        self._thread = None
+        self._loop = None
+        self._executor = None
+
+    def schedule_periodic(self, name, interval, func, *args, initial_delay=None):
+        """
+        Runs func(*args) every interval seconds. Scheduling a job under a name
+        that is already in use replaces the old job, so repeated start/stop
+        cycles can never stack duplicates.
+        Parameters:
+            name (str): Job name, also the deduplication key of its calls.
+            interval (float): Seconds between runs.
+            func (callable): Blocking function to call.
+            initial_delay (float): Seconds before the first run; defaults to interval.
+        """
+        delay = interval if initial_delay is None else initial_delay
+        self._loop.call_soon_threadsafe(self._schedule, name, interval, delay, func, args)
+
+    def cancel(self, *names):
+        for name in names:
+            self._loop.call_soon_threadsafe(self._cancel, name)
+
+    def submit(self, key, func, *args):
+        """
+        Runs func(*args) once on the I/O pool, sharing the call with any
+        in-flight call that has the same key. Safe to call from any thread.
+        Returns:
+            concurrent.futures.Future: Resolves to the function's return value.
+        """
+        return asyncio.run_coroutine_threadsafe(self._call(key, func, args), self._loop)
+
+    def call(self, key, func, *args):
+        """
+        Blocking counterpart of submit() for code already running off the UI
+        thread (including scheduled jobs). The call runs in the calling thread
+        unless one with the same key is in flight, in which case its result is
+        shared. Running inline means nested calls never wait for a free I/O
+        worker.
+        """
+        future, owner = self._claim(key)
+        if owner:
+            self._execute(key, future, func, args)
+        return future.result()
+
+    def _claim(self, key):
+        with self._inflight_lock:
+            future = self._inflight.get(key)
+            if future is not None:
+                self.logger.debug(f"Joining in-flight call '{key}'")
+                return future, False
+            future = Future()
+            self._inflight[key] = future
+            return future, True
+
+    def _execute(self, key, future, func, args):
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            result = func(*args)
+        except BaseException as e:
+            future.set_exception(e)
+        else:
+            future.set_result(result)
+        finally:
+            with self._inflight_lock:
+                self._inflight.pop(key, None)
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self._loop)
+        self._loop.call_soon(self._started.set)
+        try:
+            self._loop.run_forever()
+        finally:
+            self._loop.close()
+
+    def _shutdown(self):
+        # Periodic jobs plus any one-off submit() calls still waiting
+        tasks = list(asyncio.all_tasks(self._loop))
+        self._jobs.clear()
+        if not tasks:
+            self._loop.stop()
+            return
+        for task in tasks:
+            task.cancel()
+        # Give the cancelled jobs one pass through the loop to unwind
+        asyncio.gather(*tasks, return_exceptions=True).add_done_callback(lambda _: self._loop.stop())
+
+    def _schedule(self, name, interval, delay, func, args):
+        self._cancel(name)
+        self._jobs[name] = self._loop.create_task(self._periodic(name, interval, delay, func, args))
+
+    def _cancel(self, name):
+        task = self._jobs.pop(name, None)
+        if task is not None:
+            task.cancel()
+
+    async def _periodic(self, name, interval, delay, func, args):
+        # Deadlines are computed on the loop's monotonic clock so an overrunning
+        # run skips the deadlines it missed instead of drifting
+        next_run = self._loop.time() + delay
+        while True:
+            await asyncio.sleep(max(0, next_run - self._loop.time()))
+            try:
+                await self._call(name, func, args)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.logger.error(f"Scheduled job '{name}' failed: {e}")
+            now = self._loop.time()
+            next_run += interval
+            if next_run < now:
+                next_run += ((now - next_run) // interval + 1) * interval
+
+    async def _call(self, key, func, args):
+        future, owner = self._claim(key)
+        if owner:
+            self._loop.run_in_executor(self._executor, self._execute, key, future, func, args)
+        return await asyncio.shield(asyncio.wrap_future(future))
@@ -0,0 +1,268 @@
+# storage_manager.py
+import os
+import json
+import shutil
+import logging
+import threading
+from collections import OrderedDict
+
+from config import (STORAGE_QUOTA_BYTES, STORAGE_QUOTA_PERCENT, STORAGE_MIN_FREE_BYTES, STORAGE_FSYNC_BATCH)
+
+
+class StorageManager:
+    """
+    Keeps the video directory within a disk budget by evicting the oldest
+    chunks, ring-buffer style, together with their metadata records.
+
+    The directory is scanned once when the manager is created; after that
+    the space in use is tracked incrementally as chunks are reserved,
+    registered and evicted. A chunk is every file sharing its stem (the name
+    up to the first dot), i.e. the video, its .idx sidecar and its thumbnail
+    index. Protected chunks (e.g. a flagged event) are never evicted; the
+    flags are kept in protected_chunks.json.
+
+    Finished chunks are fsync'ed in batches of STORAGE_FSYNC_BATCH (or by a
+    periodic sync()) with one fsync of the directory per batch, instead of
+    one sync per file.
+    """
+
+    def __init__(self, directory, metadata_store=None, quota_bytes=STORAGE_QUOTA_BYTES,
+                 quota_percent=STORAGE_QUOTA_PERCENT, min_free_bytes=STORAGE_MIN_FREE_BYTES,
+                 fsync_batch=STORAGE_FSYNC_BATCH, protected_path=None):
+        """
+        Parameters:
+            directory (str): The video directory.
+            metadata_store (MetadataStore): Store whose records are deleted with evicted chunks.
+            quota_bytes (int): Budget for the directory; if None, quota_percent
+                of the filesystem's size is used.
+            min_free_bytes (int): Free space to keep on the filesystem whatever the quota.
+        """
+        self.logger = logging.getLogger(__name__)
+        self.directory = directory
+        self.metadata_store = metadata_store
+        self.min_free_bytes = min_free_bytes
+        self.fsync_batch = fsync_batch
+        self.protected_path = protected_path or os.path.join(os.path.dirname(os.path.abspath(directory)),
+                                                             "protected_chunks.json")
+
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        if quota_bytes is None:
+            quota_bytes = shutil.disk_usage(directory).total * quota_percent // 100
+        self.quota_bytes = quota_bytes
+
+        self._lock = threading.RLock()
+        self._chunks = OrderedDict()  # stem -> {path: size}, oldest first
+        self._reserved = {}  # stem of a chunk being written -> estimated size
+        self._allocated = {}  # stem of a chunk being written -> bytes it already holds on disk
+        self._unsynced = []
+        self.used_bytes = 0
+        self.evictions = 0
+        self.protected = self._load_protected()
+        self._scan()
+
+    def _scan(self):
+        entries = []
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if entry.is_file() and entry.name.startswith("video_chunk_") and not entry.name.endswith(".tmp"):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, entry.path, stat.st_size))
+        for _, path, size in sorted(entries):
+            self._chunks.setdefault(self._stem(path), {})[path] = size
+            self.used_bytes += size
+        self.logger.info(f"Storage: {len(self._chunks)} chunks, {self.used_bytes / 1e9:.2f} GB "
+                         f"of {self.quota_bytes / 1e9:.2f} GB quota")
+
+    @staticmethod
+    def _stem(path):
+        return os.path.basename(path).split(".", 1)[0]
+
+    def _load_protected(self):
+        try:
+            with open(self.protected_path, 'r') as f:
+                return set(json.load(f))
+        except FileNotFoundError:
+            return set()
+        except ValueError:
+            self.logger.warning(f"Ignoring unreadable {self.protected_path}")
+            return set()
+
+    def _save_protected(self):
+        tmp_path = self.protected_path + ".tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(sorted(self.protected), f, indent=4)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.protected_path)
+
+    def chunk_estimate(self):
+        """
+        Returns:
+            int: The mean size of a stored chunk, used to reserve space for chunks being written.
+        """
+        with self._lock:
+            return self.used_bytes // len(self._chunks) if self._chunks else 0
+
+    def reserve(self, path, size=None):
+        """
+        Makes room for a chunk that is about to be written to path, evicting
+        old chunks if needed. Called before the chunk's writer is opened.
+        Parameters:
+            size (int): The chunk's size if known in advance (a raw chunk);
+                the mean size of a stored chunk otherwise.
+        Returns:
+            int: The bytes the chunk may take without exceeding the quota or
+            the minimum free space, i.e. the most it should preallocate.
+        """
+        with self._lock:
+            stem = self._stem(path)
+            self._reserved[stem] = size if size is not None else self.chunk_estimate()
+            self._allocated.pop(stem, None)
+            self.ensure_space()
+            return self.headroom(exclude=stem)
+
+    def headroom(self, exclude=None):
+        """
+        Returns:
+            int: The bytes left for new data without exceeding the quota or
+            the minimum free space, counting every reservation but exclude's.
+        """
+        with self._lock:
+            reserved = sum(size for stem, size in self._reserved.items() if stem != exclude)
+            return max(0, min(self.quota_bytes - self.used_bytes - reserved,
+                              self._free_bytes() - self._pending_bytes(exclude) - self.min_free_bytes))
+
+    def allocated(self, path, size):
+        """
+        Notes that a reserved chunk already holds size bytes on disk (e.g.
+        preallocated), which the filesystem's free space already reflects.
+        """
+        with self._lock:
+            stem = self._stem(path)
+            if stem in self._reserved:
+                self._allocated[stem] = size
+
+    def cancel(self, path):
+        """
+        Drops the reservation of a chunk that was discarded unwritten.
+        """
+        with self._lock:
+            stem = self._stem(path)
+            self._reserved.pop(stem, None)
+            self._allocated.pop(stem, None)
+
+    def _pending_bytes(self, exclude=None):
+        # Reserved bytes not yet taken from the filesystem's free space
+        return sum(max(0, reserved - self._allocated.get(stem, 0))
+                   for stem, reserved in self._reserved.items() if stem != exclude)
+
+    def register(self, *paths):
+        """
+        Accounts for the files of a finished chunk (video, index, ...) and
+        queues them for the next batched fsync.
+        """
+        with self._lock:
+            for path in paths:
+                try:
+                    size = os.path.getsize(path)
+                except OSError:
+                    continue
+                stem = self._stem(path)
+                self._reserved.pop(stem, None)
+                self._allocated.pop(stem, None)
+                files = self._chunks.setdefault(stem, {})
+                self.used_bytes += size - files.get(path, 0)
+                files[path] = size
+                self._unsynced.append(path)
+            if len(self._unsynced) >= self.fsync_batch:
+                self.sync()
+
+    def sync(self):
+        """
+        fsyncs the files registered since the last sync, then the directory
+        so their directory entries are durable too.
+        """
+        with self._lock:
+            paths, self._unsynced = self._unsynced, []
+        if not paths:
+            return
+        for path in paths:
+            try:
+                fd = os.open(path, os.O_RDONLY)
+            except OSError:
+                continue  # evicted in the meantime
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+        fd = os.open(self.directory, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+        self.logger.debug(f"Synced {len(paths)} files in {self.directory}")
+
+    def protect(self, path, protected=True):
+        """
+        Sets or clears the protection flag of the chunk that path belongs to.
+        """
+        with self._lock:
+            stem = self._stem(path)
+            if protected:
+                self.protected.add(stem)
+            else:
+                self.protected.discard(stem)
+            self._save_protected()
+
+    def is_protected(self, path):
+        return self._stem(path) in self.protected
+
+    def ensure_space(self):
+        """
+        Evicts the oldest unprotected chunks until the stored and reserved
+        chunks fit the quota and the filesystem keeps min_free_bytes free.
+        Space reserved chunks already hold is missing from the free space,
+        so only the rest of their reservation is counted against it.
+        Returns:
+            list: The stems of the evicted chunks.
+        """
+        evicted = []
+        with self._lock:
+            reserved = sum(self._reserved.values())
+            while (self.used_bytes + reserved > self.quota_bytes or
+                   self._free_bytes() < self._pending_bytes() + self.min_free_bytes):
+                stem = next((stem for stem in self._chunks if stem not in self.protected), None)
+                if stem is None:
+                    self.logger.warning("Storage quota reached but every stored chunk is protected")
+                    break
+                self._evict(stem)
+                evicted.append(stem)
+        return evicted
+
+    def _free_bytes(self):
+        return shutil.disk_usage(self.directory).free
+
+    def _evict(self, stem):
+        files = self._chunks.pop(stem)
+        for path, size in files.items():
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            self.used_bytes -= size
+        self.evictions += 1
+        if self.metadata_store is not None:
+            self.metadata_store.delete_video_records(files)
+        self.logger.info(f"Evicted chunk {stem} ({sum(files.values()) / 1e6:.1f} MB)")
+
+    def stats(self):
+        with self._lock:
+            return {
+                "chunks": len(self._chunks),
+                "used_bytes": self.used_bytes,
+                "reserved_bytes": sum(self._reserved.values()),
+                "quota_bytes": self.quota_bytes,
+                "protected": len(self.protected),
+                "evictions": self.evictions,
+            }
@@ -0,0 +1,172 @@
+# stub_server.py
+"""
+Local stand-in for the OpenWeather and ip-api.com endpoints, for testing
+the weather backfill and for benchmarks without network access or an API
+quota.
+
+    python stub_server.py --port 8765 --latency 0.2 --failure-rate 0.1
+
+Serves:
+    /data/2.5/weather                 current weather
+    /data/3.0/onecall/timemachine     historical weather
+    /json/                            ip-api.com geolocation
+    /stats                            requests served per path
+
+Responses are deterministic functions of the query, so runs are
+repeatable. --latency delays every response and --failure-rate answers
+that fraction of requests with 503 to exercise retries and circuit breaking.
+"""
+import json
+import time
+import random
+import logging
+import argparse
+import threading
+from collections import Counter
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+logger = logging.getLogger(__name__)
+
+
+def _weather_point(latitude, longitude, timestamp):
+    # Varies smoothly with position and time so cells and buckets differ
+    seed = int(abs(latitude) * 100) * 31 + int(abs(longitude) * 100) * 17 + int(timestamp // 3600)
+    rain = (seed % 7) * 0.5 if seed % 3 == 0 else 0
+    return {
+        "temp": 15 + seed % 20,
+        "feels_like": 14 + seed % 20,
+        "pressure": 1000 + seed % 30,
+        "humidity": 40 + seed % 50,
+        "visibility": 10000 if not rain else 4000,
+        "clouds": seed % 100,
+        "wind_speed": (seed % 12) / 2,
+        "wind_deg": seed % 360,
+        "sunrise": int(timestamp // 86400 * 86400 + 6 * 3600),
+        "sunset": int(timestamp // 86400 * 86400 + 18 * 3600),
+        "weather": [{"description": "light rain" if rain else "clear sky", "icon": "10d" if rain else "01d"}],
+        "rain": {"1h": rain} if rain else {},
+    }
+
+
+class StubServer:
+    """
+    The stub server on a background thread.
+    Parameters:
+        latency (float): Seconds to wait before every response.
+        failure_rate (float): Fraction of requests answered with 503.
+        position (tuple): (latitude, longitude) the geolocation endpoint reports.
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0, failure_rate=0.0, position=(18.5204, 73.8567),
+                 seed=0):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.position = position
+        self.requests = Counter()
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def _handler_class(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                stub.handle(self)
+
+            def log_message(self, format, *args):
+                logger.debug(format % args)
+
+        return Handler
+
+    def handle(self, request):
+        parsed = urlparse(request.path)
+        query = {key: values[0] for key, values in parse_qs(parsed.query).items()}
+        with self._lock:
+            self.requests[parsed.path] += 1
+            fail = self._random.random() < self.failure_rate
+        if self.latency:
+            time.sleep(self.latency)
+
+        if parsed.path == "/stats":
+            return self._send(request, 200, dict(self.requests))
+        if fail:
+            return self._send(request, 503, {"message": "injected failure"})
+        try:
+            latitude, longitude = float(query.get("lat", 0)), float(query.get("lon", 0))
+        except ValueError:
+            return self._send(request, 400, {"message": "bad coordinates"})
+
+        if parsed.path == "/data/2.5/weather":
+            point = _weather_point(latitude, longitude, time.time())
+            return self._send(request, 200, {
+                "name": "Stub City",
+                "main": {"temp": point["temp"], "temp_min": point["temp"] - 2, "temp_max": point["temp"] + 2,
+                         "feels_like": point["feels_like"], "pressure": point["pressure"],
+                         "humidity": point["humidity"]},
+                "visibility": point["visibility"],
+                "clouds": {"all": point["clouds"]},
+                "wind": {"speed": point["wind_speed"], "deg": point["wind_deg"]},
+                "weather": point["weather"],
+                "sys": {"sunrise": point["sunrise"], "sunset": point["sunset"]},
+                "rain": point["rain"],
+            })
+        if parsed.path == "/data/3.0/onecall/timemachine":
+            timestamp = int(query.get("dt", time.time()))
+            point = dict(_weather_point(latitude, longitude, timestamp), dt=timestamp)
+            return self._send(request, 200, {"lat": latitude, "lon": longitude, "data": [point]})
+        if parsed.path.rstrip("/") == "/json":
+            return self._send(request, 200, {"status": "success", "lat": self.position[0],
+                                             "lon": self.position[1], "city": "Stub City"})
+        return self._send(request, 404, {"message": "not found"})
+
+    def _send(self, request, status, body):
+        payload = json.dumps(body).encode()
+        request.send_response(status)
+        request.send_header("Content-Type", "application/json")
+        request.send_header("Content-Length", str(len(payload)))
+        request.end_headers()
+        request.wfile.write(payload)
+
+    def serve_forever(self):
+        self._server.serve_forever()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name="stub-server", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every response")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="fraction of requests answered with 503")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    server = StubServer(args.host, args.port, args.latency, args.failure_rate)
+    logger.info(f"Stub server listening on {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
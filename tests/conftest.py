@@ -0,0 +1,28 @@
+# conftest.py
+import os
+import sys
+
+import pytest
+
+# The modules live at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from stub_server import StubServer  # noqa: E402
+from weather_service import WeatherService, WeatherCache  # noqa: E402
+
+
+@pytest.fixture
+def stub():
+    """
+    The local stand-in for the weather and geolocation APIs, so no test touches the network.
+    """
+    server = StubServer().start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def weather_service(stub, monkeypatch):
+    monkeypatch.setenv("OPENWEATHER_API_KEY", "test")
+    return WeatherService(cache=WeatherCache(), base_url=stub.url + "/data/2.5/weather",
+                          history_url=stub.url + "/data/3.0/onecall/timemachine")
@@ -0,0 +1,70 @@
+# test_adaptive_frame_rate.py
+"""
+Ticks skipped by the adaptive frame rate: video chunks repeat the last
+frame so they play back in real time, and the sidecar index tells repeated
+frames from captured ones.
+"""
+import cv2
+import numpy as np
+
+from frame_pipeline import FramePipeline
+from frame_timing import IndexedWriter, read_frame_index, INDEX_REPEATED, INDEX_SKIPPED
+from encoders import create_encoder
+from motion import MotionGate
+
+FRAME_SIZE = (64, 48)
+FPS = 10
+
+
+def record(tmp_path, encoder, ticks):
+    """
+    Runs ticks through a pipeline with a motion gate; True captures a frame, False skips the tick.
+    """
+    video = create_encoder(encoder, str(tmp_path / "video_chunk_0"), FPS, FRAME_SIZE)
+    writer = IndexedWriter(video, video.path, FPS, 0)
+    pipeline = FramePipeline(FRAME_SIZE, motion_gate=MotionGate())
+    pipeline.set_writer(writer)
+    pipeline.start()
+    for tick, captured in enumerate(ticks):
+        if captured:
+            buffer = pipeline.acquire_buffer(FRAME_SIZE[0], FRAME_SIZE[1], 3)
+            buffer[...] = tick * 10
+            pipeline.submit_buffer(buffer, "bgr", tick)
+        else:
+            pipeline.mark_skipped(tick)
+        pipeline.flush()
+    pipeline.stop()
+    writer.release()
+    _, records = read_frame_index(writer.index.path)
+    return video.path, records
+
+
+def test_video_chunks_repeat_the_last_frame_on_skipped_ticks(tmp_path):
+    ticks = [True, False, False, True, True, False]
+    path, records = record(tmp_path, "mjpg", ticks)
+
+    capture = cv2.VideoCapture(path)
+    frames = []
+    while True:
+        ok, frame = capture.read()
+        if not ok:
+            break
+        frames.append(round(frame.mean() / 10))  # tick number; MJPG is lossy
+    capture.release()
+
+    # One video frame per tick, so the chunk lasts as long as it was recorded
+    assert len(frames) == len(ticks)
+    assert frames == [0, 0, 0, 3, 4, 4]
+    assert [frame for frame, _, _ in records] == list(range(len(ticks)))
+    assert [timestamp for _, timestamp, _ in records] == list(range(len(ticks)))
+    assert [offset == INDEX_REPEATED for _, _, offset in records] == [not captured for captured in ticks]
+
+
+def test_raw_chunks_only_index_skipped_ticks(tmp_path):
+    ticks = [True, False, True, False]
+    path, records = record(tmp_path, "raw", ticks)
+
+    frames = np.load(path)
+    assert [int(frame.mean()) for frame in frames] == [0, 20]
+    assert [(frame, offset == INDEX_SKIPPED) for frame, _, offset in records] == \
+        [(0, False), (0, True), (1, False), (1, True)]
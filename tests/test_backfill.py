@@ -0,0 +1,95 @@
+# test_backfill.py
+"""
+Weather backfill against the local stub server.
+"""
+import time
+
+from backfill import backfill
+from metadata_store import create_metadata_store
+
+HISTORY_PATH = "/data/3.0/onecall/timemachine"
+BUCKET = 3600
+
+
+def missing_record(record_id, latitude, longitude, when, **fields):
+    return dict({
+        "id": record_id,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(when)),
+        "video_path": f"video_chunk_{record_id}.mp4",
+        "weather_status": "missing",
+        "weather": {"latitude": latitude, "longitude": longitude, "temperature": "N/A", "rain": 0},
+    }, **fields)
+
+
+def bucket_start(hours_ago):
+    # Start of a time bucket well in the past, so its records don't straddle two buckets
+    return (time.time() // BUCKET - hours_ago) * BUCKET
+
+
+def store_with(tmp_path, records):
+    store = create_metadata_store("jsonl", str(tmp_path))
+    store.update_many(records)
+    return store
+
+
+def test_records_in_one_cell_and_bucket_share_a_request(tmp_path, stub, weather_service):
+    start = bucket_start(48)
+    store = store_with(tmp_path, [
+        missing_record("a", 18.52, 73.85, start + 60),
+        missing_record("b", 18.52, 73.85, start + 1200),
+        missing_record("c", 18.52, 73.85, start + 3000),
+        missing_record("other-bucket", 18.52, 73.85, start + BUCKET + 60),
+        missing_record("other-cell", 48.85, 2.35, start + 60),
+    ])
+    stats = backfill(store, weather_service, rate_limit=100, bucket=BUCKET)
+    store.close()
+
+    assert stats == {"groups": 3, "fetched": 3, "failed": 0, "records": 5}
+    assert stub.requests[HISTORY_PATH] == 3
+
+
+def test_only_the_weather_fields_are_patched(tmp_path, stub, weather_service):
+    store = store_with(tmp_path, [missing_record("a", 18.52, 73.85, bucket_start(48) + 60, location_status="live")])
+
+    class LinkingStore:
+        # A thumbnail index is linked while the backfill pass runs
+        def records(self):
+            records = list(store.records())
+            store.patch("a", thumbnails="video_chunk_a.thumbs.json")
+            return iter(records)
+
+        def __getattr__(self, name):
+            return getattr(store, name)
+
+    backfill(LinkingStore(), weather_service, rate_limit=100, bucket=BUCKET)
+    (record,) = store.records()
+    store.close()
+
+    assert record["weather_status"] == "backfilled"
+    assert isinstance(record["weather"]["temperature"], (int, float))
+    assert (record["weather"]["latitude"], record["weather"]["longitude"]) == (18.52, 73.85)
+    assert record["thumbnails"] == "video_chunk_a.thumbs.json"
+    assert record["location_status"] == "live"
+    assert record["video_path"] == "video_chunk_a.mp4"
+
+
+def test_a_second_pass_picks_up_only_the_records_still_missing(tmp_path, stub, weather_service):
+    start = bucket_start(48)
+    store = store_with(tmp_path, [missing_record(str(hour), 18.52, 73.85, start + hour * BUCKET + 60)
+                                  for hour in range(4)])
+
+    # Interrupted after its first request
+    calls = []
+    first = backfill(store, weather_service, concurrency=1, rate_limit=100, bucket=BUCKET,
+                     should_stop=lambda: calls.append(None) or len(calls) > 1)
+    assert first["fetched"] == 1 and first["records"] == 1
+    assert stub.requests[HISTORY_PATH] == 1
+
+    second = backfill(store, weather_service, rate_limit=100, bucket=BUCKET)
+    assert second == {"groups": 3, "fetched": 3, "failed": 0, "records": 3}
+    assert stub.requests[HISTORY_PATH] == 4
+
+    assert all(record["weather_status"] == "backfilled" for record in store.records())
+    assert backfill(store, weather_service, rate_limit=100, bucket=BUCKET)["groups"] == 0
+    assert stub.requests[HISTORY_PATH] == 4
+    store.close()
@@ -0,0 +1,148 @@
+# test_chunk_rollover.py
+"""
+Gapless chunk rollover: every frame submitted to the pipeline lands in
+exactly one chunk, in order, across writer switches.
+"""
+import time
+import threading
+
+from frame_pipeline import FramePipeline
+from frame_sources import FrameSource
+from recorder import Recorder
+
+FRAME_SIZE = (32, 24)
+
+
+class CountingWriter:
+    """
+    Chunk writer that only records the timestamps written to it.
+    """
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.timestamps = []
+        self.released = False
+
+    def write(self, frame, timestamp_ns):
+        assert frame.shape == (FRAME_SIZE[1], FRAME_SIZE[0], 3)
+        if self.delay:
+            time.sleep(self.delay)
+        self.timestamps.append(timestamp_ns)
+
+    def skip(self, timestamp_ns, frame=None):
+        pass
+
+    def release(self):
+        self.released = True
+
+    def discard(self):
+        self.released = True
+
+
+def submit(pipeline, number):
+    buffer = pipeline.acquire_buffer(FRAME_SIZE[0], FRAME_SIZE[1], 3)
+    buffer[...] = number % 256
+    return pipeline.submit_buffer(buffer, "bgr", number)
+
+
+def test_switch_writer_splits_frames_on_exact_boundaries():
+    pipeline = FramePipeline(FRAME_SIZE, capacity=5000)
+    writers = [CountingWriter()]
+    handed_off = []
+    pipeline.set_writer(writers[0])
+    pipeline.start()
+
+    # Chunk k gets the frames submitted between the k-th and (k+1)-th switch
+    boundaries = [0]
+    for number in range(3000):
+        if number and number % 375 == 0:
+            writers.append(CountingWriter())
+            pipeline.switch_writer(writers[-1], handed_off.append)
+            boundaries.append(number)
+        submit(pipeline, number)
+    boundaries.append(3000)
+    pipeline.stop()
+
+    assert pipeline.frames_dropped == 0
+    assert handed_off == writers[:-1]
+    for writer, start, end in zip(writers, boundaries, boundaries[1:]):
+        assert writer.timestamps == list(range(start, end))
+
+
+def test_full_buffer_and_stop_without_drain_lose_no_frame_silently():
+    # A slow writer keeps the small ring buffer full, so frames get dropped
+    pipeline = FramePipeline(FRAME_SIZE, capacity=4)
+    writers = [CountingWriter(delay=0.002)]
+    handed_off = []
+    pipeline.set_writer(writers[0])
+    pipeline.start()
+
+    chunk_of = {}
+    for number in range(400):
+        if number and number % 50 == 0:
+            writers.append(CountingWriter(delay=0.002))
+            pipeline.switch_writer(writers[-1], handed_off.append)
+        chunk_of[number] = len(writers) - 1
+        submit(pipeline, number)
+    pipeline.stop(drain=False)
+
+    written = [timestamp for writer in writers for timestamp in writer.timestamps]
+    assert pipeline.frames_dropped > 0
+    # Every frame is either written exactly once, in order, or counted as dropped
+    assert len(written) == len(set(written))
+    assert written == sorted(written)
+    assert len(written) + pipeline.frames_dropped == pipeline.frames_submitted == 400
+    # ... and a written frame is in the chunk it was submitted to
+    for index, writer in enumerate(writers):
+        assert all(chunk_of[timestamp] == index for timestamp in writer.timestamps)
+    # Writer switches still queued when stopping are not dropped
+    assert handed_off == writers[:-1]
+
+
+class NumberedSource(FrameSource):
+    def __init__(self):
+        self.submitted = []
+
+    def capture(self, pipeline, timestamp_ns):
+        buffer = pipeline.acquire_buffer(FRAME_SIZE[0], FRAME_SIZE[1], 3)
+        buffer[...] = len(self.submitted) % 256
+        pipeline.submit_buffer(buffer, "bgr", timestamp_ns)
+        self.submitted.append(timestamp_ns)
+
+
+class CountingRecorder(Recorder):
+    def __init__(self, *args, **kwargs):
+        self.writers = []
+        self.writers_lock = threading.Lock()
+        super().__init__(*args, **kwargs)
+        self.thumbnailer = None
+
+    def open_chunk(self, fps, start_time):
+        with self.writers_lock:
+            self.writers.append(CountingWriter())
+            path = f"{self.video_directory}/video_chunk_{len(self.writers)}.mp4"
+            return path, self.writers[-1]
+
+
+def test_recorder_rollover_keeps_every_frame(tmp_path, stub, weather_service):
+    source = NumberedSource()
+    # Rollovers are driven by hand below, not by the scheduler
+    recorder = CountingRecorder(source, str(tmp_path), weather_service, fps=50, frame_size=FRAME_SIZE,
+                                chunk_duration=3600)
+    recorder.geolocation_url = stub.url + "/json/"
+    recorder.start_recording()
+    for _ in range(8):
+        time.sleep(0.15)
+        recorder.rollover_chunk(recorder.fps)
+    time.sleep(0.15)
+    recorder.close()
+
+    chunks = [writer.timestamps for writer in recorder.writers]
+    written = [timestamp for chunk in chunks for timestamp in chunk]
+    assert recorder.pipeline.frames_dropped == 0
+    assert written == source.submitted
+    # Eight rollovers make nine chunks with frames, plus the discarded pre-opened one
+    assert all(chunks[:9]) and chunks[9:] == [[]]
+    assert all(writer.released for writer in recorder.writers)
+    # Geolocation went to the stub, not to ip-api.com
+    assert stub.requests["/json/"] >= 1
@@ -0,0 +1,223 @@
+# test_http_client.py
+"""
+HttpClient against an in-process HTTP server whose responses are scripted
+per test.
+"""
+import time
+import socket
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import pytest
+import requests
+
+import http_client
+from http_client import HttpClient, CircuitOpenError
+
+
+class QuietHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        pass  # clients hanging up on the truncated and slow responses
+
+
+class ScriptedServer:
+    """
+    Answers each request with the next entry of script: a status code, or
+    "slow" (200 after a delay) or "truncated" (a chunked body cut short).
+    Once the script is used up every request gets 200.
+    """
+
+    def __init__(self, script=(), delay=0.5):
+        self.script = list(script)
+        self.delay = delay
+        self.paths = []
+        self.connections = set()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # keep-alive
+
+            def do_GET(self):
+                server.paths.append(self.path)
+                server.connections.add(self.client_address)
+                action = server.script.pop(0) if server.script else 200
+                if action == "slow":
+                    time.sleep(server.delay)
+                    action = 200
+                if action == "truncated":
+                    self.send_response(200)
+                    self.send_header("Transfer-Encoding", "chunked")
+                    self.end_headers()
+                    self.wfile.write(b"10\r\nonly part")
+                    self.wfile.flush()
+                    self.close_connection = True
+                    return
+                body = b'{"ok": true}'
+                self.send_response(action)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = QuietHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self._server.server_address[1]}"
+        self.host = f"127.0.0.1:{self._server.server_address[1]}"
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+@pytest.fixture
+def server():
+    server = ScriptedServer()
+    yield server
+    server.close()
+
+
+@pytest.fixture
+def backoffs(monkeypatch):
+    # Records each backoff cap instead of sleeping a random time up to it
+    caps = []
+
+    class Random:
+        @staticmethod
+        def uniform(low, high):
+            caps.append(high)
+            return 0
+
+    monkeypatch.setattr(http_client, "random", Random)
+    return caps
+
+
+def test_requests_reuse_one_keep_alive_connection(server):
+    client = HttpClient()
+    for _ in range(5):
+        assert client.get(server.url + "/data").status_code == 200
+    assert len(server.paths) == 5
+    assert len(server.connections) == 1
+    client.close()
+
+
+def test_read_timeout(server):
+    server.script = ["slow"]
+    client = HttpClient(read_timeout=0.1, max_retries=0)
+    start = time.monotonic()
+    with pytest.raises(requests.exceptions.ReadTimeout):
+        client.get(server.url + "/data")
+    assert time.monotonic() - start < server.delay
+    client.close()
+
+
+def test_connect_timeout():
+    # A listener that never accepts: once its backlog is full, further SYNs go unanswered
+    listener = socket.socket()
+    listener.bind(("127.0.0.1", 0))
+    listener.listen(0)
+    address = listener.getsockname()
+    fillers = []
+    try:
+        for _ in range(4):
+            filler = socket.socket()
+            filler.setblocking(False)
+            filler.connect_ex(address)
+            fillers.append(filler)
+        client = HttpClient(connect_timeout=0.2, max_retries=0)
+        start = time.monotonic()
+        with pytest.raises(requests.exceptions.ConnectTimeout):
+            client.get(f"http://{address[0]}:{address[1]}/data")
+        assert time.monotonic() - start < 2
+        client.close()
+    finally:
+        for filler in fillers:
+            filler.close()
+        listener.close()
+
+
+def test_retries_5xx_and_429_with_exponential_backoff(server, backoffs):
+    server.script = [503, 429, 200]
+    client = HttpClient(max_retries=2, backoff_base=0.5, backoff_max=8)
+    assert client.get(server.url + "/data").status_code == 200
+    assert len(server.paths) == 3
+    assert backoffs == [0.5, 1.0]
+    stats = client.stats()["endpoints"][server.host + "/data"]
+    assert (stats["requests"], stats["errors"], stats["retries"]) == (3, 2, 2)
+    client.close()
+
+
+def test_backoff_is_capped(server, backoffs):
+    server.script = [500] * 5
+    client = HttpClient(max_retries=4, backoff_base=1, backoff_max=3, failure_threshold=10)
+    # Out of retries: the last response is returned, not raised
+    assert client.get(server.url + "/data").status_code == 500
+    assert backoffs == [1, 2, 3, 3]
+    client.close()
+
+
+def test_client_errors_are_not_retried(server):
+    server.script = [404]
+    client = HttpClient(max_retries=2)
+    assert client.get(server.url + "/missing").status_code == 404
+    assert len(server.paths) == 1
+    client.close()
+
+
+def test_breaker_opens_half_opens_and_closes(server, backoffs):
+    server.script = [503, 503]
+    client = HttpClient(max_retries=0, failure_threshold=2, reset_timeout=0.2)
+    breaker = client.breaker(server.host)
+    for _ in range(2):
+        assert client.get(server.url + "/data").status_code == 503
+    assert breaker.state == "open"
+
+    # Open: rejected without reaching the server
+    with pytest.raises(CircuitOpenError):
+        client.get(server.url + "/data")
+    assert len(server.paths) == 2
+    assert client.stats()["endpoints"][server.host + "/data"]["rejected"] == 1
+
+    time.sleep(0.25)
+    assert breaker.state == "half-open"
+    assert client.get(server.url + "/data").status_code == 200
+    assert breaker.state == "closed"
+    assert client.stats()["circuits"][server.host] == "closed"
+    client.close()
+
+
+def test_failed_half_open_trial_reopens_the_circuit(server, backoffs):
+    server.script = [503, 503, "truncated"]
+    client = HttpClient(max_retries=0, failure_threshold=2, reset_timeout=0.2)
+    breaker = client.breaker(server.host)
+    for _ in range(2):
+        client.get(server.url + "/data")
+    time.sleep(0.25)
+
+    # The trial fails mid-body; the circuit must reopen, not stay stuck waiting for the trial
+    with pytest.raises(requests.exceptions.ChunkedEncodingError):
+        client.get(server.url + "/data")
+    assert breaker.state == "open"
+
+    time.sleep(0.25)
+    assert client.get(server.url + "/data").status_code == 200
+    assert breaker.state == "closed"
+    client.close()
+
+
+def test_stats_per_endpoint(server):
+    client = HttpClient()
+    for _ in range(3):
+        client.get(server.url + "/a")
+    client.get(server.url + "/b", params={"q": 1})
+    endpoints = client.stats()["endpoints"]
+    assert endpoints[server.host + "/a"]["requests"] == 3
+    assert endpoints[server.host + "/b"]["requests"] == 1
+    a = endpoints[server.host + "/a"]
+    assert a["errors"] == 0
+    assert 0 < a["p50_latency"] <= a["max_latency"]
+    client.close()
@@ -0,0 +1,269 @@
+# thumbnails.py
+"""
+Thumbnail and signature index for finished chunks, so hours of video can
+be scrubbed and filtered without decoding it.
+
+For every chunk this writes, next to the video:
+    <chunk>.thumbs.jpg    a sprite sheet with one thumbnail every THUMBNAIL_INTERVAL seconds
+    <chunk>.thumbs.json   per thumbnail: timestamp, mean brightness and motion against the previous one
+
+The Recorder builds these in a background process pool as each chunk is
+released and links the .json from the chunk's metadata record
+("thumbnails"). From the command line:
+
+    python thumbnails.py --build AutoVision/videos/*.mp4      # index existing chunks
+    python thumbnails.py --max-brightness 40                  # night segments
+    python thumbnails.py --min-rain 2 --min-motion 10         # moving segments of rainy chunks
+"""
+import os
+import sys
+import json
+import logging
+import argparse
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import cv2
+import numpy as np
+
+from frame_timing import index_path_for, read_frame_index, INDEX_SKIPPED
+
+from config import THUMBNAIL_INTERVAL, THUMBNAIL_SIZE, THUMBNAIL_COLUMNS, THUMBNAIL_WORKERS, METADATA_BACKEND
+
+logger = logging.getLogger(__name__)
+
+
+def thumbnail_paths(video_path):
+    """
+    Returns:
+        tuple: (sprite path, index path) for a chunk.
+    """
+    base = os.path.splitext(video_path)[0]
+    return base + ".thumbs.jpg", base + ".thumbs.json"
+
+
+def _frame_timestamps(video_path):
+    # Frame number -> capture time from the chunk's sidecar index, if it has one
+    try:
+        _, records = read_frame_index(index_path_for(video_path))
+    except (OSError, ValueError):
+        return {}
+    return {frame: timestamp for frame, timestamp, offset in records if offset != INDEX_SKIPPED}
+
+
+def _sampled_frames(video_path, interval):
+    """
+    Yields (frame number, BGR frame) every interval seconds of video.
+    Frames in between are skipped without being converted (grab() only).
+    """
+    if video_path.endswith(".npy"):
+        frames = np.load(video_path, mmap_mode='r')
+        fps = _index_fps(video_path)
+        step = max(1, round(interval * fps))
+        for number in range(0, len(frames), step):
+            yield number, np.ascontiguousarray(frames[number])
+        return
+
+    capture = cv2.VideoCapture(video_path)
+    if not capture.isOpened():
+        raise ValueError(f"Could not open {video_path}")
+    try:
+        step = max(1, round(interval * (capture.get(cv2.CAP_PROP_FPS) or _index_fps(video_path))))
+        number = 0
+        while True:
+            if number % step == 0:
+                ok, frame = capture.read()
+                if not ok:
+                    return
+                yield number, frame
+            elif not capture.grab():
+                return
+            number += 1
+    finally:
+        capture.release()
+
+
+def _index_fps(video_path):
+    try:
+        header, _ = read_frame_index(index_path_for(video_path))
+        return header["fps"]
+    except (OSError, ValueError):
+        return 10
+
+
+def build_thumbnail_index(video_path, interval=THUMBNAIL_INTERVAL, thumb_size=THUMBNAIL_SIZE,
+                          columns=THUMBNAIL_COLUMNS):
+    """
+    Builds the sprite sheet and signature index of one chunk. Runs in a worker process.
+    Returns:
+        str: Path of the .thumbs.json index.
+    """
+    sprite_path, json_path = thumbnail_paths(video_path)
+    timestamps = _frame_timestamps(video_path)
+    width, height = thumb_size
+    thumbnails, segments = [], []
+    previous = None
+    for number, frame in _sampled_frames(video_path, interval):
+        thumbnail = cv2.resize(frame, thumb_size, interpolation=cv2.INTER_AREA)
+        gray = cv2.cvtColor(thumbnail, cv2.COLOR_BGR2GRAY).astype(np.int16)
+        segments.append({
+            "frame": number,
+            "timestamp_ns": timestamps.get(number),
+            "offset_s": len(segments) * interval,
+            "brightness": round(float(gray.mean()), 1),
+            "motion": round(float(np.abs(gray - previous).mean()), 2) if previous is not None else None,
+        })
+        thumbnails.append(thumbnail)
+        previous = gray
+
+    if thumbnails:
+        rows = -(-len(thumbnails) // columns)
+        sprite = np.zeros((rows * height, columns * width, 3), np.uint8)
+        for i, thumbnail in enumerate(thumbnails):
+            row, column = divmod(i, columns)
+            sprite[row * height:(row + 1) * height, column * width:(column + 1) * width] = thumbnail
+        cv2.imwrite(sprite_path, sprite, [cv2.IMWRITE_JPEG_QUALITY, 80])
+
+    index = {
+        "video_path": video_path,
+        "sprite": os.path.basename(sprite_path) if thumbnails else None,
+        "interval": interval,
+        "thumb_size": [width, height],
+        "columns": columns,
+        "segments": segments,
+    }
+    tmp_path = json_path + ".tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(index, f)
+    os.replace(tmp_path, json_path)
+    return json_path
+
+
+def _lower_priority():
+    # Thumbnails must never compete with capture and encoding for the CPU
+    try:
+        os.nice(10)
+    except (AttributeError, OSError):
+        pass
+
+
+class Thumbnailer:
+    """
+    Process pool building thumbnail indexes, so decoding finished chunks
+    doesn't slow down recording. Workers run at lowered priority. If a
+    worker dies (e.g. killed for memory), the pool is replaced on the next
+    submit.
+    """
+
+    def __init__(self, workers=THUMBNAIL_WORKERS):
+        self.workers = workers
+        self.closed = False
+        self._lock = threading.Lock()
+        self._executor = self._create_executor()
+
+    def _create_executor(self):
+        return ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"),
+                                   initializer=_lower_priority)
+
+    def submit(self, video_path):
+        """
+        Returns:
+            concurrent.futures.Future or None: Resolves to the .thumbs.json
+            path; None once the thumbnailer is closed.
+        """
+        with self._lock:
+            if self.closed:
+                return None
+            try:
+                return self._executor.submit(build_thumbnail_index, video_path)
+            except BrokenProcessPool:
+                logger.error("Thumbnail worker pool broke, starting a new one")
+                self._executor.shutdown(wait=False)
+                self._executor = self._create_executor()
+                return self._executor.submit(build_thumbnail_index, video_path)
+
+    def close(self):
+        with self._lock:
+            self.closed = True
+        # Finishes the queued chunks, typically just the last one recorded
+        self._executor.shutdown(wait=True)
+
+
+def find_segments(records, max_brightness=None, min_motion=None, min_rain=None):
+    """
+    Filters the thumbnail segments of the chunks whose metadata records
+    link an index, without touching the videos.
+    Returns:
+        iterator: (video_path, segment) pairs.
+    """
+    seen = set()
+    for record in records:
+        index_path = record.get("thumbnails")
+        if not index_path or index_path in seen:
+            continue
+        if min_rain is not None:
+            rain = (record.get("weather") or {}).get("rain")
+            if not isinstance(rain, (int, float)) or rain < min_rain:
+                continue
+        seen.add(index_path)
+        try:
+            with open(index_path, 'r') as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            continue
+        for segment in index["segments"]:
+            if max_brightness is not None and segment["brightness"] > max_brightness:
+                continue
+            if min_motion is not None and (segment["motion"] is None or segment["motion"] < min_motion):
+                continue
+            yield index["video_path"], segment
+
+
+def main():
+    from metadata_store import create_metadata_store
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--build", nargs="+", metavar="VIDEO", help="build indexes for these chunks")
+    parser.add_argument("--data-dir", default="AutoVision", help="directory holding the metadata store")
+    parser.add_argument("--max-brightness", type=float, help="segments at most this bright (0-255)")
+    parser.add_argument("--min-motion", type=float, help="segments with at least this much motion")
+    parser.add_argument("--min-rain", type=float, help="only chunks recorded with this much rain (mm/h)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    if args.build:
+        thumbnailer = Thumbnailer(os.cpu_count())
+        futures = {thumbnailer.submit(path): path for path in args.build}
+        for future, path in futures.items():
+            try:
+                logger.info(f"Indexed {path}: {future.result()}")
+            except Exception as e:
+                logger.error(f"Could not index {path}: {e}")
+        thumbnailer.close()
+
+        # Link the new indexes from the chunks' metadata records
+        built = {path: thumbnail_paths(path)[1] for path in args.build if os.path.exists(thumbnail_paths(path)[1])}
+        metadata_store = create_metadata_store(METADATA_BACKEND, args.data_dir)
+        try:
+            metadata_store.patch_many({record["id"]: {"thumbnails": built[record["video_path"]]}
+                                       for record in metadata_store.records()
+                                       if record.get("video_path") in built and not record.get("thumbnails")
+                                       and record.get("id")})
+        finally:
+            metadata_store.close()
+        return 0
+
+    metadata_store = create_metadata_store(METADATA_BACKEND, args.data_dir)
+    try:
+        for video_path, segment in find_segments(metadata_store.records(), args.max_brightness,
+                                                 args.min_motion, args.min_rain):
+            print(json.dumps(dict(segment, video_path=video_path)))
+    finally:
+        metadata_store.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,14 +1,129 @@
 # weather_service.py
 import os
+import json
+import time
+import threading
 import requests
+from collections import OrderedDict
 from dotenv import load_dotenv
 from datetime import datetime, timezone
 import logging
 
+from config import (WEATHER_CACHE_TTL, WEATHER_CACHE_PRECISION, WEATHER_CACHE_SIZE, WEATHER_API_URL,
+                    WEATHER_HISTORY_URL)
+from geo_utils import geohash_encode
+from http_client import get_http_client
+from metrics import get_metrics
+
+
+class WeatherCache:
+    """
+    LRU cache of weather responses keyed on the geohash cell of the request.
+
+    Entries expire WEATHER_CACHE_TTL seconds after they were fetched. When
+    persist_path is given the cache is loaded from and written back to that
+    file, so a restart doesn't start cold.
+    """
+
+    def __init__(self, ttl=WEATHER_CACHE_TTL, precision=WEATHER_CACHE_PRECISION,
+                 max_entries=WEATHER_CACHE_SIZE, persist_path=None):
+        self.logger = logging.getLogger(__name__)
+        self.ttl = ttl
+        self.precision = precision
+        self.max_entries = max_entries
+        self.persist_path = persist_path
+
+        self._entries = OrderedDict()  # cell -> (fetched_at, weather)
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+        if persist_path:
+            self._load()
+
+    def key(self, latitude, longitude):
+        return geohash_encode(latitude, longitude, self.precision)
+
+    def get(self, latitude, longitude):
+        """
+        Returns:
+            dict or None: The cached weather for the cell, or None on a miss.
+        """
+        cell = self.key(latitude, longitude)
+        with self._lock:
+            entry = self._entries.get(cell)
+            if entry is None:
+                self.misses += 1
+                return None
+            fetched_at, weather = entry
+            if time.time() - fetched_at > self.ttl:
+                del self._entries[cell]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(cell)
+            self.hits += 1
+            return weather
+
+    def put(self, latitude, longitude, weather):
+        cell = self.key(latitude, longitude)
+        with self._lock:
+            self._entries[cell] = (time.time(), weather)
+            self._entries.move_to_end(cell)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+            if self.persist_path:
+                self._save()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+    def _load(self):
+        try:
+            with open(self.persist_path, 'r') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            self.logger.warning(f"Ignoring unreadable weather cache {self.persist_path}: {e}")
+            return
+        now = time.time()
+        for cell, fetched_at, weather in data[-self.max_entries:]:
+            if now - fetched_at <= self.ttl:
+                self._entries[cell] = (fetched_at, weather)
+        self.logger.debug(f"Loaded {len(self._entries)} cached weather entries")
+
+    def _save(self):
+        data = [[cell, fetched_at, weather] for cell, (fetched_at, weather) in self._entries.items()]
+        tmp_path = self.persist_path + ".tmp"
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(data, f)
+            os.replace(tmp_path, self.persist_path)
+        except OSError as e:
+            self.logger.warning(f"Could not persist weather cache: {e}")
+
+
 class WeatherService:
-    def __init__(self):
+    def __init__(self, cache=None, http_client=None, base_url=WEATHER_API_URL, history_url=WEATHER_HISTORY_URL):
         # Configure logger for this module
         self.logger = logging.getLogger(__name__)
+        self.cache = cache if cache is not None else WeatherCache()
+        self.http = http_client if http_client is not None else get_http_client()
+        self._fetch_time = get_metrics().histogram("weather.fetch_seconds")
+        self._errors = get_metrics().counter("weather.errors")
+        get_metrics().register_collector("weather.cache", self.cache.stats)
         
         # Specify the absolute path to the API.env file
         dotenv_path = os.path.join(os.path.dirname(__file__), 'API.env')
@@ -21,7 +136,8 @@ class WeatherService:
         else:
             self.logger.debug("API key loaded successfully.")
         
-        self.base_url = "https://api.openweathermap.org/data/2.5/weather"
+        self.base_url = base_url
+        self.history_url = history_url
 
     def get_current_weather_by_coords(self, latitude, longitude):
         """
@@ -32,6 +148,11 @@ class WeatherService:
         Returns:
             dict or None: A dictionary containing weather data or None if an error occurs.
         """
+        cached = self.cache.get(latitude, longitude)
+        if cached is not None:
+            self.logger.debug(f"Weather cache hit for ({latitude}, {longitude})")
+            return cached
+
         params = {
             'lat': latitude,
             'lon': longitude,
@@ -39,28 +160,18 @@ class WeatherService:
             'units': 'metric'  # Options: 'standard', 'metric', 'imperial'
         }
         try:
-            response = requests.get(self.base_url, params=params)
+            start = time.perf_counter()
+            response = self.http.get(self.base_url, params=params)
+            self._fetch_time.observe(time.perf_counter() - start)
             response.raise_for_status()  # To raise HTTPError for bad responses (4XX or 5XX)
             data = response.json()
             
-            # Log the complete API response for debugging
-            self.logger.debug(f"Complete API response: {data}")
+            # Log the complete API response for debugging; formatted only if debug logging is on
+            self.logger.debug("Complete API response: %s", data)
 
             # Extracting and formatting sunrise and sunset times
-            sunrise_ts = data.get("sys", {}).get("sunrise")
-            sunset_ts = data.get("sys", {}).get("sunset")
-            
-            if sunrise_ts:
-                sunrise = datetime.fromtimestamp(sunrise_ts, tz=timezone.utc).strftime('%Y-%m-%d %H:%M:%S UTC')
-            else:
-                sunrise = "N/A"
-                self.logger.warning("Sunrise timestamp not found in API response.")
-
-            if sunset_ts:
-                sunset = datetime.fromtimestamp(sunset_ts, tz=timezone.utc).strftime('%Y-%m-%d %H:%M:%S UTC')
-            else:
-                sunset = "N/A"
-                self.logger.warning("Sunset timestamp not found in API response.")
+            sunrise = self._format_utc(data.get("sys", {}).get("sunrise"), "Sunrise")
+            sunset = self._format_utc(data.get("sys", {}).get("sunset"), "Sunset")
             
             weather = {
                 "city": data.get("name"),
@@ -82,10 +193,69 @@ class WeatherService:
                 "snow": data.get("snow", {}).get("1h", 0)   # mm of snow in last 1 hour
             }
 
-            self.logger.debug(f"Extracted weather data: {weather}")
+            self.logger.debug("Extracted weather data: %s", weather)
+            self.cache.put(latitude, longitude, weather)
             return weather
         except requests.exceptions.HTTPError as http_err:
+            self._errors.inc()
             self.logger.error(f"HTTP error occurred: {http_err}")  # e.g., 401 Client Error
         except Exception as err:
+            self._errors.inc()
             self.logger.error(f"An error occurred: {err}")
         return None
+
+    def get_weather_at(self, latitude, longitude, timestamp):
+        """
+        Fetches the historical weather at a past time, for chunks recorded
+        while offline. Uses the One Call "timemachine" endpoint and returns
+        the same fields as get_current_weather_by_coords(), except "city"
+        and the daily min/max temperature, which that endpoint doesn't have.
+        Parameters:
+            timestamp (float): Unix time of the weather to look up.
+        Returns:
+            dict or None: A dictionary containing weather data or None if an error occurs.
+        """
+        params = {
+            'lat': latitude,
+            'lon': longitude,
+            'dt': int(timestamp),
+            'appid': self.api_key,
+            'units': 'metric'
+        }
+        try:
+            response = self.http.get(self.history_url, params=params)
+            response.raise_for_status()
+            data = response.json()
+            point = (data.get("data") or [{}])[0]
+            weather = {
+                "city": None,
+                "temperature": point.get("temp"),
+                "temperature_min": None,
+                "temperature_max": None,
+                "feels_like": point.get("feels_like"),
+                "pressure": point.get("pressure"),
+                "humidity": point.get("humidity"),
+                "visibility": point.get("visibility"),
+                "clouds": point.get("clouds"),
+                "wind_speed": point.get("wind_speed"),
+                "wind_deg": point.get("wind_deg"),
+                "weather_description": (point.get("weather") or [{}])[0].get("description"),
+                "weather_icon": (point.get("weather") or [{}])[0].get("icon"),
+                "sunrise": self._format_utc(point.get("sunrise"), "Sunrise"),
+                "sunset": self._format_utc(point.get("sunset"), "Sunset"),
+                "rain": point.get("rain", {}).get("1h", 0),
+                "snow": point.get("snow", {}).get("1h", 0)
+            }
+            self.logger.debug("Extracted historical weather data: %s", weather)
+            return weather
+        except requests.exceptions.HTTPError as http_err:
+            self.logger.error(f"HTTP error occurred: {http_err}")
+        except Exception as err:
+            self.logger.error(f"An error occurred: {err}")
+        return None
+
+    def _format_utc(self, timestamp, name):
+        if timestamp:
+            return datetime.fromtimestamp(timestamp, tz=timezone.utc).strftime('%Y-%m-%d %H:%M:%S UTC')
+        self.logger.warning(f"{name} timestamp not found in API response.")
+        return "N/A"